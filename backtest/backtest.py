@@ -1,16 +1,28 @@
 from pathlib import Path
 from copy import deepcopy
-from typing import Dict, Union, List
+from typing import Any, Callable, Dict, Union, List, Set, Optional, Tuple
+from datetime import datetime
 import os
 
 from progress.bar import FillingCirclesBar
-import yaml
+import numpy as np
 import pandas as pd
 
 from const import TIMEFRAME_M1, ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_BUY, ORDER_TYPE_BUY_STOP, ORDER_TYPE_SELL, \
-    ORDER_TYPE_SELL_LIMIT, ORDER_TYPE_SELL_STOP
-from tools.market_data import load_data
-from tools.candle import Candle
+    ORDER_TYPE_SELL_LIMIT, ORDER_TYPE_SELL_STOP, NO_TRADE
+from backtest.trade_backtest import TradeBacktest
+from backtest.pending_order_book import PendingOrderBook
+from tools.market_data import add_indicators_to_arrays, add_indicators_to_data
+from tools.candle_store import load_candles
+from tools.resample import resample_all_time_frames
+from tools.candle import Candle, CandleView
+from tools.candle_window import CandleArrays, CandleWindow
+from backtest.time_alignment import build_alignment_index
+from backtest.trade_simulator import resolve_trades, select_signals, balance_after_trades, BROKER_FEE
+from backtest.result_cache import ResultCache
+from backtest.trade_ledger import TRADE_ON_GOING, TRADE_PENDING, TradeLedgerWriter
+from backtest.performance import compute_performance, drawdown, equity_curve
+from tools.profiler import BacktestProfiler
 try:
     from strat.my_bot_strat import (
         bot_strat as bot_strategy,
@@ -18,6 +30,10 @@ try:
     )
 except ImportError:
     from strat.bot_strat import bot_strategy, manage_bot
+try:
+    from strat.my_bot_strat import bot_strat_vectorized as bot_strategy_vectorized
+except ImportError:
+    from strat.bot_strat import bot_strategy_vectorized
 
 __author__ = "Thibault Delrieu"
 __copyright__ = "Copyright 2021, Thibault Delrieu"
@@ -27,10 +43,18 @@ __email__ = "thibault.delrieu.pro@gmail.com"
 __status__ = "Production"
 
 
-def create_backtest():
+def create_backtest(
+    profile: Optional[bool] = None,
+    cprofile_path: Optional[Union[Path, str]] = None,
+    profile_memory: bool = False,
+):
     """
     create your backtest here, you have an example
-    with the bot_strat already implemented
+    with the bot_strat already implemented.
+    With profile, the time spent in each phase of the backtest is printed with
+    the results (and the cProfile stats are dumped in cprofile_path if given,
+    the memory allocated by each phase is measured with profile_memory),
+    without it the profiling set by tools.profiler.enable_profiling is used
     """
 
     # Modify this part
@@ -39,6 +63,7 @@ def create_backtest():
     period_backtest = "January_2021"
     name_strat = "bot_strat_example"
     risk = 0.5
+    # a pickle file or a folder of candles converted with convert_pickle_to_store
     name_file_data = "January_2021.txt"
     initial_account_balance = 100_000
     time_frames = [TIMEFRAME_M1]
@@ -46,6 +71,25 @@ def create_backtest():
     unique_id_backtest = "January_2021"
     delete_previous_pending_trade = False
     strat_auto_manage_trade = False
+    # compute the indicators asked in kwargs (ema_list, bollinger_band, rsi)
+    # once on the whole period instead of on each window given to the strat
+    precompute_indicators = True
+    # give to the strat windows of numpy arrays (CandleWindow) instead of
+    # dataframes, the indicators are then always precomputed
+    array_windows = False
+    # use the vectorized version of your strat (bot_strategy_vectorized): it is
+    # called once with all the candles and return the trades to take on each candle
+    vectorized_strategy = False
+    # only load the M1 candles and build the candles of the other TF from them
+    resample_from_m1 = False
+    # reuse the results of a backtest already launched with the same data,
+    # strategy code and settings (stored in backtest/result_cache)
+    use_result_cache = False
+    # precompute the columns bullish, engulfing, high_rejection, low_rejection
+    # and doji with the indicators (minimum_rejection and body_min in pips)
+    precompute_patterns = False
+    minimum_rejection = None
+    body_min = None
     # here you need to create a dictionary with the name of the
     # parameters in your strat function as key and input as value
     # you don't have to put the parameters inside kwargs if they
@@ -74,6 +118,17 @@ def create_backtest():
         more_than_on_trade_on_going,
         delete_previous_pending_trade,
         strat_auto_manage_trade,
+        precompute_indicators=precompute_indicators,
+        array_windows=array_windows,
+        vectorized_strategy=vectorized_strategy,
+        resample_from_m1=resample_from_m1,
+        use_result_cache=use_result_cache,
+        precompute_patterns=precompute_patterns,
+        minimum_rejection=minimum_rejection,
+        body_min=body_min,
+        profile=profile,
+        cprofile_path=cprofile_path,
+        profile_memory=profile_memory,
         **kwargs,
     )
 
@@ -88,6 +143,50 @@ def create_backtest():
     my_backtest.launch_backtest(path_data)
 
 
+def date_strings(times: np.ndarray) -> List[str]:
+    """
+    dates of the trades (str of pd.Timestamp) for an array of datetime64
+    """
+    return [
+        date.replace("T", " ")
+        for date in np.datetime_as_string(times.astype("datetime64[s]"), unit="s").tolist()
+    ]
+
+
+def closed_trade_columns(
+    trades: Dict[str, np.ndarray]
+) -> Tuple[List[str], Dict[str, list]]:
+    """
+    ids and fields (one list by field of TradeBacktest, in the order of the fields)
+    of the trades closed by Backtest.close_simulated_trades
+    """
+    dates_entry = date_strings(trades["date_entry"])
+    trade_ids = [
+        date_entry + str(order_type)
+        for date_entry, order_type in zip(dates_entry, trades["order_type"].tolist())
+    ]
+    number_trades = len(trade_ids)
+    columns = {
+        "order_type": trades["order_type"].tolist(),
+        "date_entry": dates_entry,
+        "price": trades["price"].tolist(),
+        "rr": trades["rr"].tolist(),
+        "be": np.where(np.isnan(trades["be"]), None, trades["be"]).tolist(),
+        "sl": np.where(trades["sl_to_be"], trades["price"], trades["sl"]).tolist(),
+        "tp": trades["tp"].tolist(),
+        "pending": [False] * number_trades,
+        "on_going": [False] * number_trades,
+        "sl_to_be": trades["sl_to_be"].tolist(),
+        "sl_ratio_modified": [1] * number_trades,
+        "win": trades["win"].tolist(),
+        "comment": [None] * number_trades,
+        "date_trigger": date_strings(trades["date_trigger"]),
+        "date_exit": date_strings(trades["date_exit"]),
+        "profit": trades["profit"].tolist(),
+    }
+    return trade_ids, columns
+
+
 class AccountBacktest:
     """
     regroup info of the backtest account
@@ -118,6 +217,17 @@ class Backtest:
         delete_previous_pending_trade: bool,
         strat_auto_manage_trade: bool,
         candle_existing: int = 100,
+        precompute_indicators: bool = False,
+        array_windows: bool = False,
+        vectorized_strategy: bool = False,
+        resample_from_m1: bool = False,
+        use_result_cache: bool = False,
+        precompute_patterns: bool = False,
+        minimum_rejection: Optional[float] = None,
+        body_min: Optional[float] = None,
+        profile: Optional[bool] = None,
+        cprofile_path: Optional[Union[Path, str]] = None,
+        profile_memory: bool = False,
         **kwargs,
     ):
         self.trade = None
@@ -132,111 +242,382 @@ class Backtest:
         self.max_drawdown_percentage = 0
         self.time_frames = time_frames
         self.info_trade = None
-        self.info_all_trade = {}
+        # only the live trades (pending and on going) are managed at each step,
+        # the closed ones go to an append-only ledger
+        self.trades_pending = PendingOrderBook()
+        self.trades_on_going = {}
+        self.trades_closed = {}
+        # arrays of the trades closed by the vectorized strategy (close_simulated_trades)
+        self.trades_closed_simulated: List[Dict[str, np.ndarray]] = []
+        self.trades_rank = {}
+        # counters of the closed trades, which are not kept in memory when written in a ledger
+        self.number_trades_closed = 0
+        self.number_wins = 0
+        self.ledger: Optional[TradeLedgerWriter] = None
+        # ledger of the last run (or of the results restored from the result cache)
+        self.ledger_file: Optional[Path] = None
+        # trigger, exit, profit and balance after each closing, for the equity curve and the performance
+        self.trade_records = {"date_trigger": [], "date_exit": [], "profit": [], "balance": []}
+        # balance and drawdown at the end of each bar processed, built after the run
+        self.equity_times = np.zeros(0, dtype="datetime64[ns]")
+        self.equity = np.zeros(0)
+        self.drawdown = np.zeros(0)
+        self.drawdown_percentage = np.zeros(0)
+        self.number_trades_created = 0
         self.delete_previous_pending_trade = delete_previous_pending_trade
         self.more_than_on_trade_on_going = more_than_on_trade_on_going
         self.trade_on_going = False
         self.kwargs = kwargs
         self.strat_auto_manage_trade = strat_auto_manage_trade
         self.candle_existing = candle_existing
+        self.precompute_indicators = precompute_indicators
+        self.array_windows = array_windows
+        self.vectorized_strategy = vectorized_strategy
+        self.resample_from_m1 = resample_from_m1
+        # the candle patterns are settings of the engine, not parameters of the strat
+        self.precompute_patterns = precompute_patterns
+        self.minimum_rejection = minimum_rejection
+        self.body_min = body_min
+        self.result_cache = ResultCache() if use_result_cache else None
+        # timings (and memory with profile_memory) of each phase of the run, given with
+        # the results when profile is True (or when enable_profiling was called for a profile None)
+        self.profiler = BacktestProfiler(
+            enabled=profile, cprofile_path=cprofile_path, memory=profile_memory
+        )
+
+    @property
+    def time_frames_loaded(self) -> List[int]:
+        """
+        TF read from the data of the backtest, only M1 if the other TF are built from it
+        """
+        if self.resample_from_m1:
+            return [TIMEFRAME_M1]
+        return self.time_frames
 
-    def launch_backtest(self, path_data: Union[Path, str]) -> (float, float):
+    @property
+    def uses_arrays(self) -> bool:
+        """
+        True if the strategy is given CandleArrays instead of dataframes
+        """
+        return self.array_windows or self.vectorized_strategy
+
+    def launch_backtest(
+        self,
+        path_data: Union[Path, str],
+        date_from: Optional[Union[datetime, str]] = None,
+        date_to: Optional[Union[datetime, str]] = None,
+    ) -> (float, float):
         """
         launch backtest on the period of time and symbol specified
-        Only work for a unique timeframe for now. Work in progress...
+        path_data is a pickle file or a CandleStore folder, the dates select the
+        candles backtested (only this part of a CandleStore is read). The candles
+        of a CandleStore given to the array windows or to the vectorized strategy
+        stay memory maps
+        """
+        self.run_or_restore(
+            path_data,
+            lambda: load_candles(
+                path_data,
+                self.symbol,
+                self.time_frames_loaded,
+                date_from,
+                date_to,
+                as_arrays=self.uses_arrays,
+            ),
+            date_from,
+            date_to,
+        )
+        message = self.create_message()
+        print(message)
+        print(self.profiler.create_message(), end="")
+        self.write_txt(message)
+        print(f"Trades saved in {self.ledger_file}")
+        return self.account.balance, self.max_drawdown_percentage
+
+    def run_or_restore(
+        self,
+        path_data: Union[Path, str],
+        load_data_candles: Callable[[], Dict[int, Dict[str, Union[pd.DataFrame, CandleArrays]]]],
+        date_from: Optional[Union[datetime, str]] = None,
+        date_to: Optional[Union[datetime, str]] = None,
+        show_progress: bool = True,
+    ) -> bool:
+        """
+        run the backtest on the candles given by load_data_candles, or restore its results
+        from the result cache if the same data, strategy code and settings were already
+        backtested (the candles are then not loaded). Return True if the results were restored.
+        In both cases the trades of the run are in the ledger ledger_file
+        """
+        if self.result_cache is None:
+            self.run_with_ledger(load_data_candles, show_progress)
+            return False
+        key = self.result_cache.key(
+            path_data,
+            (bot_strategy, manage_bot, bot_strategy_vectorized, type(self), resolve_trades),
+            {**self.settings(), "date_from": date_from, "date_to": date_to},
+        )
+        results = self.result_cache.get(key)
+        if results is not None:
+            self.restore_results(results)
+            return True
+        self.run_with_ledger(load_data_candles, show_progress)
+        self.result_cache.put(key, self.results())
+        return False
+
+    def run_with_ledger(
+        self,
+        load_data_candles: Callable[[], Dict[int, Dict[str, Union[pd.DataFrame, CandleArrays]]]],
+        show_progress: bool = True,
+    ):
+        """
+        run the backtest while its closed trades are written in a new ledger
+        """
+        self.ledger = TradeLedgerWriter(self.path_ledger())
+        try:
+            self.run_backtest(load_data_candles(), show_progress)
+        finally:
+            self.write_ledger()
+
+    def settings(self) -> Dict[str, Any]:
+        """
+        every setting which changes the results of the backtest
+        """
+        return {
+            "symbol": self.symbol,
+            "risk_percentage": self.risk_percentage,
+            "initial_balance": self.account.initial_balance,
+            "time_frames": self.time_frames,
+            "more_than_on_trade_on_going": self.more_than_on_trade_on_going,
+            "delete_previous_pending_trade": self.delete_previous_pending_trade,
+            "strat_auto_manage_trade": self.strat_auto_manage_trade,
+            "candle_existing": self.candle_existing,
+            "precompute_indicators": self.precompute_indicators,
+            "array_windows": self.array_windows,
+            "vectorized_strategy": self.vectorized_strategy,
+            "resample_from_m1": self.resample_from_m1,
+            "precompute_patterns": self.precompute_patterns,
+            "minimum_rejection": self.minimum_rejection,
+            "body_min": self.body_min,
+            "kwargs": {
+                name: value for name, value in self.kwargs.items() if name != "backtest_data"
+            },
+        }
+
+    def results(self) -> Dict[str, Any]:
+        """
+        state of the account and of the trades at the end of the backtest
+        """
+        return {
+            "balance": self.account.balance,
+            "max_balance_until_now": self.account.max_balance_until_now,
+            "max_drawdown": self.max_drawdown,
+            "max_drawdown_percentage": self.max_drawdown_percentage,
+            # the closed trades are only in the ledger, it is restored with the results
+            "ledger": self.ledger_file.read_bytes(),
+            "trades_on_going": self.trades_on_going,
+            "trades_pending": {
+                trade_id: (trade, rank)
+                for trade_id, trade, rank in self.trades_pending.ranked_items()
+            },
+            "trades_rank": self.trades_rank,
+            "number_trades_created": self.number_trades_created,
+            "number_trades_closed": self.number_trades_closed,
+            "number_wins": self.number_wins,
+            "trade_on_going": self.trade_on_going,
+            "trade_records": self.trade_records,
+            "equity_times": self.equity_times,
+        }
+
+    def restore_results(self, results: Dict[str, Any]):
+        """
+        put back the state given by results, as if the backtest was launched
+        """
+        self.account.balance = results["balance"]
+        self.account.max_balance_until_now = results["max_balance_until_now"]
+        self.max_drawdown = results["max_drawdown"]
+        self.max_drawdown_percentage = results["max_drawdown_percentage"]
+        self.trades_closed = {}
+        self.trades_closed_simulated = []
+        self.trades_on_going = results["trades_on_going"]
+        self.trades_pending = PendingOrderBook()
+        for trade_id, (trade, rank) in results["trades_pending"].items():
+            self.trades_pending.add(trade_id, trade, rank)
+        self.trades_rank = results["trades_rank"]
+        self.number_trades_created = results["number_trades_created"]
+        self.number_trades_closed = results["number_trades_closed"]
+        self.number_wins = results["number_wins"]
+        self.trade_on_going = results["trade_on_going"]
+        self.trade_records = results["trade_records"]
+        self.equity_times = results["equity_times"]
+        self.build_equity_curve()
+        self.ledger_file = self.path_ledger()
+        self.ledger_file.parent.mkdir(parents=True, exist_ok=True)
+        self.ledger_file.write_bytes(results["ledger"])
+
+    def run_backtest(
+        self,
+        data_candles_all_tf: Dict[int, Dict[str, pd.DataFrame]],
+        show_progress: bool = True,
+    ):
         """
-        data_candles_all_tf = load_data(path_data)
+        run the strategy on each step of the candles already loaded
+        ({TF: {symbol: candles}} like the files of data_candles)
+        """
+        self.profiler.start()
+        try:
+            self.process_candles(data_candles_all_tf, show_progress)
+            with self.profiler.phase("equity"):
+                self.build_equity_curve()
+        finally:
+            self.profiler.stop()
+
+    def process_candles(
+        self,
+        data_candles_all_tf: Dict[int, Dict[str, Union[pd.DataFrame, CandleArrays]]],
+        show_progress: bool,
+    ):
+        """
+        prepare the candles of each TF and give them to the strategy step after step.
+        The candles are dataframes or CandleArrays (read from a CandleStore), they
+        are only converted when the mode of the backtest needs the other type
+        """
+        profiler = self.profiler
         data_candles = dict()
         for tf, data_candles_pairs in data_candles_all_tf.items():
             data_candles[tf] = data_candles_pairs[self.symbol]
+            if self.uses_arrays and isinstance(data_candles[tf], pd.DataFrame):
+                data_candles[tf] = CandleArrays.from_dataframe(data_candles[tf])
+            elif not self.uses_arrays and isinstance(data_candles[tf], CandleArrays):
+                data_candles[tf] = data_candles[tf].to_dataframe()
+        if self.resample_from_m1:
+            with profiler.phase("resample"):
+                data_candles = resample_all_time_frames(
+                    data_candles[TIMEFRAME_M1], self.time_frames
+                )
         previous_backtest_candle_existing = self.candle_existing
         data = {}
         interval_time_frame = {}
         for time_frame in self.time_frames:
             data[time_frame] = data_candles[time_frame]
-            interval_time_frame[time_frame] = (
-                data[time_frame]["time"][1] - data[time_frame]["time"][0]
-            )
-        max_iterator_backtest = len(data[self.time_frames[0]].index) - previous_backtest_candle_existing
-        progress_bar = FillingCirclesBar("Processing", max=max_iterator_backtest + 1)
+            if self.precompute_indicators or self.array_windows or self.vectorized_strategy:
+                with profiler.phase("indicators"):
+                    data[time_frame] = self.add_indicators(data[time_frame])
+            time = np.asarray(data[time_frame]["time"])
+            interval_time_frame[time_frame] = pd.Timedelta(time[1] - time[0])
+        # bars given to the strategy, the first one completes the first window
+        self.equity_times = np.asarray(data[self.time_frames[0]]["time"])[
+            previous_backtest_candle_existing - 1:
+        ]
+        if self.vectorized_strategy:
+            self.run_vectorized_strategy(data)
+            return None
+        max_iterator_backtest = len(data[self.time_frames[0]]) - previous_backtest_candle_existing
+        alignment_index = {}
+        for time_frame in self.time_frames[1:]:
+            with profiler.phase("alignment"):
+                alignment_index[time_frame] = build_alignment_index(
+                    data[self.time_frames[0]]["time"],
+                    data[time_frame]["time"],
+                    previous_backtest_candle_existing,
+                    interval_time_frame[time_frame],
+                )
+        if show_progress:
+            progress_bar = FillingCirclesBar("Processing", max=max_iterator_backtest + 1)
         data_step_to_process = {}
-        begin_date_first_tf = None
-        end_date_first_tf = None
+        windows = {}
+        if self.array_windows:
+            # the same windows are given to the strategy at each step, they are only moved
+            for time_frame in self.time_frames:
+                windows[time_frame] = data[time_frame].window()
+                data_step_to_process[f"TF {time_frame}"] = windows[time_frame]
+            columns_first_tf = windows[self.time_frames[0]].candle_arrays.columns
+        else:
+            # the last candle of each step is read from the arrays instead of a pandas row
+            columns_first_tf = CandleArrays.from_dataframe(data[self.time_frames[0]]).columns
+        phase_windows = profiler.phase("windows")
         for step_backtest in range(max_iterator_backtest + 1):
-            for rank, time_frame in enumerate(self.time_frames):
-
-                if rank == 0:
-                    data_step_to_process[f"TF {time_frame}"] = data[time_frame].iloc[
-                        step_backtest: previous_backtest_candle_existing
-                        + step_backtest
-                    ]
-                    begin_date_first_tf = data_step_to_process[f"TF {time_frame}"].iloc[
-                        0
-                    ]["time"]
-                    end_date_first_tf = data_step_to_process[f"TF {time_frame}"].iloc[
-                        -1
-                    ]["time"]
-                else:
-                    find_begin_date = False
-                    find_end_date = False
-                    previous_date = None
-                    begin_line_other_tf = None
-                    end_line_other_tf = None
-                    for iterator, date in enumerate(data[time_frame]["time"]):
-                        if iterator == 0:
-                            previous_date = date
-                        if (
-                            date > begin_date_first_tf - interval_time_frame[time_frame]
-                            and not find_begin_date
-                        ):
-                            find_begin_date = True
-                            minute_first_tf_synchro = int(begin_date_first_tf.minute) + 1
-                            if minute_first_tf_synchro % int(
-                                int(interval_time_frame[time_frame].seconds) / 60
-                            ) == 0:
-                                begin_line_other_tf = date
-                            else:
-                                begin_line_other_tf = previous_date
-                        if (
-                            date > end_date_first_tf - interval_time_frame[time_frame]
-                            and not find_end_date
-                        ):
-                            find_end_date = True
-                            minute_first_tf_synchro = int(end_date_first_tf.minute) + 1
-                            if minute_first_tf_synchro % int(
-                                int(interval_time_frame[time_frame].seconds) / 60
-                            ) == 0:
-                                end_line_other_tf = date
-                            else:
-                                end_line_other_tf = previous_date
-                        previous_date = date
-                    data_step_to_process[f"TF {time_frame}"] = data[time_frame].loc[
-                        (data[time_frame]["time"] >= begin_line_other_tf)
-                        & (data[time_frame]["time"] <= end_line_other_tf)
-                    ]
-
-            self.launch_strategy(data_step_to_process)
-            progress_bar.next()
-
-        progress_bar.finish()
-        message = self.create_message()
-        print(message)
-        self.write_txt(message, self.info_all_trade)
-        return self.account.balance, self.max_drawdown_percentage
+            with phase_windows:
+                for rank, time_frame in enumerate(self.time_frames):
+
+                    if rank == 0:
+                        begin_row = step_backtest
+                        end_row = previous_backtest_candle_existing + step_backtest
+                    else:
+                        begin_rows, end_rows = alignment_index[time_frame]
+                        begin_row = begin_rows[step_backtest]
+                        end_row = end_rows[step_backtest]
+                    if self.array_windows:
+                        windows[time_frame].move(begin_row, end_row)
+                    else:
+                        data_step_to_process[f"TF {time_frame}"] = data[time_frame].iloc[
+                            begin_row:end_row
+                        ]
+
+            self.launch_strategy(
+                data_step_to_process,
+                CandleView(columns_first_tf, previous_backtest_candle_existing + step_backtest - 1),
+            )
+            if show_progress:
+                progress_bar.next()
+
+        if show_progress:
+            progress_bar.finish()
+
+    def add_indicators(
+        self, data_candles: Union[pd.DataFrame, CandleArrays]
+    ) -> Union[pd.DataFrame, CandleArrays]:
+        """
+        compute once on the whole series every indicator asked by the strategy
+        in kwargs (and the candle patterns if precompute_patterns), the windows
+        given to the strategy then already carry them
+        """
+        if isinstance(data_candles, CandleArrays):
+            # the columns of the candles are shared, only the indicators are new arrays
+            return add_indicators_to_arrays(
+                data_candles,
+                self.kwargs.get("ema_list"),
+                self.kwargs.get("bollinger_band", False),
+                self.kwargs.get("rsi", False),
+                self.precompute_patterns,
+                self.minimum_rejection,
+                self.body_min,
+            )
+        return add_indicators_to_data(
+            data_candles.copy(),
+            self.kwargs.get("ema_list"),
+            self.kwargs.get("bollinger_band", False),
+            self.kwargs.get("rsi", False),
+            self.precompute_patterns,
+            self.minimum_rejection,
+            self.body_min,
+        )
+
+    def summary(self) -> Dict[str, int]:
+        """
+        count the trades taken, won and lost during the backtest
+        """
+        number_trades = (
+            self.number_trades_closed + len(self.trades_on_going) + len(self.trades_pending)
+        )
+        win_number = self.number_wins
+        # trades still on going or pending are not won
+        loose_number = number_trades - win_number
+        return {
+            "number_trades": number_trades,
+            "win_number": win_number,
+            "loose_number": loose_number,
+        }
 
     def create_message(self) -> str:
         """
         create a string message with all the info of the backtest
         """
         one_hundred = 100
-        number_trades = len(self.info_all_trade)
-        win_number = 0
-        loose_number = 0
-        for id_trade, trade in self.info_all_trade.items():
-            if trade.win:
-                win_number += 1
-            elif not trade.win:
-                loose_number += 1
+        summary = self.summary()
+        number_trades = summary["number_trades"]
+        win_number = summary["win_number"]
+        loose_number = summary["loose_number"]
+        performance = self.performance()
         if number_trades == 0:
             win_ratio = "Nan"
         else:
@@ -256,14 +637,20 @@ class Backtest:
             f"win/loose ratio: {win_ratio} %\n"
             f"Max drawdown: {self.max_drawdown:.2f}\n"
             f"Max drawdown percentage: {self.max_drawdown_percentage:.2f} %\n"
+            f"Max drawdown duration: {performance['max_drawdown_duration']}\n"
+            f"Sharpe ratio: {performance['sharpe_ratio']:.2f}\n"
+            f"Sortino ratio: {performance['sortino_ratio']:.2f}\n"
+            f"Profit factor: {performance['profit_factor']:.2f}\n"
+            f"Expectancy by trade: {performance['expectancy']:.2f}\n"
+            f"Average holding time: {performance['average_holding_time']}\n"
+            f"Exposure: {performance['exposure'] * one_hundred:.2f} %\n"
             f"\n{'-'*one_hundred}\n\n"
         )
         return message
 
-    def write_txt(self, message: str, all_trade_info: Dict):
+    def write_txt(self, message: str):
         """
         save a txt file with all the info of the backtest
-        save a yaml with all trades infos taken on the period of time of the backtest
         """
         if not os.path.exists(f"backtest/backtest_by_symbol/{self.symbol}"):
             os.makedirs(f"backtest/backtest_by_symbol/{self.symbol}")
@@ -275,50 +662,44 @@ class Backtest:
                 f"backtest/backtest_by_symbol/{self.symbol}/{self.backtest_name}"
             )
 
-        if not os.path.exists(f"backtest/all_trade_backtest/{self.symbol}"):
-            os.makedirs(f"backtest/all_trade_backtest/{self.symbol}")
-
         with open(
             f"backtest/backtest_by_symbol/{self.symbol}/{self.backtest_name}/{self.unique_id_backtest}.txt",
             "a",
         ) as text_file:
             text_file.write(message)
 
-        with open(
-            f"backtest/all_trade_backtest/{self.symbol}/{self.backtest_name}.yaml",
-            "w",
-        ) as yaml_file:
-            yaml.dump(all_trade_info, yaml_file)
+    def path_ledger(self) -> Path:
+        """
+        json lines file of the trades of this run, unique so that runs launched
+        at the same time don't write in the same file
+        """
+        return (
+            Path("backtest")
+            / "all_trade_backtest"
+            / self.symbol
+            / self.backtest_name
+            / f"{self.unique_id_backtest}_{datetime.now():%Y%m%d_%H%M%S_%f}_{os.getpid()}.jsonl"
+        )
 
-    def check_if_trade_is_on_going(self, last_candle: Candle) -> None:
+    def write_ledger(self):
         """
-        check if a trade pending is now on going
+        add to the ledger the trades still in memory (on going, pending, and closed
+        if they were not written during the backtest) and close it in ledger_file
         """
-        order_type = self.trade.order_type
-        if (
-            (
-                order_type == ORDER_TYPE_BUY_LIMIT
-                or order_type == ORDER_TYPE_SELL_STOP
-            )
-            and self.trade.pending
-            and not self.trade.on_going
-        ):
-            if last_candle.low <= self.trade.price:
-                self.trade.on_going = True
-                self.trade.pending = False
-                self.trade_on_going = True
-        elif (
-            (
-                order_type == ORDER_TYPE_SELL_LIMIT
-                or order_type == ORDER_TYPE_BUY_STOP
-            )
-            and self.trade.pending
-            and not self.trade.on_going
-        ):
-            if last_candle.high >= self.trade.price:
-                self.trade.on_going = True
-                self.trade.pending = False
-                self.trade_on_going = True
+        if self.ledger is None:
+            self.ledger = TradeLedgerWriter(self.path_ledger())
+        for trades in self.trades_closed_simulated:
+            self.ledger.append_columns(*closed_trade_columns(trades))
+        self.trades_closed_simulated = []
+        for trade_id, trade in self.trades_closed.items():
+            self.ledger.append(trade_id, trade)
+        for trade_id, trade in self.trades_on_going.items():
+            self.ledger.append(trade_id, trade, TRADE_ON_GOING)
+        for trade_id, trade in self.trades_pending.items():
+            self.ledger.append(trade_id, trade, TRADE_PENDING)
+        self.ledger.close()
+        self.ledger_file = self.ledger.path_ledger
+        self.ledger = None
 
     def check_if_trade_need_closing(self, last_candle: Candle) -> (bool, str):
         """
@@ -364,14 +745,14 @@ class Backtest:
             ) - (
                 self.account.balance
                 * self.risk_percentage
-                * 0.15  # 0.15 simulate the fee of the broker
+                * BROKER_FEE
             )
         elif result_trade == "sl":
             if self.trade.sl_to_be:
                 new_balance = self.account.balance - (
                     self.account.balance
                     * self.risk_percentage
-                    * 0.15  # 0.15 simulate the fee of the broker even if you are at BE
+                    * BROKER_FEE  # the fee of the broker is paid even if you are at BE
                 )
             else:
                 new_balance = (
@@ -381,7 +762,7 @@ class Backtest:
                     - (
                         self.account.balance
                         * self.risk_percentage
-                        * 0.15  # 0.15 simulate the fee of the broker
+                        * BROKER_FEE
                     )
                 )
         return new_balance
@@ -395,6 +776,14 @@ class Backtest:
         else:
             self.trade.win = False
 
+    def update_balance(self, new_balance: float, date_exit: pd.Timestamp) -> None:
+        """
+        apply to the balance the result of the trade closed at date_exit
+        """
+        self.trade.profit = new_balance - self.account.balance
+        self.trade.date_exit = str(date_exit)
+        self.account.balance = new_balance
+
     def check_if_trade_sl_to_be(self, last_candle: Candle) -> None:
         """
         check if the trade SL need to be put at BE
@@ -437,56 +826,424 @@ class Backtest:
                 self.max_drawdown / self.account.max_balance_until_now
             ) * 100
 
+    def build_equity_curve(self):
+        """
+        build the balance at the end of each bar processed and its drawdown
+        from the highest balance before (the balance only changes when a trade is closed)
+        """
+        self.equity = equity_curve(
+            self.equity_times,
+            self.account.initial_balance,
+            self.trade_records["date_exit"],
+            self.trade_records["balance"],
+        )
+        self.drawdown, self.drawdown_percentage = drawdown(self.equity)
+
+    def performance(self) -> Dict[str, Any]:
+        """
+        risk adjusted performance of the backtest (sharpe, sortino, profit factor...),
+        computed from the equity curve and the trades triggered
+        """
+        trades = {name: list(values) for name, values in self.trade_records.items()}
+        for trade in self.trades_on_going.values():
+            trades["date_trigger"].append(trade.date_trigger)
+            trades["date_exit"].append(None)
+            trades["profit"].append(None)
+        return compute_performance(
+            self.equity_times, self.equity, trades, self.account.initial_balance
+        )
+
+    @property
+    def info_all_trade(self) -> Dict[str, TradeBacktest]:
+        """
+        every trade of the backtest: closed (if not written in a ledger), on going and pending
+        """
+        trades_closed_simulated = {}
+        for trades in self.trades_closed_simulated:
+            trade_ids, columns = closed_trade_columns(trades)
+            for trade_id, *values in zip(trade_ids, *columns.values()):
+                trades_closed_simulated[trade_id] = TradeBacktest(**dict(zip(columns, values)))
+        return {
+            **trades_closed_simulated,
+            **self.trades_closed,
+            **self.trades_on_going,
+            **dict(self.trades_pending.items()),
+        }
+
+    def add_trade(self, trade_id: str, trade: TradeBacktest):
+        """
+        add a new trade to the collection matching its state
+        """
+        self.remove_trade(trade_id)
+        if trade.on_going:
+            self.trades_on_going[trade_id] = trade
+        elif trade.pending:
+            self.trades_pending.add(trade_id, trade, self.number_trades_created)
+        else:
+            self.record_closed_trade(trade_id, trade)
+            return None
+        self.trades_rank[trade_id] = self.number_trades_created
+        self.number_trades_created += 1
+
+    def remove_trade(self, trade_id: str):
+        """
+        remove a trade from every collection
+        """
+        self.trades_pending.pop(trade_id)
+        self.trades_on_going.pop(trade_id, None)
+        trade_closed = self.trades_closed.pop(trade_id, None)
+        if trade_closed is not None:
+            self.number_trades_closed -= 1
+            self.number_wins -= bool(trade_closed.win)
+        self.trades_rank.pop(trade_id, None)
+
+    def close_trade(self, trade_id: str):
+        """
+        move a trade which is no longer on going to the ledger of closed trades
+        """
+        self.record_closed_trade(trade_id, self.trades_on_going.pop(trade_id))
+        del self.trades_rank[trade_id]
+
+    def record_closed_trade(self, trade_id: str, trade: TradeBacktest):
+        """
+        count a closed trade and write it in the ledger, or keep it in trades_closed without ledger
+        """
+        self.number_trades_closed += 1
+        if trade.win:
+            self.number_wins += 1
+        self.trade_records["date_trigger"].append(np.datetime64(trade.date_trigger, "ns"))
+        self.trade_records["date_exit"].append(np.datetime64(trade.date_exit, "ns"))
+        self.trade_records["profit"].append(trade.profit)
+        self.trade_records["balance"].append(self.account.balance)
+        if self.ledger is not None:
+            self.ledger.append(trade_id, trade)
+        else:
+            self.trades_closed[trade_id] = trade
+
+    def delete_pending_trades(self):
+        """
+        delete every pending trade
+        """
+        self.trades_pending.clear()
+
+    def trigger_pending_trades(self, last_candle: Candle) -> Set[str]:
+        """
+        move to the on going trades every pending trade triggered by the candle
+        and return their ids
+        """
+        if not self.trades_pending:
+            return set()
+        triggered_trades = self.trades_pending.trigger(last_candle.low, last_candle.high)
+        if not triggered_trades:
+            return set()
+        date_trigger = str(last_candle.date)
+        for trade_id, trade, rank in triggered_trades:
+            trade.on_going = True
+            trade.pending = False
+            trade.date_trigger = date_trigger
+            self.trades_on_going[trade_id] = trade
+            self.trades_rank[trade_id] = rank
+        # on going trades are managed in the order they were taken
+        self.trades_on_going = dict(
+            sorted(
+                self.trades_on_going.items(),
+                key=lambda trade_item: self.trades_rank[trade_item[0]],
+            )
+        )
+        return {trade_id for trade_id, trade, rank in triggered_trades}
+
     def manage_on_going_trades(self, last_candle: Candle):
         """
         manage on going trade --> SL, TP or BE
         """
-        for trade_id, trade in self.info_all_trade.items():
+        triggered_trades = self.trigger_pending_trades(last_candle)
+        for trade_id, trade in list(self.trades_on_going.items()):
             self.trade = trade
-            if not self.trade.on_going and not self.trade.pending:
-                continue
-            if self.trade.pending:
-                self.check_if_trade_is_on_going(last_candle)
-            if not self.trade.on_going:
-                continue
+            if trade_id in triggered_trades:
+                self.trade_on_going = True
             if self.strat_auto_manage_trade:
                 self.trade, trade_closing, result_trade = manage_bot(self.trade, **self.kwargs)
+                self.trades_on_going[trade_id] = self.trade
             else:
                 trade_closing, result_trade = self.check_if_trade_need_closing(last_candle)
             if trade_closing:
                 new_balance = self.manage_balance_after_trade_closing(result_trade)
                 self.check_if_trade_is_win(new_balance)
-                self.account.balance = new_balance
+                self.update_balance(new_balance, last_candle.date)
                 self.trade.on_going = False
                 self.trade_on_going = False
+                self.close_trade(trade_id)
             elif not self.strat_auto_manage_trade:
                 self.check_if_trade_sl_to_be(last_candle)
             self.manage_drawdown()
 
-    def launch_strategy(self, data_step_to_process: dict[str, pd.DataFrame]):
+    def launch_strategy(
+        self,
+        data_step_to_process: dict[str, Union[pd.DataFrame, CandleWindow]],
+        last_candle: Optional[Union[Candle, CandleView]] = None,
+    ):
         """
         launch the strategy and manage result of trades
         """
-        data_tf_1 = data_step_to_process[f"TF {self.time_frames[0]}"]
-        last_candle = Candle(data_tf_1.iloc[-1])
+        if last_candle is None:
+            data_tf_1 = data_step_to_process[f"TF {self.time_frames[0]}"]
+            last_candle = data_tf_1.iloc[-1]
+            if not isinstance(last_candle, CandleView):
+                last_candle = Candle(last_candle)
         self.kwargs["backtest_data"] = data_step_to_process
-        self.manage_on_going_trades(last_candle)
+        with self.profiler.phase("manage_trades"):
+            self.manage_on_going_trades(last_candle)
         if not self.trade_on_going or self.more_than_on_trade_on_going:
-            trade = bot_strategy(**self.kwargs)
+            with self.profiler.phase("strategy"):
+                trade = bot_strategy(**self.kwargs)
         else:
             trade = None
         if trade is not None:
-            if trade.on_going:
-                self.trade_on_going = True
-            if self.delete_previous_pending_trade:
-                self.info_all_trade = dict(
-                    (key, value)
-                    for (key, value) in self.info_all_trade.items()
-                    if not value.pending
-                )
-            info_trade_deep_copy = deepcopy(trade)
-            self.info_all_trade[
-                str(last_candle.date) + str(trade.order_type)
-            ] = info_trade_deep_copy
+            with self.profiler.phase("take_trade"):
+                info_trade_deep_copy = deepcopy(trade)
+                self.take_trade(info_trade_deep_copy, last_candle)
+
+    def take_trade(self, trade: TradeBacktest, last_candle: Candle):
+        """
+        add a trade given by the strategy on the last candle
+        """
+        if trade.on_going:
+            self.trade_on_going = True
+            trade.date_trigger = str(last_candle.date)
+        if self.delete_previous_pending_trade:
+            self.delete_pending_trades()
+        self.add_trade(str(last_candle.date) + str(trade.order_type), trade)
 
+    def run_vectorized_strategy(self, data: Dict[int, CandleArrays]):
+        """
+        call once the vectorized strategy with all the candles of each TF, then
+        simulate the trades of the signals it returns
+        """
+        self.kwargs["backtest_data"] = {
+            f"TF {time_frame}": data[time_frame] for time_frame in self.time_frames
+        }
+        with self.profiler.phase("strategy"):
+            signals = bot_strategy_vectorized(**self.kwargs)
+        columns_first_tf = data[self.time_frames[0]].columns
+        order_types = np.asarray(signals["order_type"])
+        signal_rows = np.flatnonzero(order_types != NO_TRADE)
+        # the strategy is only asked once a full window of candles exists
+        signal_rows = signal_rows[signal_rows >= self.candle_existing - 1]
+        if len(signal_rows) == 0:
+            return None
+        with self.profiler.phase("simulation"):
+            if self.strat_auto_manage_trade or self.delete_previous_pending_trade:
+                # the outcome of a trade depends on the strat or on the next trades
+                self.simulate_signals_candle_by_candle(signals, signal_rows, columns_first_tf)
+            else:
+                self.simulate_signals(signals, signal_rows, columns_first_tf)
+
+    def simulate_signals_candle_by_candle(
+        self,
+        signals: Dict[str, np.ndarray],
+        signal_rows: np.ndarray,
+        columns_first_tf: Dict[str, np.ndarray],
+    ):
+        """
+        take the trades of the signals and manage them candle after candle
+        """
+        number_candles = len(columns_first_tf["time"])
+        row = signal_rows[0]
+        next_signal = 0
+        while row < number_candles:
+            last_candle = CandleView(columns_first_tf, row)
+            self.manage_on_going_trades(last_candle)
+            if next_signal < len(signal_rows) and signal_rows[next_signal] == row:
+                next_signal += 1
+                if not self.trade_on_going or self.more_than_on_trade_on_going:
+                    self.take_trade(
+                        self.trade_from_signal(signals, row, last_candle), last_candle
+                    )
+            if self.trades_on_going or self.trades_pending:
+                row += 1
+            elif next_signal < len(signal_rows):
+                # nothing to manage until the next signal
+                row = signal_rows[next_signal]
+            else:
+                break
 
+    def simulate_signals(
+        self,
+        signals: Dict[str, np.ndarray],
+        signal_rows: np.ndarray,
+        columns_first_tf: Dict[str, np.ndarray],
+    ):
+        """
+        take the trades of the signals with their outcome (trigger, BE, SL or TP)
+        found in bulk by resolve_trades. The signals taken, the balance after each
+        closing and the closed trades are computed on the arrays, only the trades
+        still on going or pending at the end become TradeBacktest
+        """
+        number_candles = len(columns_first_tf["time"])
+        order_types = np.asarray(signals["order_type"])[signal_rows].astype(int)
+        if "price" in signals:
+            prices = np.asarray(signals["price"], dtype=float)[signal_rows]
+        else:
+            prices = np.full(len(signal_rows), np.nan)
+        prices = np.where(np.isnan(prices), columns_first_tf["close"][signal_rows], prices)
+        if "be" in signals:
+            be = np.asarray(signals["be"], dtype=float)[signal_rows]
+        else:
+            be = np.full(len(signal_rows), np.nan)
+        sl = np.asarray(signals["sl"], dtype=float)[signal_rows]
+        tp = np.asarray(signals["tp"], dtype=float)[signal_rows]
+        outcomes = resolve_trades(
+            columns_first_tf["high"],
+            columns_first_tf["low"],
+            columns_first_tf["close"],
+            signal_rows,
+            order_types,
+            prices,
+            sl,
+            tp,
+            be,
+        )
+        market = np.isin(order_types, (ORDER_TYPE_BUY, ORDER_TYPE_SELL))
+        taken, trade_on_going = select_signals(
+            signal_rows,
+            market,
+            outcomes["trigger_row"],
+            outcomes["exit_row"],
+            number_candles,
+            self.more_than_on_trade_on_going,
+        )
+        taken = np.flatnonzero(taken)
+        trades = {
+            "row": signal_rows[taken],
+            "order_type": order_types[taken],
+            "price": prices[taken],
+            "sl": sl[taken],
+            "tp": tp[taken],
+            "be": be[taken],
+            "market": market[taken],
+            "rank": self.number_trades_created + np.arange(len(taken)),
+            **{name: rows[taken] for name, rows in outcomes.items()},
+        }
+        self.number_trades_created += len(taken)
+        trades["rr"] = np.abs(trades["price"] - trades["tp"]) / np.abs(trades["price"] - trades["sl"])
+        trades["trigger_row"] = np.where(trades["market"], trades["row"], trades["trigger_row"])
+        # the BE is only reached on the candles where the trade is not closed
+        trades["sl_to_be"] = trades["be_row"] < trades["exit_row"]
+        closed = np.flatnonzero(trades["exit_row"] < number_candles)
+        # trades closed on the same candle are managed in the order they were taken
+        closing_order = closed[np.lexsort((trades["rank"][closed], trades["exit_row"][closed]))]
+        self.close_simulated_trades(
+            {name: values[closing_order] for name, values in trades.items()},
+            columns_first_tf["time"],
+        )
+        not_closed = np.flatnonzero(trades["exit_row"] == number_candles)
+        self.keep_simulated_trades(
+            {name: values[not_closed] for name, values in trades.items()},
+            signals,
+            columns_first_tf,
+        )
+        self.trade_on_going = trade_on_going
+
+    def close_simulated_trades(self, trades: Dict[str, np.ndarray], times: np.ndarray):
+        """
+        apply the closings of the simulated trades (in closing order) to the balance
+        and the drawdown, and record the trades closed without creating a TradeBacktest
+        """
+        if not len(trades["row"]):
+            return None
+        balances = balance_after_trades(
+            self.account.balance,
+            self.risk_percentage,
+            trades["result"],
+            trades["rr"],
+            trades["sl_to_be"],
+        )
+        profits = np.diff(balances, prepend=self.account.balance)
+        peaks = np.maximum.accumulate(
+            np.concatenate(([self.account.max_balance_until_now], balances))
+        )[1:]
+        drawdown_percentages = ((peaks - balances) / peaks) * 100
+        worst = int(np.argmax(drawdown_percentages))
+        if drawdown_percentages[worst] > self.max_drawdown_percentage:
+            self.max_drawdown = peaks[worst] - balances[worst]
+            self.max_drawdown_percentage = (self.max_drawdown / peaks[worst]) * 100
+        self.account.balance = float(balances[-1])
+        self.account.max_balance_until_now = float(peaks[-1])
+        wins = profits > 0
+        self.number_trades_closed += len(balances)
+        self.number_wins += int(wins.sum())
+        trades = {
+            **trades,
+            "date_entry": times[trades["row"]].astype("datetime64[ns]"),
+            "date_trigger": times[trades["trigger_row"]].astype("datetime64[ns]"),
+            "date_exit": times[trades["exit_row"]].astype("datetime64[ns]"),
+            "win": wins,
+            "profit": profits,
+        }
+        self.trade_records["date_trigger"].extend(trades["date_trigger"])
+        self.trade_records["date_exit"].extend(trades["date_exit"])
+        self.trade_records["profit"].extend(profits.tolist())
+        self.trade_records["balance"].extend(balances.tolist())
+        if self.ledger is not None:
+            self.ledger.append_columns(*closed_trade_columns(trades))
+        else:
+            self.trades_closed_simulated.append(trades)
+
+    def keep_simulated_trades(
+        self,
+        trades: Dict[str, np.ndarray],
+        signals: Dict[str, np.ndarray],
+        columns_first_tf: Dict[str, np.ndarray],
+    ):
+        """
+        create the simulated trades still on going or pending at the end of the backtest,
+        the on going ones in the order they went on (triggers before the trade taken on a candle)
+        """
+        on_going = trades["trigger_row"] < len(columns_first_tf["time"])
+        order = np.lexsort((trades["rank"], trades["market"], trades["trigger_row"]))
+        for index in order.tolist():
+            last_candle = CandleView(columns_first_tf, trades["row"][index])
+            trade = self.trade_from_signal(signals, trades["row"][index], last_candle)
+            trade_id = str(last_candle.date) + str(trade.order_type)
+            rank = int(trades["rank"][index])
+            if not on_going[index]:
+                self.trades_pending.add(trade_id, trade, rank)
+                self.trades_rank[trade_id] = rank
+                continue
+            trade.on_going = True
+            trade.pending = False
+            trade.date_trigger = str(
+                pd.Timestamp(columns_first_tf["time"][trades["trigger_row"][index]])
+            )
+            if trades["sl_to_be"][index]:
+                trade.sl_to_be = True
+                trade.sl = trade.price
+            self.trades_on_going[trade_id] = trade
+            self.trades_rank[trade_id] = rank
+
+    @staticmethod
+    def trade_from_signal(
+        signals: Dict[str, np.ndarray], row: int, last_candle: Candle
+    ) -> TradeBacktest:
+        """
+        create the trade asked by the vectorized strategy on a candle
+        """
+        order_type = int(signals["order_type"][row])
+        price = float(signals["price"][row]) if "price" in signals else np.nan
+        if np.isnan(price):
+            price = float(last_candle.close)
+        sl = float(signals["sl"][row])
+        tp = float(signals["tp"][row])
+        be = float(signals["be"][row]) if "be" in signals else np.nan
+        pending = order_type not in (ORDER_TYPE_BUY, ORDER_TYPE_SELL)
+        return TradeBacktest(
+            order_type=order_type,
+            date_entry=str(last_candle.date),
+            price=price,
+            rr=float(abs(price - tp) / abs(price - sl)),
+            be=None if np.isnan(be) else be,
+            sl=sl,
+            tp=tp,
+            pending=pending,
+            on_going=not pending,
+        )
@@ -0,0 +1,137 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from const import (
+    ORDER_TYPE_BUY_LIMIT,
+    ORDER_TYPE_BUY_STOP,
+    ORDER_TYPE_SELL_LIMIT,
+    ORDER_TYPE_SELL_STOP,
+)
+from backtest.trade_backtest import TradeBacktest
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+
+class PendingOrderBook:
+    """
+    pending trades of the backtest sorted by price, one side by trigger:
+        - low side: BUY_LIMIT and SELL_STOP, triggered when the low of a candle <= price
+        - high side: SELL_LIMIT and BUY_STOP, triggered when the high of a candle >= price
+
+    The prices of the high side are stored negated so, on both sides, the trades
+    triggered by a candle are the end of the sorted list (one bisect and one slice).
+    The sorted price of a trade is kept from its insertion, so a trade is found again
+    in its side even if the strategy changed its price in place
+    """
+
+    def __init__(self):
+        # trade, rank and sorted price at the insertion of each trade id
+        self.trades: Dict[str, Tuple[TradeBacktest, int, float]] = {}
+        self.low_side_prices: List[float] = []
+        self.low_side_ids: List[str] = []
+        self.high_side_prices: List[float] = []
+        self.high_side_ids: List[str] = []
+
+    def add(self, trade_id: str, trade: TradeBacktest, rank: int):
+        """
+        add a pending trade, the rank is the order in which the trade was taken
+        """
+        sorted_price = self.sorted_price(trade)
+        self.trades[trade_id] = (trade, rank, sorted_price)
+        side = self.side(trade.order_type)
+        if side is None:
+            # a pending trade without limit or stop order type is never triggered
+            return None
+        prices, ids = side
+        index = bisect_right(prices, sorted_price)
+        prices.insert(index, sorted_price)
+        ids.insert(index, trade_id)
+
+    def pop(self, trade_id: str) -> Optional[Tuple[TradeBacktest, int]]:
+        """
+        remove the pending trade and return it with its rank (None if not in the book)
+        """
+        trade_info = self.trades.pop(trade_id, None)
+        if trade_info is None:
+            return None
+        trade, rank, sorted_price = trade_info
+        side = self.side(trade.order_type)
+        if side is not None:
+            prices, ids = side
+            index = bisect_left(prices, sorted_price)
+            while ids[index] != trade_id:
+                index += 1
+            del prices[index]
+            del ids[index]
+        return trade, rank
+
+    def trigger(self, low: float, high: float) -> List[Tuple[str, TradeBacktest, int]]:
+        """
+        remove from the book and return every pending trade triggered by a candle
+        """
+        triggered_trades = []
+        for prices, ids, trigger_price in (
+            (self.low_side_prices, self.low_side_ids, low),
+            (self.high_side_prices, self.high_side_ids, -high),
+        ):
+            index = bisect_left(prices, trigger_price)
+            if index == len(prices):
+                continue
+            for trade_id in ids[index:]:
+                trade, rank, sorted_price = self.trades.pop(trade_id)
+                triggered_trades.append((trade_id, trade, rank))
+            del prices[index:]
+            del ids[index:]
+        return triggered_trades
+
+    def clear(self):
+        """
+        delete every pending trade
+        """
+        self.trades.clear()
+        self.low_side_prices.clear()
+        self.low_side_ids.clear()
+        self.high_side_prices.clear()
+        self.high_side_ids.clear()
+
+    def side(self, order_type: int) -> Optional[Tuple[List[float], List[str]]]:
+        """
+        return the sorted prices and ids of the side where the order type is stored
+        """
+        if order_type == ORDER_TYPE_BUY_LIMIT or order_type == ORDER_TYPE_SELL_STOP:
+            return self.low_side_prices, self.low_side_ids
+        if order_type == ORDER_TYPE_SELL_LIMIT or order_type == ORDER_TYPE_BUY_STOP:
+            return self.high_side_prices, self.high_side_ids
+        return None
+
+    @staticmethod
+    def sorted_price(trade: TradeBacktest) -> float:
+        """
+        price used to sort the trade inside its side
+        """
+        if trade.order_type == ORDER_TYPE_SELL_LIMIT or trade.order_type == ORDER_TYPE_BUY_STOP:
+            return -trade.price
+        return trade.price
+
+    def items(self):
+        for trade_id, (trade, rank, sorted_price) in self.trades.items():
+            yield trade_id, trade
+
+    def ranked_items(self):
+        for trade_id, (trade, rank, sorted_price) in self.trades.items():
+            yield trade_id, trade, rank
+
+    def values(self):
+        for trade, rank, sorted_price in self.trades.values():
+            yield trade
+
+    def __contains__(self, trade_id: str) -> bool:
+        return trade_id in self.trades
+
+    def __len__(self) -> int:
+        return len(self.trades)
@@ -0,0 +1,197 @@
+from typing import Any, Dict, Iterable, Mapping, Tuple
+
+import numpy as np
+import pandas as pd
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def to_datetime64(dates: Iterable) -> np.ndarray:
+    """
+    dates (datetime64, str, Timestamp or None) as a datetime64 array, None gives NaT
+    """
+    return np.asarray(dates, dtype="datetime64[ns]")
+
+
+def equity_curve(
+    times: np.ndarray, initial_balance: float, dates_change: Iterable, balances: Iterable
+) -> np.ndarray:
+    """
+    balance at the end of each bar of times, from the balance after each change
+    (the changes must be in the order of their dates, the ones without date are ignored)
+    """
+    dates_change = to_datetime64(dates_change)
+    balances = np.asarray(balances, dtype=float)
+    changed = ~np.isnat(dates_change)
+    change_rows = np.searchsorted(times, dates_change[changed], side="left")
+    # each balance is repeated from the bar of its change until the next change
+    number_bars = np.diff(change_rows, prepend=0, append=len(times))
+    return np.repeat(np.concatenate([[initial_balance], balances[changed]]), number_bars)
+
+
+def drawdown(equity: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    drawdown of each bar from the highest equity before it, in value and in percentage
+    """
+    if not len(equity):
+        return np.zeros(0), np.zeros(0)
+    peak = np.maximum.accumulate(equity)
+    drawdown_value = peak - equity
+    return drawdown_value, drawdown_value / peak * 100
+
+
+def equity_steps(
+    times: np.ndarray, equity: np.ndarray, initial_balance: float, dates_exit: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    dates and values of the equity at the beginning and after each trade closing,
+    the equity doesn't change between them
+    """
+    exit_rows = np.unique(np.searchsorted(times, dates_exit[~np.isnat(dates_exit)]))
+    exit_rows = exit_rows[exit_rows < len(times)]
+    return (
+        np.concatenate([times[:1], times[exit_rows]]),
+        np.concatenate([[initial_balance], equity[exit_rows]]),
+    )
+
+
+def drawdown_duration(
+    step_times: np.ndarray, step_values: np.ndarray, end_time: np.datetime64
+) -> pd.Timedelta:
+    """
+    longest time spent under a previous highest equity, from the steps of the equity
+    """
+    peak = np.maximum.accumulate(step_values)
+    steps = np.arange(len(step_values))
+    last_peak_steps = np.maximum.accumulate(np.where(step_values >= peak, steps, 0))
+    # the equity keeps its value until the next step
+    next_times = np.append(step_times[1:], end_time)
+    durations = np.where(
+        step_values < peak, next_times - step_times[last_peak_steps], np.timedelta64(0, "ns")
+    )
+    return pd.Timedelta(durations.max())
+
+
+def daily_returns(times: np.ndarray, equity: np.ndarray, initial_balance: float) -> np.ndarray:
+    """
+    return of each day with bars, from the equity of the last bar of the day before
+    """
+    days = np.arange(
+        times[0].astype("datetime64[D]"), times[-1].astype("datetime64[D]") + 2
+    ).astype("datetime64[ns]")
+    # last bar of each day, the days without bars give the same bar as the day before
+    last_rows = np.unique(np.searchsorted(times, days[1:], side="left") - 1)
+    daily_equity = np.concatenate([[initial_balance], equity[last_rows]])
+    return np.diff(daily_equity) / daily_equity[:-1]
+
+
+def sharpe_ratio(returns: np.ndarray, periods_per_year: int = TRADING_DAYS_PER_YEAR) -> float:
+    """
+    annualized mean of the returns over their standard deviation (risk free rate of 0)
+    """
+    if len(returns) < 2:
+        return np.nan
+    deviation = returns.std(ddof=1)
+    if deviation == 0:
+        return np.nan
+    return float(returns.mean() / deviation * np.sqrt(periods_per_year))
+
+
+def sortino_ratio(returns: np.ndarray, periods_per_year: int = TRADING_DAYS_PER_YEAR) -> float:
+    """
+    annualized mean of the returns over the deviation of the negative returns only
+    """
+    if len(returns) < 2:
+        return np.nan
+    downside_deviation = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    if downside_deviation == 0:
+        return np.nan
+    return float(returns.mean() / downside_deviation * np.sqrt(periods_per_year))
+
+
+def exposure(times: np.ndarray, dates_trigger: np.ndarray, dates_exit: np.ndarray) -> float:
+    """
+    part of the bars with at least one trade on going, a trade without exit
+    is on going until the end
+    """
+    number_bars = len(times)
+    triggered = ~np.isnat(dates_trigger)
+    entry_rows = np.searchsorted(times, dates_trigger[triggered], side="left")
+    exit_rows = np.searchsorted(times, dates_exit[triggered], side="left")
+    exit_rows[np.isnat(dates_exit[triggered])] = number_bars
+    order = np.argsort(entry_rows, kind="stable")
+    entry_rows = entry_rows[order]
+    exit_rows = exit_rows[order]
+    # bars already covered by the trades entered before, only the bars after are counted
+    covered_until = np.maximum.accumulate(np.concatenate([[0], exit_rows[:-1]]))
+    new_bars = np.maximum(exit_rows - np.maximum(entry_rows, covered_until), 0)
+    return float(new_bars.sum() / number_bars)
+
+
+def trade_statistics(profits: np.ndarray, holding_times: np.ndarray) -> Dict[str, Any]:
+    """
+    profit factor, expectancy and average holding time of the closed trades
+    """
+    gains = profits[profits > 0].sum()
+    losses = -profits[profits < 0].sum()
+    if losses:
+        profit_factor = float(gains / losses)
+    else:
+        profit_factor = np.inf if gains else np.nan
+    return {
+        "profit_factor": profit_factor,
+        "expectancy": float(profits.mean()) if len(profits) else np.nan,
+        "average_holding_time": pd.Timedelta(holding_times.mean())
+        if len(holding_times)
+        else pd.NaT,
+    }
+
+
+def compute_performance(
+    times: np.ndarray,
+    equity: np.ndarray,
+    trades: Mapping[str, Iterable],
+    initial_balance: float,
+) -> Dict[str, Any]:
+    """
+    performance of a backtest from its equity at each bar (equity_curve) and its trades.
+    trades has the columns date_trigger, date_exit and profit, like the ledger of
+    the backtest (read_ledger): the trades without exit are still on going and only
+    count in the exposure, the trades never triggered are ignored.
+
+    The equity only changes when a trade is closed, so only the bars of the closings
+    and the last bar of each day are read: the cost depends on the number of trades
+    and of days, not on the number of bars
+    """
+    dates_trigger = to_datetime64(trades["date_trigger"])
+    dates_exit = to_datetime64(trades["date_exit"])
+    closed = ~np.isnat(dates_exit)
+    profits = np.asarray(trades["profit"], dtype=float)[closed]
+    performance = trade_statistics(profits, dates_exit[closed] - dates_trigger[closed])
+    if not len(times):
+        return {
+            "sharpe_ratio": np.nan,
+            "sortino_ratio": np.nan,
+            **performance,
+            "exposure": 0.0,
+            "max_drawdown_percentage": 0.0,
+            "max_drawdown_duration": pd.Timedelta(0),
+        }
+    returns = daily_returns(times, equity, initial_balance)
+    step_times, step_values = equity_steps(times, equity, initial_balance, dates_exit)
+    peak = np.maximum.accumulate(step_values)
+    return {
+        "sharpe_ratio": sharpe_ratio(returns),
+        "sortino_ratio": sortino_ratio(returns),
+        **performance,
+        "exposure": exposure(times, dates_trigger, dates_exit),
+        "max_drawdown_percentage": float(((peak - step_values) / peak).max() * 100),
+        "max_drawdown_duration": drawdown_duration(step_times, step_values, times[-1]),
+    }
@@ -0,0 +1,227 @@
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+import ast
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import pickle as pck
+import sys
+import tempfile
+import time
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+PATH_RESULT_CACHE = Path("backtest") / "result_cache"
+RESULT_SUFFIX = ".pkl"
+CHUNK_SIZE = 1 << 20
+# folder of the project, only its modules are hashed with the code (not numpy, pandas...)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# digests of the data already hashed by this process, by (path, size, modification time)
+DATA_DIGESTS: Dict[Tuple[str, int, int], str] = {}
+# modules imported by the source files already read by this process, by (path, modification time)
+IMPORTED_MODULES: Dict[Tuple[str, int], Set[str]] = {}
+
+
+def data_digest(path_data: Union[Path, str]) -> str:
+    """
+    sha256 of the content of a pickle file, or of every file of a CandleStore folder
+    """
+    path_data = Path(path_data)
+    if path_data.is_dir():
+        paths = sorted(path for path in path_data.rglob("*") if path.is_file())
+    else:
+        paths = [path_data]
+    sha = hashlib.sha256()
+    for path in paths:
+        stat = path.stat()
+        key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+        if key not in DATA_DIGESTS:
+            file_sha = hashlib.sha256()
+            with open(path, "rb") as data_file:
+                for chunk in iter(lambda: data_file.read(CHUNK_SIZE), b""):
+                    file_sha.update(chunk)
+            DATA_DIGESTS[key] = file_sha.hexdigest()
+        if path_data.is_dir():
+            sha.update(path.relative_to(path_data).as_posix().encode())
+        sha.update(DATA_DIGESTS[key].encode())
+    return sha.hexdigest()
+
+
+def project_source(module_name: str) -> Optional[Path]:
+    """
+    source file of a module of the project, None for the other modules (numpy, pandas...)
+    """
+    module = sys.modules.get(module_name)
+    parent_name, _, name = module_name.rpartition(".")
+    if module is not None:
+        path = getattr(module, "__file__", None)
+    elif parent_name in sys.modules and hasattr(sys.modules[parent_name], name):
+        # a function, a class or a constant imported from a module
+        return None
+    else:
+        try:
+            spec = importlib.util.find_spec(module_name)
+        except (ImportError, ValueError):
+            return None
+        path = None if spec is None else spec.origin
+    if path is None or not path.endswith(".py"):
+        return None
+    path = Path(path).resolve()
+    return path if PROJECT_ROOT in path.parents else None
+
+
+def imported_module_names(path: Path) -> Set[str]:
+    """
+    names of the modules imported by a source file, with the names imported
+    from them in case they are modules too (from tools import candle)
+    """
+    key = (str(path), path.stat().st_mtime_ns)
+    if key not in IMPORTED_MODULES:
+        module_names = set()
+        for node in ast.walk(ast.parse(path.read_bytes())):
+            if isinstance(node, ast.Import):
+                module_names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                module_names.add(node.module)
+                module_names.update(f"{node.module}.{alias.name}" for alias in node.names)
+        IMPORTED_MODULES[key] = module_names
+    return IMPORTED_MODULES[key]
+
+
+def project_sources(functions: Iterable[Callable]) -> List[Path]:
+    """
+    source files of the modules defining the functions and of every module of
+    the project they import, directly or through other modules
+    (tools.indicators, tools.resample, backtest.pending_order_book, const...)
+    """
+    paths_to_read = [Path(inspect.getsourcefile(function)).resolve() for function in functions]
+    sources = set()
+    while paths_to_read:
+        path = paths_to_read.pop()
+        if path in sources:
+            continue
+        sources.add(path)
+        for module_name in imported_module_names(path):
+            imported_path = project_source(module_name)
+            if imported_path is not None:
+                paths_to_read.append(imported_path)
+    return sorted(sources)
+
+
+def code_digest(functions: Iterable[Callable]) -> str:
+    """
+    sha256 of the source files of the strategy and of the engine, with every
+    module of the project they import
+    """
+    sha = hashlib.sha256()
+    for path in project_sources(functions):
+        sha.update(path.relative_to(PROJECT_ROOT).as_posix().encode())
+        sha.update(path.read_bytes())
+    return sha.hexdigest()
+
+
+def normalize(settings: Dict[str, Any]) -> str:
+    """
+    settings as a json string with sorted keys, so the same settings always give the same string
+    """
+    return json.dumps(settings, sort_keys=True, default=repr)
+
+
+class ResultCache:
+    """
+    results of the backtests already launched, stored in one file by key in root.
+    The key is the hash of the data, of the code of the strategy and of the engine
+    (with every module of the project they import) and of the settings of the
+    backtest, so a result is never reused after one of them changed.
+
+    The files are written in a temporary file then renamed, so the workers of a sweep
+    can read and write the cache at the same time. The results older than max_age_days
+    are removed, then the least recently used ones while the cache is bigger than max_size_mb
+    """
+
+    def __init__(
+        self,
+        root: Union[Path, str] = PATH_RESULT_CACHE,
+        max_size_mb: float = 500,
+        max_age_days: float = 30,
+    ):
+        self.root = Path(root)
+        self.max_size = max_size_mb * 1024 ** 2
+        self.max_age = max_age_days * 24 * 3600
+
+    @staticmethod
+    def key(
+        path_data: Union[Path, str], functions: Iterable[Callable], settings: Dict[str, Any]
+    ) -> str:
+        sha = hashlib.sha256()
+        sha.update(data_digest(path_data).encode())
+        sha.update(code_digest(functions).encode())
+        sha.update(normalize(settings).encode())
+        return sha.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}{RESULT_SUFFIX}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        results stored for the key, None if not in the cache
+        """
+        path_result = self.path(key)
+        try:
+            with open(path_result, "rb") as result_file:
+                results = pck.load(result_file)
+            # the last use is kept in the modification time for the eviction
+            os.utime(path_result)
+        except (OSError, EOFError, pck.UnpicklingError):
+            return None
+        return results
+
+    def put(self, key: str, results: Dict[str, Any]):
+        """
+        store the results of the key and evict the old results
+        """
+        path_result = self.path(key)
+        path_result.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor, path_temporary = tempfile.mkstemp(
+            dir=path_result.parent, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as result_file:
+                pck.dump(results, result_file)
+            os.replace(path_temporary, path_result)
+        except BaseException:
+            os.remove(path_temporary)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        remove the results too old, then the least recently used while the cache is too big
+        """
+        now = time.time()
+        entries = []
+        for path_result in self.root.glob(f"*/*{RESULT_SUFFIX}"):
+            try:
+                stat = path_result.stat()
+            except FileNotFoundError:
+                # removed by another worker
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path_result))
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        for modification_time, size, path_result in entries:
+            if now - modification_time <= self.max_age and total_size <= self.max_size:
+                break
+            try:
+                path_result.unlink()
+            except OSError:
+                continue
+            total_size -= size
@@ -0,0 +1,223 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+import os
+
+import pandas as pd
+from progress.bar import FillingCirclesBar
+
+from const import TIMEFRAME_M1
+from backtest.backtest import Backtest
+from tools.candle_store import load_candles
+from tools.candle_window import CandleArrays
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+# candles loaded once by each worker of the sweep, when a backtest is not in the result cache
+WORKER_DATA_CANDLES = None
+WORKER_DATA_ARGS = None
+
+
+def create_sweep(max_workers: Optional[int] = None):
+    """
+    create your parameter sweep here, it works like create_backtest
+    but launch one backtest for each combination of parameters
+    """
+
+    # Modify this part
+    ##############################################################
+    symbol_backtest = "EURUSD"
+    period_backtest = "January_2021"
+    name_strat = "bot_strat_example"
+    name_file_data = "January_2021.txt"
+    initial_account_balance = 100_000
+    time_frames = [TIMEFRAME_M1]
+    more_than_on_trade_on_going = False
+    unique_id_sweep = "January_2021"
+    delete_previous_pending_trade = False
+    strat_auto_manage_trade = False
+    # kwargs given to every backtest, like in create_backtest
+    kwargs = {
+        "symbol": "EURUSD",
+        "risk": 0.5,
+        "tf_list": time_frames,
+    }
+    # every value to try for the parameters of your strat, one backtest is
+    # launched for each combination. If risk is in the grid, it is also
+    # the risk used by the backtest account
+    param_grid = {
+        "risk": [0.5, 1],
+        "ema_list": [[25, 50], [10, 50], [50, 100]],
+    }
+
+    # Normally you don't have to modify this part
+    ##############################################################
+    backtest_settings = {
+        "symbol_backtest": symbol_backtest,
+        "period_backtest": period_backtest,
+        "backtest_name": name_strat,
+        "unique_id_backtest": unique_id_sweep,
+        "risk_backtest": kwargs["risk"],
+        "initial_account_balance": initial_account_balance,
+        "time_frames": time_frames,
+        "more_than_on_trade_on_going": more_than_on_trade_on_going,
+        "delete_previous_pending_trade": delete_previous_pending_trade,
+        "strat_auto_manage_trade": strat_auto_manage_trade,
+        "precompute_indicators": True,
+        "array_windows": True,
+        "resample_from_m1": False,
+        "precompute_patterns": False,
+        # the backtests already launched with the same data, code and settings are not launched again
+        "use_result_cache": False,
+    }
+    # column used to rank the backtests: final_balance, sharpe_ratio, sortino_ratio,
+    # profit_factor, expectancy, max_drawdown_percentage...
+    sort_by = "final_balance"
+    all_kwargs = [
+        {**kwargs, **grid_kwargs} for grid_kwargs in expand_param_grid(param_grid)
+    ]
+
+    absolute_path_launch = Path.cwd()
+    path_data = (
+        absolute_path_launch
+        / "backtest"
+        / "data_candles"
+        / symbol_backtest
+        / name_file_data
+    )
+    results = run_sweep(path_data, backtest_settings, all_kwargs, max_workers, sort_by)
+    print(results.to_string())
+    write_sweep_results(results, symbol_backtest, name_strat, unique_id_sweep)
+
+
+def expand_param_grid(param_grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    return every combination of the parameters of the grid
+    {"a": [1, 2], "b": [3]} --> [{"a": 1, "b": 3}, {"a": 2, "b": 3}]
+    """
+    names = list(param_grid.keys())
+    return [
+        dict(zip(names, values)) for values in product(*param_grid.values())
+    ]
+
+
+def init_sweep_worker(
+    path_data: Union[Path, str], symbol: str, time_frames: List[int], as_arrays: bool = False
+):
+    """
+    keep where the candles of the worker are, they are loaded by the first backtest which needs them
+    (as views over the memory maps of a CandleStore with as_arrays, shared by the workers)
+    """
+    global WORKER_DATA_ARGS
+    WORKER_DATA_ARGS = (path_data, symbol, time_frames, None, None, as_arrays)
+
+
+def worker_data_candles() -> Dict[int, Dict[str, Union[pd.DataFrame, CandleArrays]]]:
+    """
+    load the candles once for every backtest launched by this worker
+    """
+    global WORKER_DATA_CANDLES
+    if WORKER_DATA_CANDLES is None:
+        WORKER_DATA_CANDLES = load_candles(*WORKER_DATA_ARGS)
+    return WORKER_DATA_CANDLES
+
+
+def run_sweep_backtest(
+    backtest_settings: Dict[str, Any], kwargs: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    launch one backtest of the sweep inside a worker and return its results
+    """
+    settings = dict(backtest_settings)
+    if "risk" in kwargs:
+        settings["risk_backtest"] = kwargs["risk"]
+    backtest = Backtest(**settings, **kwargs)
+    backtest.run_or_restore(WORKER_DATA_ARGS[0], worker_data_candles, show_progress=False)
+    summary = backtest.summary()
+    performance = backtest.performance()
+    result = {
+        name: value if isinstance(value, (int, float, str, bool)) else str(value)
+        for name, value in kwargs.items()
+    }
+    result.update(
+        {
+            "final_balance": backtest.account.balance,
+            "max_drawdown": backtest.max_drawdown,
+            "max_drawdown_percentage": backtest.max_drawdown_percentage,
+            "number_trades": summary["number_trades"],
+            "number_wins": summary["win_number"],
+            "number_looses": summary["loose_number"],
+            "sharpe_ratio": performance["sharpe_ratio"],
+            "sortino_ratio": performance["sortino_ratio"],
+            "profit_factor": performance["profit_factor"],
+            "expectancy": performance["expectancy"],
+            "average_holding_time": performance["average_holding_time"],
+            "exposure": performance["exposure"],
+            "max_drawdown_duration": performance["max_drawdown_duration"],
+            "ledger_file": str(backtest.ledger_file),
+        }
+    )
+    return result
+
+
+def run_sweep(
+    path_data: Union[Path, str],
+    backtest_settings: Dict[str, Any],
+    all_kwargs: List[Dict[str, Any]],
+    max_workers: Optional[int] = None,
+    sort_by: str = "final_balance",
+) -> pd.DataFrame:
+    """
+    launch one backtest for each kwargs over a pool of processes
+    and regroup the results in one table sorted by sort_by (the best first,
+    the lowest for the drawdowns)
+    """
+    results = []
+    progress_bar = FillingCirclesBar("Sweep", max=len(all_kwargs))
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_sweep_worker,
+        initargs=(
+            path_data,
+            backtest_settings["symbol_backtest"],
+            # only M1 is loaded when the other TF are built from it
+            [TIMEFRAME_M1]
+            if backtest_settings.get("resample_from_m1")
+            else backtest_settings["time_frames"],
+            bool(
+                backtest_settings.get("array_windows")
+                or backtest_settings.get("vectorized_strategy")
+            ),
+        ),
+    ) as executor:
+        futures = [
+            executor.submit(run_sweep_backtest, backtest_settings, kwargs)
+            for kwargs in all_kwargs
+        ]
+        for future in as_completed(futures):
+            results.append(future.result())
+            progress_bar.next()
+    progress_bar.finish()
+    return (
+        pd.DataFrame(results)
+        .sort_values(sort_by, ascending=sort_by.startswith("max_drawdown"))
+        .reset_index(drop=True)
+    )
+
+
+def write_sweep_results(
+    results: pd.DataFrame, symbol: str, name_strat: str, unique_id_sweep: str
+):
+    """
+    save the table of results of the sweep in a csv file
+    """
+    path_results = f"backtest/sweep_results/{symbol}/{name_strat}"
+    if not os.path.exists(path_results):
+        os.makedirs(path_results)
+    results.to_csv(f"{path_results}/{unique_id_sweep}.csv", index=False)
@@ -0,0 +1,63 @@
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+
+def build_alignment_index(
+    time_first_tf: Union[pd.Series, np.ndarray],
+    time_other_tf: Union[pd.Series, np.ndarray],
+    candle_existing: int,
+    interval_other_tf: pd.Timedelta,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    compute once, for every step of the backtest, the rows of another TF
+    synchronised with the window of the first TF. Return the begin rows and
+    the end rows (excluded) so a step only needs an iloc[begin:end].
+
+    A date of the first TF is synchronised with the first candle of the other TF
+    opened after (date - interval of the other TF) if the candle of the first TF
+    closes the candle of the other TF, else with the candle just before it
+    """
+    dates_first_tf = np.asarray(time_first_tf)
+    dates_other_tf = np.asarray(time_other_tf)
+    number_steps = len(dates_first_tf) - candle_existing + 1
+    begin_dates = dates_first_tf[:number_steps]
+    end_dates = dates_first_tf[candle_existing - 1: candle_existing - 1 + number_steps]
+    minutes_other_tf = int(interval_other_tf.total_seconds() / 60)
+    interval = interval_other_tf.to_timedelta64()
+
+    begin_rows = synchronised_rows(
+        begin_dates, dates_other_tf, interval, minutes_other_tf
+    )
+    end_rows = synchronised_rows(end_dates, dates_other_tf, interval, minutes_other_tf)
+    # no candle of the other TF after the date: keep the window empty for the
+    # begin and stop at the last candle available for the end
+    number_candles_other_tf = len(dates_other_tf)
+    begin_rows = np.minimum(begin_rows, number_candles_other_tf)
+    end_rows = np.minimum(end_rows, number_candles_other_tf - 1) + 1
+    return begin_rows, end_rows
+
+
+def synchronised_rows(
+    dates: np.ndarray,
+    dates_other_tf: np.ndarray,
+    interval: np.timedelta64,
+    minutes_other_tf: int,
+) -> np.ndarray:
+    """
+    return for each date the row of the other TF synchronised with it
+    """
+    first_row_after = np.searchsorted(dates_other_tf, dates - interval, side="right")
+    minute_first_tf_synchro = pd.DatetimeIndex(dates).minute.to_numpy() + 1
+    close_other_tf_candle = minute_first_tf_synchro % minutes_other_tf == 0
+    return np.where(
+        close_other_tf_candle, first_row_after, np.maximum(first_row_after - 1, 0)
+    )
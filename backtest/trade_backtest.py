@@ -17,3 +17,6 @@ class TradeBacktest(BaseModel):
     sl_ratio_modified: int = 1
     win: Optional[bool] = None
     comment: Optional[str] = None
+    date_trigger: Optional[str] = None
+    date_exit: Optional[str] = None
+    profit: Optional[float] = None
@@ -0,0 +1,133 @@
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+from itertools import repeat
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+import json
+
+import pandas as pd
+
+from backtest.trade_backtest import TradeBacktest
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+TRADE_CLOSED = "closed"
+TRADE_ON_GOING = "on_going"
+TRADE_PENDING = "pending"
+
+
+class TradeLedgerWriter:
+    """
+    write the trades of a backtest in a json lines file (one trade by line) while
+    the backtest runs, instead of keeping every trade until the end.
+
+    The trades are sent by batches of batch_size to a background thread which
+    serializes and writes them. At most max_batches batches wait for the thread,
+    so the memory stays flat even if the disk is slower than the backtest
+    """
+
+    def __init__(
+        self, path_ledger: Union[Path, str], batch_size: int = 1_000, max_batches: int = 16
+    ):
+        self.path_ledger = Path(path_ledger)
+        self.path_ledger.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        # (id, state, trade) or a row ready to be written
+        self.batch: List[Union[Tuple[str, str, TradeBacktest], Dict[str, Any]]] = []
+        self.queue: Queue = Queue(maxsize=max_batches)
+        self.number_trades = 0
+        self.error: Optional[BaseException] = None
+        self.thread = Thread(target=self.write_batches, name="trade_ledger", daemon=True)
+        self.thread.start()
+
+    def append(self, trade_id: str, trade: TradeBacktest, state: str = TRADE_CLOSED):
+        """
+        add a trade to the ledger, the trade must not be modified afterwards
+        """
+        self.batch.append((trade_id, state, trade))
+        self.number_trades += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def append_columns(
+        self, trade_ids: List[str], columns: Dict[str, list], state: str = TRADE_CLOSED
+    ):
+        """
+        add trades given as columns (trade_rows) without creating a TradeBacktest for each of them
+        """
+        for row in trade_rows(trade_ids, columns, state):
+            self.batch.append(row)
+            self.number_trades += 1
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        send the current batch to the writing thread
+        """
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def write_batches(self):
+        try:
+            with open(self.path_ledger, "w", encoding="utf-8") as ledger_file:
+                while True:
+                    batch = self.queue.get()
+                    if batch is None:
+                        break
+                    ledger_file.write(
+                        "".join(
+                            json.dumps(
+                                trade if isinstance(trade, dict)
+                                else {"id": trade[0], "state": trade[1], **trade[2].dict()}
+                            ) + "\n"
+                            for trade in batch
+                        )
+                    )
+        except BaseException as error:
+            self.error = error
+            # the batches still sent are consumed so append never blocks
+            while self.queue.get() is not None:
+                pass
+
+    def close(self):
+        """
+        write the last batch and wait for the end of the writing
+        """
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def trade_rows(
+    trade_ids: List[str], columns: Dict[str, list], state: str = TRADE_CLOSED
+) -> Iterator[Dict[str, Any]]:
+    """
+    rows of the ledger of trades given as columns: one list of python values by
+    field of TradeBacktest, in the order of the fields
+    """
+    names = ["id", "state", *columns]
+    for values in zip(trade_ids, repeat(state), *columns.values()):
+        yield dict(zip(names, values))
+
+
+def read_ledger(path_ledger: Union[Path, str]) -> pd.DataFrame:
+    """
+    read a ledger written by TradeLedgerWriter, one row by trade
+    """
+    return pd.read_json(path_ledger, lines=True, dtype={"id": str, "date_entry": str})
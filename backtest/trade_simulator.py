@@ -0,0 +1,254 @@
+from heapq import heappop, heappush
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from const import (
+    ORDER_TYPE_BUY,
+    ORDER_TYPE_BUY_LIMIT,
+    ORDER_TYPE_BUY_STOP,
+    ORDER_TYPE_SELL,
+    ORDER_TYPE_SELL_LIMIT,
+    ORDER_TYPE_SELL_STOP,
+)
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+RESULT_ON_GOING = 0
+RESULT_SL = 1
+RESULT_TP = 2
+RESULT_NAMES = {RESULT_SL: "sl", RESULT_TP: "tp"}
+
+# maximum number of candles compared at once by first_hit (trades x candles)
+MAX_CANDLES_COMPARED = 4_000_000
+# fee of the broker taken on each closed trade, as a part of the risk of the trade
+BROKER_FEE = 0.15
+
+
+# values of the candles, level of each trade, comparison(values[row], level) True on a hit
+HitCondition = Tuple[np.ndarray, np.ndarray, Callable[[np.ndarray, np.ndarray], np.ndarray]]
+
+
+def first_hit(
+    conditions: List[HitCondition],
+    start_rows: np.ndarray,
+    end_rows: Optional[np.ndarray] = None,
+    horizon: int = 64,
+) -> np.ndarray:
+    """
+    for each trade, return the first row in [start_row, end_row) where one of the
+    conditions is True, len(values) if it never happens (end_row is len(values) by default).
+
+    Every trade still searching is compared at once on the next candles of its
+    own window, and the window doubles at each round for the trades not found
+    """
+    number_candles = len(conditions[0][0])
+    hit_rows = np.full(len(start_rows), number_candles, dtype=np.int64)
+    if end_rows is None:
+        end_rows = np.full(len(start_rows), number_candles, dtype=np.int64)
+    searching = np.flatnonzero(start_rows < end_rows)
+    begin_rows = start_rows.astype(np.int64)
+    while searching.size:
+        horizon = max(1, min(horizon, MAX_CANDLES_COMPARED // searching.size))
+        rows = begin_rows[searching, None] + np.arange(horizon)
+        in_data = rows < end_rows[searching, None]
+        rows_in_data = np.minimum(rows, number_candles - 1)
+        hit = np.zeros(rows.shape, dtype=bool)
+        for values, levels, comparison in conditions:
+            hit |= comparison(values[rows_in_data], levels[searching, None])
+        hit &= in_data
+        found = hit.any(axis=1)
+        first_column = hit.argmax(axis=1)
+        hit_rows[searching[found]] = rows[found, first_column[found]]
+        not_found = searching[~found]
+        begin_rows[not_found] += horizon
+        searching = not_found[begin_rows[not_found] < end_rows[not_found]]
+        horizon *= 2
+    return hit_rows
+
+
+def resolve_trades(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    entry_rows: np.ndarray,
+    order_types: np.ndarray,
+    prices: np.ndarray,
+    sl: np.ndarray,
+    tp: np.ndarray,
+    be: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    find in bulk the outcome of trades taken on the candles entry_rows, with the
+    rules of the backtest (Backtest.manage_on_going_trades):
+        - a direct trade is managed from the candle after its entry, a pending
+          trade from the first candle after its entry which reach its price
+          (low <= price for BUY_LIMIT/SELL_STOP, high >= price for SELL_LIMIT/BUY_STOP)
+        - on a candle the SL is checked before the TP (low < sl, then high > tp for a buy)
+        - if the trade is not closed, the SL goes to the entry price when the close
+          reach the BE (close >= be for a buy), starting from the next candle
+
+    be can contain nan for trades without BE. Every row returned is len(high) when it never happens.
+    return:
+        - trigger_row: candle where the trade is on going
+        - be_row: candle where the SL is put at BE
+        - exit_row: candle where the trade is closed
+        - result: RESULT_SL, RESULT_TP or RESULT_ON_GOING if not closed
+    """
+    number_candles = len(high)
+    entry_rows = np.asarray(entry_rows, dtype=np.int64)
+    order_types = np.asarray(order_types)
+    prices = np.asarray(prices, dtype=float)
+    sl = np.asarray(sl, dtype=float)
+    tp = np.asarray(tp, dtype=float)
+    if be is None:
+        be = np.full(len(entry_rows), np.nan)
+    be = np.asarray(be, dtype=float)
+    buy = np.isin(order_types, (ORDER_TYPE_BUY, ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_BUY_STOP))
+    sell = np.isin(order_types, (ORDER_TYPE_SELL, ORDER_TYPE_SELL_LIMIT, ORDER_TYPE_SELL_STOP))
+    low_trigger = np.isin(order_types, (ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_SELL_STOP))
+    high_trigger = np.isin(order_types, (ORDER_TYPE_SELL_LIMIT, ORDER_TYPE_BUY_STOP))
+
+    trigger_rows = np.where(low_trigger | high_trigger, number_candles, entry_rows + 1)
+    trigger_rows = hit_where(trigger_rows, low_trigger, entry_rows + 1, [(low, prices, np.less_equal)])
+    trigger_rows = hit_where(trigger_rows, high_trigger, entry_rows + 1, [(high, prices, np.greater_equal)])
+
+    # the SL and the TP are searched together, so a trade is only followed until it is closed
+    never = np.full(len(entry_rows), number_candles, dtype=np.int64)
+    exit_rows = hit_where(never, buy, trigger_rows, [(low, sl, np.less), (high, tp, np.greater)])
+    exit_rows = hit_where(exit_rows, sell, trigger_rows, [(high, sl, np.greater), (low, tp, np.less)])
+    # the BE is only checked on the candles where the trade is not closed
+    be_rows = hit_where(never, buy & ~np.isnan(be), trigger_rows, [(close, be, np.greater_equal)], exit_rows)
+    be_rows = hit_where(be_rows, sell & ~np.isnan(be), trigger_rows, [(close, be, np.less_equal)], exit_rows)
+    has_be = be_rows < number_candles
+    exit_rows = hit_where(
+        exit_rows, buy & has_be, be_rows + 1, [(low, prices, np.less), (high, tp, np.greater)]
+    )
+    exit_rows = hit_where(
+        exit_rows, sell & has_be, be_rows + 1, [(high, prices, np.greater), (low, tp, np.less)]
+    )
+
+    closed = exit_rows < number_candles
+    exit_candles = np.minimum(exit_rows, number_candles - 1)
+    sl = np.where(has_be, prices, sl)
+    sl_hit = np.where(buy, low[exit_candles] < sl, high[exit_candles] > sl)
+    result = np.where(sl_hit, RESULT_SL, RESULT_TP)
+    result = np.where(closed, result, RESULT_ON_GOING)
+    return {
+        "trigger_row": trigger_rows,
+        "be_row": be_rows,
+        "exit_row": exit_rows,
+        "result": result,
+    }
+
+
+def hit_where(
+    rows: np.ndarray,
+    mask: np.ndarray,
+    start_rows: np.ndarray,
+    conditions: List[HitCondition],
+    end_rows: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    return rows where the first hit is computed for the trades of the mask
+    """
+    if not mask.any():
+        return rows
+    rows = rows.copy()
+    rows[mask] = first_hit(
+        [(values, levels[mask], comparison) for values, levels, comparison in conditions],
+        start_rows[mask],
+        None if end_rows is None else end_rows[mask],
+    )
+    return rows
+
+
+def select_signals(
+    signal_rows: np.ndarray,
+    market: np.ndarray,
+    trigger_rows: np.ndarray,
+    exit_rows: np.ndarray,
+    number_candles: int,
+    more_than_one_trade_on_going: bool,
+) -> Tuple[np.ndarray, bool]:
+    """
+    return the signals taken by the backtest (as a mask) and if a trade is on going
+    at the end (Backtest.trade_on_going), from the outcomes found by resolve_trades.
+
+    A trade going on (a market trade taken or a pending trade triggered) sets the flag
+    and any closing clears it. On a candle the triggers and the closings of the
+    trades taken before are seen first, then the signal is taken if the flag is
+    not set (or always with more_than_one_trade_on_going)
+    """
+    taken = np.zeros(len(signal_rows), dtype=bool)
+    if more_than_one_trade_on_going:
+        taken[:] = True
+        ranks = np.arange(len(signal_rows))
+        pending_trigger = ~market & (trigger_rows < number_candles)
+        closed = exit_rows < number_candles
+        # the flag is given by the last change: (candle, events before the signal, rank, trigger before closing)
+        rows = np.concatenate([signal_rows[market], trigger_rows[pending_trigger], exit_rows[closed]])
+        phases = np.concatenate([
+            np.ones(market.sum(), dtype=int),
+            np.zeros(pending_trigger.sum() + closed.sum(), dtype=int),
+        ])
+        event_ranks = np.concatenate([ranks[market], ranks[pending_trigger], ranks[closed]])
+        closings = np.concatenate([
+            np.zeros(market.sum() + pending_trigger.sum(), dtype=bool),
+            np.ones(closed.sum(), dtype=bool),
+        ])
+        if not len(rows):
+            return taken, False
+        last = np.lexsort((closings, event_ranks, phases, rows))[-1]
+        return taken, not closings[last]
+
+    # (candle, rank of the trade, 0 trigger / 1 closing)
+    trade_events = []
+    trade_on_going = False
+    rank = 0
+    for signal, row in enumerate(signal_rows.tolist()):
+        while trade_events and trade_events[0][0] <= row:
+            trade_on_going = not heappop(trade_events)[2]
+        if trade_on_going:
+            continue
+        taken[signal] = True
+        if market[signal]:
+            trade_on_going = True
+        elif trigger_rows[signal] < number_candles:
+            heappush(trade_events, (int(trigger_rows[signal]), rank, 0))
+        if exit_rows[signal] < number_candles:
+            heappush(trade_events, (int(exit_rows[signal]), rank, 1))
+        rank += 1
+    while trade_events:
+        trade_on_going = not heappop(trade_events)[2]
+    return taken, trade_on_going
+
+
+def balance_after_trades(
+    initial_balance: float,
+    risk_percentage: float,
+    results: np.ndarray,
+    rr: np.ndarray,
+    sl_to_be: np.ndarray,
+    sl_ratio_modified: np.ndarray = 1,
+) -> np.ndarray:
+    """
+    balance after each closed trade (in closing order) with the fee model of
+    Backtest.manage_balance_after_trade_closing, computed as a cumulative product
+    """
+    fee = risk_percentage * BROKER_FEE
+    factors = np.where(
+        results == RESULT_TP,
+        1 + risk_percentage * np.asarray(rr) - fee,
+        np.where(
+            sl_to_be,
+            1 - fee,
+            1 - risk_percentage * np.asarray(sl_ratio_modified) - fee,
+        ),
+    )
+    return initial_balance * np.cumprod(factors)
@@ -0,0 +1,386 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+import json
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+import click
+import numpy as np
+import pandas as pd
+
+from const import TIMEFRAME_M1, TIMEFRAME_M5, TIMEFRAME_M15
+from backtest.backtest import Backtest
+from tools.candle import Candle
+from tools.candle_store import convert_pickle_to_store, load_candles
+from tools.candle_window import CandleArrays
+from tools.market_data import add_indicators_to_data, load_data
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+PATH_DATA = Path("backtest") / "data_candles" / "EURUSD" / "January_2021.txt"
+# January converted to a CandleStore, built the first time a scenario reading it is run
+PATH_STORE = Path("benchmark") / "candle_store"
+PATH_BASELINE = Path("benchmark") / "baseline.json"
+PATH_RESULTS = Path("benchmark") / "results"
+# a scenario is a regression when its speed is tolerance slower (or its memory tolerance higher) than the baseline
+TOLERANCE = 0.2
+SYMBOL = "EURUSD"
+
+
+def synthetic_candles(
+    months: int = 3, seed: int = 42, start: str = "2021-01-04", volatility: float = 0.00014
+) -> pd.DataFrame:
+    """
+    random walk of M1 candles on the week days of the given number of months,
+    with the columns and dtypes of the candles of mt5
+    """
+    minutes = pd.date_range(
+        start, pd.Timestamp(start) + pd.DateOffset(months=months), freq="1min", inclusive="left"
+    )
+    minutes = minutes[minutes.dayofweek < 5]
+    number_candles = len(minutes)
+    random_generator = np.random.default_rng(seed)
+    close = 1.2 + np.cumsum(random_generator.normal(0, volatility, number_candles))
+    open_price = np.concatenate([[1.2], close[:-1]])
+    wicks = np.abs(random_generator.normal(0, volatility / 2, (2, number_candles)))
+    return pd.DataFrame(
+        {
+            "time": minutes.to_numpy(),
+            "open": open_price.round(5),
+            "high": (np.maximum(open_price, close) + wicks[0]).round(5),
+            "low": (np.minimum(open_price, close) - wicks[1]).round(5),
+            "close": close.round(5),
+            "tick_volume": random_generator.integers(1, 200, number_candles).astype(np.uint64),
+            "spread": np.zeros(number_candles, dtype=np.int32),
+            "real_volume": np.zeros(number_candles, dtype=np.uint64),
+        }
+    )
+
+
+def january_store_time_frames() -> List[int]:
+    """
+    convert the January candles to a CandleStore if it was not done yet, return its TF
+    """
+    if not PATH_STORE.exists():
+        convert_pickle_to_store(PATH_DATA, PATH_STORE)
+    return sorted(int(path.name) for path in (PATH_STORE / SYMBOL).iterdir())
+
+
+def run_backtest(
+    data_candles_all_tf: Dict[int, Dict[str, Union[pd.DataFrame, CandleArrays]]],
+    time_frames: List[int],
+    **settings,
+) -> Dict[str, float]:
+    """
+    backtest of the example strategy, return the candles processed and the trades taken
+    """
+    backtest = Backtest(
+        SYMBOL,
+        "benchmark",
+        "benchmark",
+        "benchmark",
+        0.5,
+        100_000,
+        time_frames,
+        settings.pop("more_than_on_trade_on_going", False),
+        False,
+        False,
+        precompute_indicators=True,
+        symbol=SYMBOL,
+        risk=0.5,
+        tf_list=time_frames,
+        ema_list=[25, 50],
+        **settings,
+    )
+    backtest.run_backtest(data_candles_all_tf, show_progress=False)
+    return {
+        "number_candles": len(data_candles_all_tf[TIMEFRAME_M1][SYMBOL]),
+        "number_trades": backtest.summary()["number_trades"],
+    }
+
+
+def scenario_load_january(number_loads: int = 20) -> Dict[str, float]:
+    # one load is too short to be measured alone
+    number_candles = 0
+    for _ in range(number_loads):
+        data_candles_all_tf = load_data(PATH_DATA)
+        number_candles += sum(
+            len(data_candles_pairs[SYMBOL].index)
+            for data_candles_pairs in data_candles_all_tf.values()
+        )
+    return {"number_candles": number_candles}
+
+
+def scenario_load_store_january(number_loads: int = 20) -> Dict[str, float]:
+    # the columns are memory maps, the closes are summed so their pages are read
+    time_frames = january_store_time_frames()
+    number_candles = 0
+    for _ in range(number_loads):
+        data_candles_all_tf = load_candles(PATH_STORE, SYMBOL, time_frames, as_arrays=True)
+        for data_candles_pairs in data_candles_all_tf.values():
+            data_candles_pairs[SYMBOL]["close"].sum()
+            number_candles += len(data_candles_pairs[SYMBOL])
+    return {"number_candles": number_candles}
+
+
+def scenario_windows_january(candle_existing: int = 100) -> Dict[str, float]:
+    # work done by the backtest loop at each step: window, first and last date, last candle
+    data_candles = load_data(PATH_DATA)[TIMEFRAME_M1][SYMBOL]
+    number_steps = len(data_candles.index) - candle_existing + 1
+    for step in range(number_steps):
+        window = data_candles.iloc[step: step + candle_existing]
+        window.iloc[0]["time"]
+        window.iloc[-1]["time"]
+        Candle(window.iloc[-1])
+    return {"number_candles": number_steps}
+
+
+def scenario_windows_january_arrays(candle_existing: int = 100) -> Dict[str, float]:
+    window = CandleArrays.from_dataframe(load_data(PATH_DATA)[TIMEFRAME_M1][SYMBOL]).window()
+    number_steps = len(window.candle_arrays) - candle_existing + 1
+    for step in range(number_steps):
+        window.move(step, step + candle_existing)
+        window["time"][0]
+        window.last("time")
+        window.iloc[-1].close
+    return {"number_candles": number_steps}
+
+
+def scenario_single_tf_january() -> Dict[str, float]:
+    return run_backtest(load_data(PATH_DATA), [TIMEFRAME_M1])
+
+
+def scenario_single_tf_january_arrays() -> Dict[str, float]:
+    return run_backtest(load_data(PATH_DATA), [TIMEFRAME_M1], array_windows=True)
+
+
+def scenario_single_tf_store_january_arrays() -> Dict[str, float]:
+    return run_backtest(
+        load_candles(PATH_STORE, SYMBOL, [TIMEFRAME_M1], as_arrays=True),
+        [TIMEFRAME_M1],
+        array_windows=True,
+    )
+
+
+def scenario_multi_tf_synthetic() -> Dict[str, float]:
+    return run_backtest(
+        {TIMEFRAME_M1: {SYMBOL: synthetic_candles(months=3)}},
+        [TIMEFRAME_M1, TIMEFRAME_M5, TIMEFRAME_M15],
+        array_windows=True,
+        resample_from_m1=True,
+    )
+
+
+def scenario_many_trades_synthetic() -> Dict[str, float]:
+    return run_backtest(
+        {TIMEFRAME_M1: {SYMBOL: synthetic_candles(months=3)}},
+        [TIMEFRAME_M1],
+        array_windows=True,
+        more_than_on_trade_on_going=True,
+    )
+
+
+def scenario_vectorized_synthetic() -> Dict[str, float]:
+    return run_backtest(
+        {TIMEFRAME_M1: {SYMBOL: synthetic_candles(months=12)}},
+        [TIMEFRAME_M1],
+        vectorized_strategy=True,
+        more_than_on_trade_on_going=True,
+    )
+
+
+def scenario_indicators_synthetic() -> Dict[str, float]:
+    data_candles = synthetic_candles(months=12)
+    add_indicators_to_data(
+        data_candles, [25, 50], True, True, True, minimum_rejection=2, body_min=1
+    )
+    return {"number_candles": len(data_candles.index)}
+
+
+SCENARIOS: Dict[str, Callable[[], Dict[str, float]]] = {
+    "load_january": scenario_load_january,
+    "load_store_january": scenario_load_store_january,
+    "windows_january": scenario_windows_january,
+    "windows_january_arrays": scenario_windows_january_arrays,
+    "single_tf_january": scenario_single_tf_january,
+    "single_tf_january_arrays": scenario_single_tf_january_arrays,
+    "single_tf_store_january_arrays": scenario_single_tf_store_january_arrays,
+    "multi_tf_synthetic": scenario_multi_tf_synthetic,
+    "many_trades_synthetic": scenario_many_trades_synthetic,
+    "vectorized_synthetic": scenario_vectorized_synthetic,
+    "indicators_synthetic": scenario_indicators_synthetic,
+}
+
+
+# work done before the measure of a scenario (not measured)
+SETUPS: Dict[str, Callable[[], Any]] = {
+    "load_store_january": january_store_time_frames,
+    "single_tf_store_january_arrays": january_store_time_frames,
+}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    peak resident memory of the process in MB, None where resource doesn't exist (Windows)
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kB on linux
+    if sys.platform == "darwin":
+        return peak_rss / 1024 ** 2
+    return peak_rss / 1024
+
+
+def measure_scenario(name: str) -> Dict[str, float]:
+    """
+    run one scenario and measure it, inside its own process so the peak memory is its own
+    """
+    if name in SETUPS:
+        SETUPS[name]()
+    begin_time = time.perf_counter()
+    result = SCENARIOS[name]()
+    wall_time = time.perf_counter() - begin_time
+    result.update(
+        {
+            "wall_time": wall_time,
+            "candles_per_second": result["number_candles"] / wall_time,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    )
+    return result
+
+
+def run_suite(names: List[str]) -> Dict[str, Any]:
+    """
+    run the scenarios one after the other, each in a new process
+    """
+    results = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scenarios": {},
+    }
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            results["scenarios"][name] = executor.submit(measure_scenario, name).result()
+        print_scenario(name, results["scenarios"][name])
+    return results
+
+
+def print_scenario(name: str, result: Dict[str, float]):
+    peak_rss = "n/a" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:,.0f} MB"
+    print(
+        f"{name:<32}{result['candles_per_second']:>14,.0f} candles/s"
+        f"{result['wall_time']:>9.2f} s{peak_rss:>10}"
+    )
+
+
+def compare_to_baseline(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = TOLERANCE
+) -> List[str]:
+    """
+    return a message for each scenario slower or heavier than the baseline by more than
+    tolerance, or missing from the baseline (it could not be compared)
+    """
+    regressions = []
+    for name, result in results["scenarios"].items():
+        baseline_result = baseline["scenarios"].get(name)
+        if baseline_result is None:
+            regressions.append(f"{name}: not in the baseline, save it again with --save_baseline")
+            continue
+        speed_ratio = result["candles_per_second"] / baseline_result["candles_per_second"]
+        if speed_ratio < 1 - tolerance:
+            regressions.append(
+                f"{name}: {result['candles_per_second']:,.0f} candles/s, "
+                f"{(1 - speed_ratio) * 100:.0f} % slower than the baseline"
+            )
+        if result["peak_rss_mb"] is not None and baseline_result["peak_rss_mb"] is not None:
+            memory_ratio = result["peak_rss_mb"] / baseline_result["peak_rss_mb"]
+            if memory_ratio > 1 + tolerance:
+                regressions.append(
+                    f"{name}: peak RSS {result['peak_rss_mb']:,.0f} MB, "
+                    f"{(memory_ratio - 1) * 100:.0f} % higher than the baseline"
+                )
+    return regressions
+
+
+@click.command()
+@click.option(
+    "-s",
+    "--scenarios",
+    multiple=True,
+    type=click.Choice(list(SCENARIOS)),
+    help="scenarios to run (list) : -s single_tf_january -s multi_tf_synthetic..., all by default",
+)
+@click.option("--output", help="json file of the results (str), in benchmark/results by default")
+@click.option(
+    "--baseline",
+    default=str(PATH_BASELINE),
+    help="json file of the results compared with this run (str)",
+)
+@click.option("--save_baseline", is_flag=True, help="save this run as the baseline")
+@click.option(
+    "--tolerance",
+    type=float,
+    default=TOLERANCE,
+    help="slowdown or memory increase accepted before a regression (float)",
+)
+def main(
+    scenarios: List[str],
+    output: Optional[str],
+    baseline: str,
+    save_baseline: bool,
+    tolerance: float,
+):
+    """
+    run the benchmark scenarios, save their results and compare them with the baseline.
+    The exit code is 1 if a scenario regressed and 2 if there is no baseline.
+    The speeds depend on the machine, so the baseline is not committed: save it
+    once on the machine running the benchmark (on the reference commit), then
+    compare each change with it. Launch it from the root of the project:
+
+        python -m benchmark.benchmark_suite --save_baseline
+        python -m benchmark.benchmark_suite
+    """
+    path_baseline = Path(baseline)
+    if not save_baseline and not path_baseline.exists():
+        print(
+            f"No baseline in {path_baseline}, nothing to compare with: save one first with "
+            "python -m benchmark.benchmark_suite --save_baseline"
+        )
+        sys.exit(2)
+    results = run_suite(list(scenarios) or list(SCENARIOS))
+    if output is None:
+        PATH_RESULTS.mkdir(parents=True, exist_ok=True)
+        output = PATH_RESULTS / f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    Path(output).write_text(json.dumps(results, indent=4))
+    print(f"Results saved in {output}")
+
+    if save_baseline:
+        path_baseline.write_text(json.dumps(results, indent=4))
+        print(f"Baseline saved in {path_baseline}")
+        return None
+    regressions = compare_to_baseline(results, json.loads(path_baseline.read_text()), tolerance)
+    if regressions:
+        print("Regressions compared to the baseline:")
+        print("\n".join(regressions))
+        sys.exit(1)
+    print("No regression compared to the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ TIMEFRAME_M1: int = 1
 TIMEFRAME_M5: int = 5
 TIMEFRAME_M15: int = 15
 TIMEFRAME_H1: int = 16385
+TIMEFRAME_H4: int = 16388
+TIMEFRAME_D1: int = 16408
 
 ORDER_TYPE_BUY = 0
 ORDER_TYPE_BUY_LIMIT = 2
@@ -13,6 +15,9 @@ ORDER_TYPE_SELL = 1
 ORDER_TYPE_SELL_LIMIT = 3
 ORDER_TYPE_SELL_STOP = 5
 
+# order type of a candle without trade in the signals of a vectorized strategy
+NO_TRADE = -1
+
 
 PIPS = 0.0001
 MICRO_PIPS = 0.00001
@@ -4,6 +4,8 @@ import click
 from termcolor import colored
 
 from strat.bot_strat import live_trading
+from backtest.sweep import create_sweep
+from tools.profiler import enable_profiling
 try:
     from backtest.my_personal_backtest import (
         create_personal_backtest as create_backtest,
@@ -22,7 +24,7 @@ __status__ = "Production"
 @click.command()
 @click.option(
     "--action",
-    help="action to execute (str) : [backtest, launch_bot]",
+    help="action to execute (str) : [backtest, sweep, launch_bot]",
 )
 @click.option(
     "--account_currency",
@@ -35,11 +37,40 @@ __status__ = "Production"
     multiple=True,
     help="symbols used(list) : -s EURUSD -s GBPUSD...",
 )
+@click.option(
+    "--workers",
+    type=int,
+    help="number of processes used by the sweep (int), all the cores by default",
+)
+@click.option(
+    "--resample_from_m1",
+    is_flag=True,
+    help="with launch_bot, only ask the M1 candles to mt5 and build the other TF from them",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="print the time spent in each phase of the backtest",
+)
+@click.option(
+    "--profile_output",
+    help="file where the cProfile stats of the backtest are dumped (str), with --profile",
+)
+@click.option(
+    "--profile_memory",
+    is_flag=True,
+    help="with --profile, also measure with tracemalloc the memory allocated by each phase (slower)",
+)
 def main(
     action: str,
     account_currency: str,
     risk: float,
     symbols: List[str],
+    workers: int,
+    resample_from_m1: bool,
+    profile: bool,
+    profile_output: str,
+    profile_memory: bool,
 ):
     """
     launch the specified action
@@ -51,9 +82,14 @@ def main(
             )
             return None
 
-        live_trading(account_currency, risk, symbols)
+        live_trading(account_currency, risk, symbols, resample_from_m1)
     elif action == "backtest":
+        if profile:
+            # set in the profiler so it also works with create_personal_backtest
+            enable_profiling(profile_output, profile_memory)
         create_backtest()
+    elif action == "sweep":
+        create_sweep(workers)
     else:
         print(colored("No action with that name", "red"))
 
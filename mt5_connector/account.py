@@ -1,10 +1,14 @@
 from pathlib import Path
+from threading import RLock
+from typing import Any
 try:
     import MetaTrader5 as Mt5
 except:
-    pass
+    Mt5 = None
 import yaml
 
+from mt5_connector.position_book import PositionBook
+
 __author__ = "Thibault Delrieu"
 __copyright__ = "Copyright 2021, Thibault Delrieu"
 __license__ = "MIT"
@@ -32,6 +36,11 @@ class Account:
         self.trade_open = False
         self.trade_on_going = {}
         self.trade_pending = {}
+        self.position_book = PositionBook()
+        # the live runner launches the strategy of several symbols at once with the same
+        # account, every change of trade_pending and trade_on_going is made under this lock
+        # (reentrant, a trade closed while adding a trade synchronises the trades)
+        self.lock = RLock()
         self.account_currency = account_currency
         self.original_risk = original_risk
 
@@ -77,6 +86,47 @@ class Account:
     def get_account_info(self):
         self.account_info = Mt5.account_info()
 
+    def sync_trades(self, force: bool = False):
+        """
+        move the trades of trade_pending and trade_on_going with the tickets of the
+        position book, synchronised with mt5 at most once per cycle:
+            - a pending trade with a position is now on going
+            - a pending trade without position or order has been cancelled
+            - an on going trade without position has been closed
+        """
+        with self.lock:
+            if not self.position_book.sync(force):
+                return
+            for ticket_order in list(self.trade_pending):
+                if self.position_book.is_on_going(ticket_order):
+                    self.trade_on_going[ticket_order] = self.trade_pending.pop(ticket_order)
+                elif not self.position_book.is_pending(ticket_order):
+                    del self.trade_pending[ticket_order]
+            for ticket_order in list(self.trade_on_going):
+                if not self.position_book.is_on_going(ticket_order):
+                    del self.trade_on_going[ticket_order]
+
+    def add_trade(self, ticket_order: int, trade: Any, pending: bool):
+        """
+        add a trade opened by the bot, in the position book first so that a
+        synchronisation never sees the trade without its position
+        """
+        with self.lock:
+            self.position_book.add(ticket_order, pending=pending)
+            if pending:
+                self.trade_pending[ticket_order] = trade
+            else:
+                self.trade_on_going[ticket_order] = trade
+
+    def remove_trade(self, ticket_order: int):
+        """
+        remove a trade closed by the bot, it may already be removed by a synchronisation
+        """
+        with self.lock:
+            self.trade_pending.pop(ticket_order, None)
+            self.trade_on_going.pop(ticket_order, None)
+            self.position_book.remove(ticket_order)
+
 
 class AccountSingleton:
     """
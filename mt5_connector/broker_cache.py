@@ -0,0 +1,98 @@
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+import time
+
+try:
+    import MetaTrader5 as Mt5
+except:
+    Mt5 = None
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+
+class BrokerCache:
+    """
+    informations of the broker read on each order which barely change:
+        - symbol_info of each symbol (and so its visibility), kept symbol_info_ttl seconds
+        - account_info (balance for the lot size), kept account_info_ttl seconds
+
+    The account is asked again after each fill closing a position (invalidate_account)
+    since its balance changed.
+    mt5_module can be any object with the symbol_info, symbol_select and account_info functions of MetaTrader5
+    """
+
+    def __init__(
+        self,
+        symbol_info_ttl: float = 300.0,
+        account_info_ttl: float = 60.0,
+        mt5_module=None,
+    ):
+        self.symbol_info_ttl = symbol_info_ttl
+        self.account_info_ttl = account_info_ttl
+        self.mt5_module = mt5_module
+        self.symbol_infos: Dict[str, Tuple[float, Any]] = {}
+        self.account: Optional[Tuple[float, Any]] = None
+        self.lock = Lock()
+
+    @property
+    def mt5(self):
+        # read at each call so that a broker installed after the import is used
+        return self.mt5_module if self.mt5_module is not None else Mt5
+
+    def symbol_info(self, symbol: str):
+        """
+        symbol_info of mt5, None (not cached) if the broker doesn't know the symbol
+        """
+        with self.lock:
+            cached = self.symbol_infos.get(symbol)
+            if cached is not None and time.monotonic() - cached[0] < self.symbol_info_ttl:
+                return cached[1]
+            symbol_info = self.mt5.symbol_info(symbol)
+            if symbol_info is not None:
+                self.symbol_infos[symbol] = (time.monotonic(), symbol_info)
+            return symbol_info
+
+    def symbol_select(self, symbol: str) -> bool:
+        """
+        show the symbol in the market watch, its symbol_info is read again at the next call
+        """
+        selected = self.mt5.symbol_select(symbol, True)
+        if selected:
+            with self.lock:
+                self.symbol_infos.pop(symbol, None)
+        return selected
+
+    def account_info(self):
+        with self.lock:
+            if self.account is not None and time.monotonic() - self.account[0] < self.account_info_ttl:
+                return self.account[1]
+            account_info = self.mt5.account_info()
+            if account_info is not None:
+                self.account = (time.monotonic(), account_info)
+            return account_info
+
+    def invalidate_account(self):
+        """
+        forget the account info after a fill closing a position
+        """
+        with self.lock:
+            self.account = None
+
+    def invalidate(self, symbol: Optional[str] = None):
+        """
+        forget the symbol info of a symbol, of every symbol if symbol is None
+        """
+        with self.lock:
+            if symbol is None:
+                self.symbol_infos.clear()
+            else:
+                self.symbol_infos.pop(symbol, None)
+
+
+# informations of the broker shared by every order of the bot
+broker_cache = BrokerCache()
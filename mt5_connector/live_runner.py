@@ -0,0 +1,185 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import MetaTrader5 as Mt5
+except:
+    Mt5 = None
+import numpy as np
+from termcolor import colored
+
+from const import TIMEFRAME_M1
+from tools.resample import time_frame_minutes
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+SECONDS_PER_MINUTE = 60
+
+
+class LatencyStats:
+    """
+    latencies (in seconds) measured by the live runner for one symbol
+    """
+
+    def __init__(self):
+        self.detection: List[float] = []
+        self.decision: List[float] = []
+        self.tick_offset: List[float] = []
+        self.number_bars = 0
+        self.number_errors = 0
+
+    def summary(self) -> Dict[str, float]:
+        summary = {"bars": self.number_bars, "errors": self.number_errors}
+        for name, latencies in (
+            ("detection", self.detection),
+            ("decision", self.decision),
+            ("tick_offset", self.tick_offset),
+        ):
+            if not latencies:
+                continue
+            summary[f"{name}_mean"] = float(np.mean(latencies))
+            summary[f"{name}_p95"] = float(np.percentile(latencies, 95))
+            summary[f"{name}_max"] = float(np.max(latencies))
+        return summary
+
+
+class LiveRunner:
+    """
+    launch the strategy of each symbol as soon as a new candle of the symbol is closed,
+    the symbols are evaluated concurrently instead of one after the other.
+
+    A new candle is detected when the last tick of the symbol belongs to a new period.
+    The blocking mt5 calls (ticks and strategies) run inside a bounded pool of threads.
+    For each candle the runner measures with the clock of the computer (perf_counter):
+        - detection: time between the last tick request still in the previous candle
+          and the new candle seen, the most the candle waited before being detected
+        - decision: time between the new candle seen and the strategy returned,
+          so until its order is sent
+    and with the clock of the server, which is only comparable with itself:
+        - tick_offset: server time of the first tick seen in the new candle minus
+          the start of the candle
+
+    mt5_module can be any object with the symbol_info_tick function of MetaTrader5
+    (a fake broker for tests for instance)
+    """
+
+    def __init__(
+        self,
+        strategy: Callable,
+        symbols: List[str],
+        strategy_kwargs: Optional[Dict[str, Any]] = None,
+        time_frame: int = TIMEFRAME_M1,
+        max_workers: int = 4,
+        poll_interval: float = 0.2,
+        report_every: int = 60,
+        mt5_module=None,
+    ):
+        self.strategy = strategy
+        self.symbols = symbols
+        self.strategy_kwargs = strategy_kwargs if strategy_kwargs is not None else {}
+        self.period = time_frame_minutes(time_frame) * SECONDS_PER_MINUTE
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.report_every = report_every
+        self.mt5_module = mt5_module
+        self.latencies = {symbol: LatencyStats() for symbol in symbols}
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.running = False
+
+    @property
+    def mt5(self):
+        # read at each call so that a broker installed after the import is used
+        return self.mt5_module if self.mt5_module is not None else Mt5
+
+    def run(self, max_bars: Optional[int] = None):
+        """
+        launch the runner until stop is called (or max_bars candles are evaluated for each symbol)
+        """
+        asyncio.run(self.run_async(max_bars))
+
+    async def run_async(self, max_bars: Optional[int] = None):
+        self.running = True
+        with ThreadPoolExecutor(max_workers=self.max_workers) as self.executor:
+            await asyncio.gather(
+                *(self.run_symbol(symbol, max_bars) for symbol in self.symbols)
+            )
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+    async def run_symbol(self, symbol: str, max_bars: Optional[int] = None):
+        """
+        wait for each new candle of the symbol and launch the strategy on it
+        """
+        loop = asyncio.get_running_loop()
+        latency_stats = self.latencies[symbol]
+        last_period = None
+        last_request_at = None
+        while self.running and (max_bars is None or latency_stats.number_bars < max_bars):
+            request_at = time.perf_counter()
+            tick = await loop.run_in_executor(self.executor, self.mt5.symbol_info_tick, symbol)
+            if tick is not None:
+                tick_time = tick.time_msc / 1000
+                period = int(tick_time // self.period)
+                if last_period is not None and period > last_period:
+                    # the previous candle is closed at the start of the new period
+                    await self.evaluate_candle(
+                        symbol,
+                        time.perf_counter() - last_request_at,
+                        tick_time - period * self.period,
+                    )
+                    last_period = period
+                    last_request_at = time.perf_counter()
+                    continue
+                last_period = period
+                last_request_at = request_at
+            await asyncio.sleep(self.poll_interval)
+
+    async def evaluate_candle(self, symbol: str, detection: float, tick_offset: float):
+        """
+        launch the strategy of the symbol on the candle just closed and measure the latencies
+        """
+        loop = asyncio.get_running_loop()
+        latency_stats = self.latencies[symbol]
+        detected_at = time.perf_counter()
+        try:
+            await loop.run_in_executor(
+                self.executor,
+                partial(self.strategy, symbol=symbol, **self.strategy_kwargs),
+            )
+        except Exception as error:
+            latency_stats.number_errors += 1
+            print(colored(f"strategy failed on {symbol}: {error}", "red"))
+        latency_stats.number_bars += 1
+        latency_stats.detection.append(detection)
+        latency_stats.decision.append(time.perf_counter() - detected_at)
+        latency_stats.tick_offset.append(tick_offset)
+        if self.report_every and latency_stats.number_bars % self.report_every == 0:
+            self.print_report(symbol)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        latencies of every symbol since the launch of the runner
+        """
+        return {symbol: stats.summary() for symbol, stats in self.latencies.items()}
+
+    def print_report(self, symbol: str):
+        summary = self.latencies[symbol].summary()
+        print(
+            colored(
+                f"{symbol}: {summary['bars']} candles, detection latency "
+                f"p95 {summary.get('detection_p95', float('nan')):.3f}s, decision latency "
+                f"mean {summary.get('decision_mean', float('nan')):.3f}s "
+                f"p95 {summary.get('decision_p95', float('nan')):.3f}s",
+                "blue",
+            )
+        )
@@ -0,0 +1,831 @@
+from collections import namedtuple
+from datetime import datetime
+from itertools import count
+from pathlib import Path
+from threading import RLock
+import calendar
+import random
+import sys
+import time
+import types
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from tools.market_data import load_data
+from tools.resample import resample_arrays, time_frame_minutes
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+# constants of the MetaTrader5 module used by the toolbox
+CONSTANTS = {
+    "TIMEFRAME_M1": 1,
+    "TIMEFRAME_M5": 5,
+    "TIMEFRAME_M15": 15,
+    "TIMEFRAME_M30": 30,
+    "TIMEFRAME_H1": 16385,
+    "TIMEFRAME_H4": 16388,
+    "TIMEFRAME_D1": 16408,
+    "ORDER_TYPE_BUY": 0,
+    "ORDER_TYPE_SELL": 1,
+    "ORDER_TYPE_BUY_LIMIT": 2,
+    "ORDER_TYPE_SELL_LIMIT": 3,
+    "ORDER_TYPE_BUY_STOP": 4,
+    "ORDER_TYPE_SELL_STOP": 5,
+    "TRADE_ACTION_DEAL": 1,
+    "TRADE_ACTION_PENDING": 5,
+    "TRADE_ACTION_SLTP": 6,
+    "TRADE_ACTION_MODIFY": 7,
+    "TRADE_ACTION_REMOVE": 8,
+    "ORDER_TIME_GTC": 0,
+    "ORDER_FILLING_FOK": 0,
+    "ORDER_FILLING_IOC": 1,
+    "ORDER_FILLING_RETURN": 2,
+    "DEAL_TYPE_BUY": 0,
+    "DEAL_TYPE_SELL": 1,
+    "DEAL_ENTRY_IN": 0,
+    "DEAL_ENTRY_OUT": 1,
+    "TRADE_RETCODE_REQUOTE": 10004,
+    "TRADE_RETCODE_DONE": 10009,
+    "TRADE_RETCODE_INVALID": 10013,
+    "TRADE_RETCODE_INVALID_VOLUME": 10014,
+    "TRADE_RETCODE_INVALID_PRICE": 10015,
+    "TRADE_RETCODE_INVALID_STOPS": 10016,
+    "TRADE_RETCODE_PRICE_OFF": 10021,
+}
+ORDER_TYPE_BUY = CONSTANTS["ORDER_TYPE_BUY"]
+ORDER_TYPE_SELL = CONSTANTS["ORDER_TYPE_SELL"]
+ORDER_TYPE_BUY_LIMIT = CONSTANTS["ORDER_TYPE_BUY_LIMIT"]
+ORDER_TYPE_SELL_LIMIT = CONSTANTS["ORDER_TYPE_SELL_LIMIT"]
+ORDER_TYPE_BUY_STOP = CONSTANTS["ORDER_TYPE_BUY_STOP"]
+ORDER_TYPE_SELL_STOP = CONSTANTS["ORDER_TYPE_SELL_STOP"]
+BUY_ORDER_TYPES = (ORDER_TYPE_BUY, ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_BUY_STOP)
+TRADE_ACTION_DEAL = CONSTANTS["TRADE_ACTION_DEAL"]
+TRADE_ACTION_PENDING = CONSTANTS["TRADE_ACTION_PENDING"]
+TRADE_ACTION_SLTP = CONSTANTS["TRADE_ACTION_SLTP"]
+TRADE_ACTION_REMOVE = CONSTANTS["TRADE_ACTION_REMOVE"]
+TRADE_RETCODE_DONE = CONSTANTS["TRADE_RETCODE_DONE"]
+
+# functions of the MetaTrader5 module given by install
+API_FUNCTIONS = [
+    "initialize",
+    "login",
+    "shutdown",
+    "last_error",
+    "account_info",
+    "symbol_info",
+    "symbol_info_tick",
+    "symbol_select",
+    "copy_rates_range",
+    "copy_rates_from_pos",
+    "order_send",
+    "positions_get",
+    "orders_get",
+    "history_deals_get",
+]
+
+SECONDS_PER_MINUTE = 60
+CONTRACT_SIZE = 100_000
+RATES_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("tick_volume", "<u8"),
+        ("spread", "<i4"),
+        ("real_volume", "<u8"),
+    ]
+)
+
+Tick = namedtuple(
+    "Tick", ["time", "bid", "ask", "last", "volume", "time_msc", "flags", "volume_real"]
+)
+SymbolInfo = namedtuple(
+    "SymbolInfo",
+    [
+        "name",
+        "visible",
+        "select",
+        "digits",
+        "point",
+        "spread",
+        "bid",
+        "ask",
+        "trade_contract_size",
+        "volume_min",
+        "volume_max",
+        "volume_step",
+    ],
+)
+AccountInfo = namedtuple(
+    "AccountInfo",
+    [
+        "login",
+        "balance",
+        "equity",
+        "profit",
+        "margin",
+        "margin_free",
+        "leverage",
+        "currency",
+        "server",
+        "name",
+    ],
+)
+OrderSendResult = namedtuple(
+    "OrderSendResult",
+    [
+        "retcode",
+        "deal",
+        "order",
+        "volume",
+        "price",
+        "bid",
+        "ask",
+        "comment",
+        "request_id",
+        "retcode_external",
+        "request",
+    ],
+)
+TradePosition = namedtuple(
+    "TradePosition",
+    [
+        "ticket",
+        "time",
+        "type",
+        "magic",
+        "identifier",
+        "volume",
+        "price_open",
+        "sl",
+        "tp",
+        "price_current",
+        "profit",
+        "symbol",
+        "comment",
+    ],
+)
+TradeOrder = namedtuple(
+    "TradeOrder",
+    [
+        "ticket",
+        "time_setup",
+        "type",
+        "magic",
+        "volume_current",
+        "price_open",
+        "sl",
+        "tp",
+        "symbol",
+        "comment",
+    ],
+)
+TradeDeal = namedtuple(
+    "TradeDeal",
+    [
+        "ticket",
+        "order",
+        "time",
+        "type",
+        "entry",
+        "magic",
+        "position_id",
+        "volume",
+        "price",
+        "commission",
+        "swap",
+        "profit",
+        "symbol",
+        "comment",
+    ],
+)
+
+
+class Mt5Simulator:
+    """
+    broker replaying the candles of the backtest files with the subset of the
+    MetaTrader5 API used by the toolbox, to run the live code on any OS
+    (install() puts it in place of the MetaTrader5 module).
+
+    The simulated clock starts at start and runs speed times faster than the real
+    clock (speed=0 to only move it with advance). Inside each M1 candle the bid goes
+    open -> low -> high -> close for a bullish candle (open -> high -> low -> close
+    otherwise) and the ask is the bid plus the spread of the candle.
+    The pending orders, SL and TP are filled on this path each time the broker is
+    called, the SL before the TP. A deal is requoted with requote_probability or when
+    its price is further than its deviation from the market. Profits are in the
+    quote currency of the symbols with lots of CONTRACT_SIZE.
+    """
+
+    def __init__(
+        self,
+        data_candles_all_tf: Dict[int, Dict[str, pd.DataFrame]],
+        start: Optional[datetime] = None,
+        speed: float = 60,
+        initial_balance: float = 100_000,
+        requote_probability: float = 0,
+        seed: Optional[int] = None,
+        currency: str = "USD",
+    ):
+        self.m1 = {
+            symbol: {
+                name: data_candles[name].to_numpy()
+                for name in RATES_DTYPE.names
+                if name in data_candles
+            }
+            for symbol, data_candles in data_candles_all_tf[CONSTANTS["TIMEFRAME_M1"]].items()
+        }
+        self.m1_seconds = {
+            symbol: columns["time"].astype("datetime64[s]").astype(np.int64)
+            for symbol, columns in self.m1.items()
+        }
+        self.data_candles_all_tf = data_candles_all_tf
+        if start is None:
+            start_seconds = max(seconds[0] for seconds in self.m1_seconds.values()) + 24 * 3600
+        else:
+            start_seconds = calendar.timegm(start.timetuple())
+        self.start_seconds = float(start_seconds)
+        self.speed = speed
+        self.real_start = time.perf_counter()
+        self.offset_seconds = 0.0
+        self.random = random.Random(seed)
+        self.requote_probability = requote_probability
+        self.balance = float(initial_balance)
+        self.currency = currency
+        self.visible = {symbol: False for symbol in self.m1}
+        self.tickets = count(1_000_000)
+        self.positions: Dict[int, dict] = {}
+        self.orders: Dict[int, dict] = {}
+        self.deals: List[TradeDeal] = []
+        self.last_update = self.start_seconds
+        self.rates_cache: Dict[Tuple[str, int], np.ndarray] = {}
+        # the live runner calls the API from several threads, the fills and the
+        # orders are done under this lock (reentrant, the API methods call update)
+        self.lock = RLock()
+
+    @classmethod
+    def from_file(cls, path_data: Union[Path, str], **kwargs) -> "Mt5Simulator":
+        """
+        create the simulator from a pickle file of the backtest ({TF: {symbol: candles}})
+        """
+        return cls(load_data(path_data), **kwargs)
+
+    ###################
+    ### clock/prices ###
+    ###################
+
+    def now(self) -> float:
+        """
+        simulated server time in seconds
+        """
+        elapsed = (time.perf_counter() - self.real_start) * self.speed
+        return self.start_seconds + self.offset_seconds + elapsed
+
+    def advance(self, seconds: float):
+        """
+        move the simulated clock forward
+        """
+        with self.lock:
+            self.offset_seconds += seconds
+            self.update()
+
+    def candle_index(self, symbol: str, seconds: float) -> int:
+        """
+        index of the M1 candle in progress at the given time
+        """
+        return int(np.searchsorted(self.m1_seconds[symbol], seconds, side="right")) - 1
+
+    def price_path(self, symbol: str, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        fractions of the minute and bids of the path followed inside a M1 candle
+        """
+        columns = self.m1[symbol]
+        open_price = columns["open"][index]
+        close = columns["close"][index]
+        if close >= open_price:
+            extremes = (columns["low"][index], columns["high"][index])
+        else:
+            extremes = (columns["high"][index], columns["low"][index])
+        return (
+            np.array([0, 1 / 3, 2 / 3, 1]),
+            np.array([open_price, extremes[0], extremes[1], close]),
+        )
+
+    def bid(self, symbol: str, seconds: float) -> float:
+        index = self.candle_index(symbol, seconds)
+        if index < 0:
+            return float("nan")
+        fraction = (seconds - self.m1_seconds[symbol][index]) / SECONDS_PER_MINUTE
+        fractions, prices = self.price_path(symbol, index)
+        return float(np.interp(min(fraction, 1), fractions, prices))
+
+    def spread(self, symbol: str, seconds: float) -> float:
+        index = max(self.candle_index(symbol, seconds), 0)
+        return self.point(symbol) * float(self.m1[symbol]["spread"][index])
+
+    @staticmethod
+    def digits(symbol: str) -> int:
+        return 3 if "JPY" in symbol.upper() else 5
+
+    def point(self, symbol: str) -> float:
+        return 10 ** -self.digits(symbol)
+
+    def price_range(
+        self, symbol: str, begin: float, end: float, ask: bool = False
+    ) -> Tuple[float, float]:
+        """
+        lowest and highest bid reached by the path between begin and end,
+        or ask (bid plus the spread of each candle) for the levels reached by a buy
+        """
+        index = max(self.candle_index(symbol, begin), 0)
+        last_index = self.candle_index(symbol, end)
+        low, high = float("inf"), float("-inf")
+        while index <= last_index:
+            candle_begin = self.m1_seconds[symbol][index]
+            fraction_begin = max(0.0, (begin - candle_begin) / SECONDS_PER_MINUTE)
+            fraction_end = min(1.0, (end - candle_begin) / SECONDS_PER_MINUTE)
+            if fraction_end >= fraction_begin:
+                fractions, prices = self.price_path(symbol, index)
+                inside = (fractions > fraction_begin) & (fractions < fraction_end)
+                reached = np.concatenate(
+                    [
+                        prices[inside],
+                        np.interp([fraction_begin, fraction_end], fractions, prices),
+                    ]
+                )
+                if ask:
+                    reached = reached + self.point(symbol) * float(
+                        self.m1[symbol]["spread"][index]
+                    )
+                low = min(low, reached.min())
+                high = max(high, reached.max())
+            index += 1
+        return low, high
+
+    #############
+    ### fills ###
+    #############
+
+    def update(self):
+        """
+        fill the pending orders, SL and TP reached since the last call. Like send_deal,
+        the buys (buy orders, SL and TP of the sell positions) are filled at the ask
+        """
+        with self.lock:
+            now = self.now()
+            begin = self.last_update
+            self.last_update = now
+            for ticket, order in list(self.orders.items()):
+                low, high = self.price_range(
+                    order["symbol"],
+                    max(begin, order["time"]),
+                    now,
+                    ask=order["type"] in BUY_ORDER_TYPES,
+                )
+                if order["type"] in (ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_SELL_STOP):
+                    triggered = low <= order["price"]
+                else:
+                    triggered = high >= order["price"]
+                if triggered:
+                    del self.orders[ticket]
+                    self.open_position(order, order["price"], now)
+            for ticket, position in list(self.positions.items()):
+                low, high = self.price_range(
+                    position["symbol"],
+                    max(begin, position["time"]),
+                    now,
+                    ask=position["type"] == ORDER_TYPE_SELL,
+                )
+                sl, tp = position["sl"], position["tp"]
+                if position["type"] == ORDER_TYPE_BUY:
+                    if sl and low < sl:
+                        self.close_position(ticket, sl, now, "sl")
+                    elif tp and high > tp:
+                        self.close_position(ticket, tp, now, "tp")
+                else:
+                    if sl and high > sl:
+                        self.close_position(ticket, sl, now, "sl")
+                    elif tp and low < tp:
+                        self.close_position(ticket, tp, now, "tp")
+
+    def open_position(self, request: dict, price: float, seconds: float) -> int:
+        ticket = request["ticket"]
+        order_type = (
+            ORDER_TYPE_BUY if request["type"] in BUY_ORDER_TYPES else ORDER_TYPE_SELL
+        )
+        self.positions[ticket] = {
+            "ticket": ticket,
+            "symbol": request["symbol"],
+            "type": order_type,
+            "volume": request["volume"],
+            "price": price,
+            "sl": request.get("sl", 0.0) or 0.0,
+            "tp": request.get("tp", 0.0) or 0.0,
+            "magic": request.get("magic", 0),
+            "comment": request.get("comment", ""),
+            "time": seconds,
+        }
+        return self.add_deal(
+            ticket, ticket, order_type, CONSTANTS["DEAL_ENTRY_IN"], price, 0.0, seconds
+        )
+
+    def close_position(self, ticket: int, price: float, seconds: float, comment: str) -> int:
+        """
+        close the position with a new order, like mt5 the closing deal has the
+        ticket of this order and the ticket of the position as position_id
+        """
+        position = self.positions[ticket]
+        profit = self.profit(position, price)
+        self.balance += profit
+        deal_type = ORDER_TYPE_SELL if position["type"] == ORDER_TYPE_BUY else ORDER_TYPE_BUY
+        deal_ticket = self.add_deal(
+            next(self.tickets),
+            ticket,
+            deal_type,
+            CONSTANTS["DEAL_ENTRY_OUT"],
+            price,
+            profit,
+            seconds,
+            comment,
+        )
+        del self.positions[ticket]
+        return deal_ticket
+
+    def add_deal(
+        self,
+        order: int,
+        position_ticket: int,
+        deal_type: int,
+        entry: int,
+        price: float,
+        profit: float,
+        seconds: float,
+        comment: Optional[str] = None,
+    ) -> int:
+        position = self.positions.get(position_ticket)
+        deal_ticket = next(self.tickets)
+        self.deals.append(
+            TradeDeal(
+                ticket=deal_ticket,
+                order=order,
+                time=int(seconds),
+                type=deal_type,
+                entry=entry,
+                magic=position["magic"] if position else 0,
+                position_id=position_ticket,
+                volume=position["volume"] if position else 0.0,
+                price=price,
+                commission=0.0,
+                swap=0.0,
+                profit=profit,
+                symbol=position["symbol"] if position else "",
+                comment=comment if comment is not None else position["comment"],
+            )
+        )
+        return deal_ticket
+
+    @staticmethod
+    def profit(position: dict, price: float) -> float:
+        direction = 1 if position["type"] == ORDER_TYPE_BUY else -1
+        return direction * (price - position["price"]) * position["volume"] * CONTRACT_SIZE
+
+    ###########
+    ### API ###
+    ###########
+
+    def initialize(self, *args, **kwargs) -> bool:
+        return True
+
+    def login(self, *args, **kwargs) -> bool:
+        return True
+
+    def shutdown(self):
+        return None
+
+    def last_error(self) -> Tuple[int, str]:
+        return 1, "Success"
+
+    def account_info(self) -> AccountInfo:
+        with self.lock:
+            self.update()
+            now = self.now()
+            profit = sum(
+                self.profit(position, self.close_price(position, now))
+                for position in self.positions.values()
+            )
+            return AccountInfo(
+                login=42,
+                balance=self.balance,
+                equity=self.balance + profit,
+                profit=profit,
+                margin=0.0,
+                margin_free=self.balance + profit,
+                leverage=100,
+                currency=self.currency,
+                server="Mt5Simulator",
+                name="simulator",
+            )
+
+    def symbol_info(self, symbol: str) -> Optional[SymbolInfo]:
+        with self.lock:
+            if symbol not in self.m1:
+                return None
+            tick = self.symbol_info_tick(symbol)
+            return SymbolInfo(
+                name=symbol,
+                visible=self.visible[symbol],
+                select=self.visible[symbol],
+                digits=self.digits(symbol),
+                point=self.point(symbol),
+                spread=int(round((tick.ask - tick.bid) / self.point(symbol))),
+                bid=tick.bid,
+                ask=tick.ask,
+                trade_contract_size=CONTRACT_SIZE,
+                volume_min=0.01,
+                volume_max=100.0,
+                volume_step=0.01,
+            )
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        with self.lock:
+            if symbol not in self.m1:
+                return False
+            self.visible[symbol] = enable
+            return True
+
+    def symbol_info_tick(self, symbol: str) -> Optional[Tick]:
+        with self.lock:
+            if symbol not in self.m1:
+                return None
+            self.update()
+            now = self.now()
+            bid = self.bid(symbol, now)
+            return Tick(
+                time=int(now),
+                bid=bid,
+                ask=bid + self.spread(symbol, now),
+                last=0.0,
+                volume=0,
+                time_msc=int(now * 1000),
+                flags=0,
+                volume_real=0.0,
+            )
+
+    def rates(self, symbol: str, time_frame: int) -> np.ndarray:
+        """
+        every candle of a TF as the structured array of mt5, built from M1 if the TF is not in the data
+        """
+        key = (symbol, time_frame)
+        if key not in self.rates_cache:
+            if symbol in self.data_candles_all_tf.get(time_frame, {}):
+                data_candles = self.data_candles_all_tf[time_frame][symbol]
+                columns = {name: data_candles[name].to_numpy() for name in RATES_DTYPE.names}
+            else:
+                columns = resample_arrays(self.m1[symbol], time_frame_minutes(time_frame))
+            rates = np.empty(len(columns["time"]), dtype=RATES_DTYPE)
+            for name in RATES_DTYPE.names:
+                if name == "time":
+                    rates[name] = columns[name].astype("datetime64[s]").astype(np.int64)
+                else:
+                    rates[name] = columns[name]
+            self.rates_cache[key] = rates
+        return self.rates_cache[key]
+
+    def simulated_range(
+        self, date_from: Union[datetime, int, float], date_to: Union[datetime, int, float]
+    ) -> Tuple[float, float]:
+        """
+        dates asked by the toolbox in seconds of the simulated clock: the dates
+        after the simulated now (like datetime.now() - 72 hours) are moved back so
+        that date_to is now
+        """
+        now = self.now()
+        seconds_from, seconds_to = to_seconds(date_from), to_seconds(date_to)
+        if seconds_to > now:
+            if seconds_from > now:
+                seconds_from = now - (seconds_to - seconds_from)
+            seconds_to = now
+        return seconds_from, seconds_to
+
+    def copy_rates_range(
+        self, symbol: str, time_frame: int, date_from, date_to
+    ) -> Optional[np.ndarray]:
+        """
+        candles between the dates, the last one being the candle in progress (with its final values)
+        """
+        with self.lock:
+            if symbol not in self.m1:
+                return None
+            seconds_from, seconds_to = self.simulated_range(date_from, date_to)
+            rates = self.rates(symbol, time_frame)
+            first_row = np.searchsorted(rates["time"], seconds_from, side="left")
+            last_row = np.searchsorted(rates["time"], seconds_to, side="right")
+            return rates[first_row:last_row].copy()
+
+    def copy_rates_from_pos(
+        self, symbol: str, time_frame: int, start_pos: int, count_candles: int
+    ) -> Optional[np.ndarray]:
+        """
+        count_candles candles ending start_pos candles before the candle in progress
+        """
+        with self.lock:
+            if symbol not in self.m1:
+                return None
+            rates = self.rates(symbol, time_frame)
+            end_row = int(np.searchsorted(rates["time"], self.now(), side="right")) - start_pos
+            return rates[max(end_row - count_candles, 0): max(end_row, 0)].copy()
+
+    def order_send(self, request: dict) -> OrderSendResult:
+        with self.lock:
+            self.update()
+            action = request.get("action")
+            if action == TRADE_ACTION_DEAL:
+                return self.send_deal(request)
+            if action == TRADE_ACTION_PENDING:
+                if request.get("symbol") not in self.m1:
+                    return self.result(request, CONSTANTS["TRADE_RETCODE_INVALID"], "Invalid request")
+                if not request.get("volume") or request["volume"] <= 0:
+                    return self.result(request, CONSTANTS["TRADE_RETCODE_INVALID_VOLUME"], "Invalid volume")
+                if request.get("price") is None:
+                    return self.result(request, CONSTANTS["TRADE_RETCODE_INVALID_PRICE"], "Invalid price")
+                ticket = next(self.tickets)
+                self.orders[ticket] = {**request, "ticket": ticket, "time": self.now()}
+                return self.result(request, TRADE_RETCODE_DONE, "Request executed", order=ticket)
+            if action == TRADE_ACTION_REMOVE:
+                if self.orders.pop(request.get("order"), None) is None:
+                    return self.result(request, CONSTANTS["TRADE_RETCODE_INVALID"], "Invalid request")
+                return self.result(request, TRADE_RETCODE_DONE, "Request executed", order=request["order"])
+            if action == TRADE_ACTION_SLTP:
+                position = self.positions.get(request.get("position"))
+                if position is None:
+                    return self.result(request, CONSTANTS["TRADE_RETCODE_INVALID"], "Invalid request")
+                position["sl"] = request.get("sl", position["sl"]) or 0.0
+                position["tp"] = request.get("tp", position["tp"]) or 0.0
+                return self.result(request, TRADE_RETCODE_DONE, "Request executed", order=position["ticket"])
+            return self.result(request, CONSTANTS["TRADE_RETCODE_INVALID"], "Invalid request")
+
+    def send_deal(self, request: dict) -> OrderSendResult:
+        """
+        open a position at the market, or close the position given in the request
+        """
+        symbol = request.get("symbol")
+        if symbol not in self.m1:
+            return self.result(request, CONSTANTS["TRADE_RETCODE_INVALID"], "Invalid request")
+        if not request.get("volume") or request["volume"] <= 0:
+            return self.result(request, CONSTANTS["TRADE_RETCODE_INVALID_VOLUME"], "Invalid volume")
+        now = self.now()
+        bid = self.bid(symbol, now)
+        if np.isnan(bid):
+            return self.result(request, CONSTANTS["TRADE_RETCODE_PRICE_OFF"], "No prices")
+        ask = bid + self.spread(symbol, now)
+        market_price = ask if request.get("type") == ORDER_TYPE_BUY else bid
+        # without deviation the deal is filled at the market price, like the market execution of mt5
+        deviation = request.get("deviation")
+        requested_price = request.get("price")
+        if self.random.random() < self.requote_probability or (
+            deviation is not None
+            and requested_price is not None
+            and abs(requested_price - market_price) > deviation * self.point(symbol)
+        ):
+            return self.result(
+                request, CONSTANTS["TRADE_RETCODE_REQUOTE"], "Requote", bid=bid, ask=ask
+            )
+        if "position" in request:
+            if request["position"] not in self.positions:
+                return self.result(request, CONSTANTS["TRADE_RETCODE_INVALID"], "Invalid request")
+            deal = self.close_position(
+                request["position"], market_price, now, request.get("comment", "")
+            )
+            order = self.deals[-1].order
+        else:
+            order = next(self.tickets)
+            deal = self.open_position({**request, "ticket": order}, market_price, now)
+        return self.result(
+            request, TRADE_RETCODE_DONE, "Request executed",
+            deal=deal, order=order, price=market_price, bid=bid, ask=ask,
+        )
+
+    @staticmethod
+    def result(
+        request: dict,
+        retcode: int,
+        comment: str,
+        deal: int = 0,
+        order: int = 0,
+        price: float = 0.0,
+        bid: float = 0.0,
+        ask: float = 0.0,
+    ) -> OrderSendResult:
+        return OrderSendResult(
+            retcode=retcode,
+            deal=deal,
+            order=order,
+            volume=request.get("volume", 0.0),
+            price=price,
+            bid=bid,
+            ask=ask,
+            comment=comment,
+            request_id=0,
+            retcode_external=0,
+            request=request,
+        )
+
+    def close_price(self, position: dict, seconds: float) -> float:
+        bid = self.bid(position["symbol"], seconds)
+        if position["type"] == ORDER_TYPE_BUY:
+            return bid
+        return bid + self.spread(position["symbol"], seconds)
+
+    def positions_get(
+        self, symbol: Optional[str] = None, ticket: Optional[int] = None
+    ) -> Tuple[TradePosition, ...]:
+        with self.lock:
+            self.update()
+            now = self.now()
+            return tuple(
+                TradePosition(
+                    ticket=position["ticket"],
+                    time=int(position["time"]),
+                    type=position["type"],
+                    magic=position["magic"],
+                    identifier=position["ticket"],
+                    volume=position["volume"],
+                    price_open=position["price"],
+                    sl=position["sl"],
+                    tp=position["tp"],
+                    price_current=self.close_price(position, now),
+                    profit=self.profit(position, self.close_price(position, now)),
+                    symbol=position["symbol"],
+                    comment=position["comment"],
+                )
+                for position in self.positions.values()
+                if (symbol is None or position["symbol"] == symbol)
+                and (ticket is None or position["ticket"] == ticket)
+            )
+
+    def orders_get(
+        self, symbol: Optional[str] = None, ticket: Optional[int] = None
+    ) -> Tuple[TradeOrder, ...]:
+        with self.lock:
+            self.update()
+            return tuple(
+                TradeOrder(
+                    ticket=order["ticket"],
+                    time_setup=int(order["time"]),
+                    type=order["type"],
+                    magic=order.get("magic", 0),
+                    volume_current=order["volume"],
+                    price_open=order["price"],
+                    sl=order.get("sl", 0.0) or 0.0,
+                    tp=order.get("tp", 0.0) or 0.0,
+                    symbol=order["symbol"],
+                    comment=order.get("comment", ""),
+                )
+                for order in self.orders.values()
+                if (symbol is None or order["symbol"] == symbol)
+                and (ticket is None or order["ticket"] == ticket)
+            )
+
+    def history_deals_get(self, date_from, date_to) -> Tuple[TradeDeal, ...]:
+        with self.lock:
+            self.update()
+            seconds_from, seconds_to = self.simulated_range(date_from, date_to)
+            return tuple(deal for deal in self.deals if seconds_from <= deal.time <= seconds_to)
+
+
+def to_seconds(date: Union[datetime, int, float]) -> float:
+    """
+    seconds since epoch of a date given to mt5 (naive datetimes are read as UTC like the candles)
+    """
+    if isinstance(date, datetime):
+        if date.tzinfo is None:
+            return float(calendar.timegm(date.timetuple()))
+        return date.timestamp()
+    return float(date)
+
+
+def install(simulator: Mt5Simulator) -> types.ModuleType:
+    """
+    put the simulator in place of the MetaTrader5 module. Call it before importing
+    the live code of the toolbox, the modules already imported with an Mt5 attribute
+    are also updated
+    """
+    module = types.ModuleType("MetaTrader5")
+    module.__dict__.update(CONSTANTS)
+    for name in API_FUNCTIONS:
+        setattr(module, name, getattr(simulator, name))
+    module.simulator = simulator
+    sys.modules["MetaTrader5"] = module
+    for loaded_module in list(sys.modules.values()):
+        if "Mt5" in getattr(loaded_module, "__dict__", {}):
+            loaded_module.Mt5 = module
+    return module
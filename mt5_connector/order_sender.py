@@ -0,0 +1,163 @@
+from threading import Lock
+from typing import Callable, Dict, Optional, Tuple
+import time
+
+try:
+    import MetaTrader5 as Mt5
+except:
+    Mt5 = None
+
+from mt5_connector.broker_cache import broker_cache
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+# comments of the results of order_send worth sending again with a fresh price
+RETRY_COMMENTS = ("Requote", "Invalid price", "No prices", "Invalid volume")
+
+
+class RetryStats:
+    """
+    retries made by the order sender for one symbol
+    """
+
+    def __init__(self):
+        self.number_orders = 0
+        self.number_retries = 0
+        self.number_failures = 0
+        self.max_retries = 0
+        self.time_waited = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "orders": self.number_orders,
+            "retries": self.number_retries,
+            "failures": self.number_failures,
+            "max_retries": self.max_retries,
+            "time_waited": self.time_waited,
+        }
+
+
+class OrderSender:
+    """
+    send the requests to mt5 and send them again with a fresh price while the
+    broker answers a requote (or another comment of retry_comments), at most max_retries times.
+
+    Between two tries the sender waits for the next tick of the symbol, polled every
+    poll_interval seconds, during at most backoff * 2 ** retry seconds (max_backoff at most),
+    so a fast market is retried as soon as it moves and a stuck one is not spammed.
+
+    mt5_module can be any object with the order_send and symbol_info_tick functions of MetaTrader5
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 10,
+        backoff: float = 0.05,
+        max_backoff: float = 1.0,
+        poll_interval: float = 0.01,
+        mt5_module=None,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.mt5_module = mt5_module
+        self.stats: Dict[str, RetryStats] = {}
+        self.lock = Lock()
+
+    @property
+    def mt5(self):
+        # read at each call so that a broker installed after the import is used
+        return self.mt5_module if self.mt5_module is not None else Mt5
+
+    def send(
+        self,
+        request: dict,
+        refresh: Optional[Callable[[dict], None]] = None,
+        retry_comments: Tuple[str, ...] = RETRY_COMMENTS,
+    ):
+        """
+        send the request and return the last result of order_send. Before each retry
+        refresh(request) updates the request, by default the price of a deal is
+        set to the current price of the market
+        """
+        if refresh is None:
+            refresh = self.refresh_price
+        symbol = request.get("symbol", "")
+        result = self.mt5.order_send(request)
+        retry = 0
+        time_waited = 0.0
+        while (
+            result is not None
+            and result.comment in retry_comments
+            and retry < self.max_retries
+        ):
+            time_waited += self.wait_next_tick(
+                symbol, min(self.backoff * 2 ** retry, self.max_backoff)
+            )
+            refresh(request)
+            result = self.mt5.order_send(request)
+            retry += 1
+        self.record(symbol, retry, time_waited, result)
+        if (
+            result is not None
+            and result.retcode == self.mt5.TRADE_RETCODE_DONE
+            and "position" in request
+        ):
+            # the balance changed with the position closed
+            broker_cache.invalidate_account()
+        return result
+
+    def wait_next_tick(self, symbol: str, timeout: float) -> float:
+        """
+        wait until the symbol receive a new tick or until timeout, return the time waited
+        """
+        begin = time.perf_counter()
+        tick = self.mt5.symbol_info_tick(symbol)
+        last_time_msc = None if tick is None else tick.time_msc
+        while time.perf_counter() - begin < timeout:
+            time.sleep(self.poll_interval)
+            tick = self.mt5.symbol_info_tick(symbol)
+            if tick is not None and tick.time_msc != last_time_msc:
+                break
+        return time.perf_counter() - begin
+
+    def refresh_price(self, request: dict):
+        """
+        put the current price of the market in a deal request
+        """
+        if request.get("action") != self.mt5.TRADE_ACTION_DEAL:
+            return
+        tick = self.mt5.symbol_info_tick(request["symbol"])
+        if tick is None:
+            return
+        if request["type"] == self.mt5.ORDER_TYPE_BUY:
+            request["price"] = tick.ask
+        elif request["type"] == self.mt5.ORDER_TYPE_SELL:
+            request["price"] = tick.bid
+
+    def record(self, symbol: str, retry: int, time_waited: float, result):
+        with self.lock:
+            retry_stats = self.stats.setdefault(symbol, RetryStats())
+            retry_stats.number_orders += 1
+            retry_stats.number_retries += retry
+            retry_stats.max_retries = max(retry_stats.max_retries, retry)
+            retry_stats.time_waited += time_waited
+            if result is None or result.retcode != self.mt5.TRADE_RETCODE_DONE:
+                retry_stats.number_failures += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        retry statistics of every symbol
+        """
+        with self.lock:
+            return {symbol: retry_stats.summary() for symbol, retry_stats in self.stats.items()}
+
+
+# sender shared by every order of the bot
+order_sender = OrderSender()
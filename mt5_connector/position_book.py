@@ -0,0 +1,97 @@
+from threading import Lock
+from typing import Any, Dict, Optional
+import time
+
+try:
+    import MetaTrader5 as Mt5
+except:
+    Mt5 = None
+
+from mt5_connector.broker_cache import broker_cache
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+
+class PositionBook:
+    """
+    positions and pending orders of the account by ticket.
+
+    The book asks mt5 for every position and pending order at most once every
+    max_age seconds (once per cycle of the bot), so closing N trades costs one
+    synchronisation instead of N history requests. Between two synchronisations
+    the trades opened or closed by the bot are added or removed directly.
+
+    mt5_module can be any object with the positions_get and orders_get functions of MetaTrader5
+    """
+
+    def __init__(self, max_age: float = 1.0, mt5_module=None):
+        self.max_age = max_age
+        self.mt5_module = mt5_module
+        self.positions: Dict[int, Any] = {}
+        self.orders: Dict[int, Any] = {}
+        self.last_sync: Optional[float] = None
+        self.lock = Lock()
+
+    @property
+    def mt5(self):
+        # read at each call so that a broker installed after the import is used
+        return self.mt5_module if self.mt5_module is not None else Mt5
+
+    def is_fresh(self) -> bool:
+        return self.last_sync is not None and time.monotonic() - self.last_sync < self.max_age
+
+    def sync(self, force: bool = False) -> bool:
+        """
+        replace the tickets of the book by the ones of the broker if the book is
+        older than max_age (or if force), return True if the book was synchronised
+        """
+        with self.lock:
+            if not force and self.is_fresh():
+                return False
+            positions = self.mt5.positions_get()
+            orders = self.mt5.orders_get()
+            if positions is None or orders is None:
+                # the broker did not answer, the book stays as it is until the next call
+                return False
+            if not self.positions.keys() <= {position.ticket for position in positions}:
+                # a position was closed by the broker (SL, TP), the balance changed
+                broker_cache.invalidate_account()
+            self.positions = {position.ticket: position for position in positions}
+            self.orders = {order.ticket: order for order in orders}
+            self.last_sync = time.monotonic()
+            return True
+
+    def expire(self):
+        """
+        force the synchronisation at the next call of sync (at the start of a new cycle for instance)
+        """
+        self.last_sync = None
+
+    def is_on_going(self, ticket: int) -> bool:
+        return ticket in self.positions
+
+    def is_pending(self, ticket: int) -> bool:
+        return ticket in self.orders
+
+    def add(self, ticket: int, pending: bool, info: Any = None):
+        """
+        add a trade opened by the bot since the last synchronisation
+        """
+        with self.lock:
+            if pending:
+                self.orders[ticket] = info
+            else:
+                self.positions[ticket] = info
+
+    def remove(self, ticket: int):
+        """
+        remove a trade closed by the bot since the last synchronisation
+        """
+        with self.lock:
+            self.positions.pop(ticket, None)
+            self.orders.pop(ticket, None)
@@ -1,18 +1,15 @@
-from typing import Optional
+from typing import Dict, Optional
 
 try:
     import MetaTrader5 as Mt5
 except:
-    pass
-from pandas import DataFrame
+    Mt5 = None
 from termcolor import colored
 
 from mt5_connector.account import Account
-from tools.tools_trade import (
-    calc_position_size_forex,
-    get_order_history,
-    positions_get,
-)
+from mt5_connector.broker_cache import broker_cache
+from mt5_connector.order_sender import order_sender
+from tools.tools_trade import calc_position_size_forex
 
 __author__ = "Thibault Delrieu"
 __copyright__ = "Copyright 2021, Thibault Delrieu"
@@ -85,7 +82,7 @@ class Trade:
         my_account: Account,
         account_currency: Optional[str] = None,
         risk: Optional[float] = None,
-        account_currency_conversion: Optional[DataFrame] = None,
+        account_currency_conversion: Optional[Dict[str, float]] = None,
         size: Optional[float] = None,
         close_previous_pending_order: Optional[bool] = False,
     ) -> (bool, any):
@@ -100,7 +97,7 @@ class Trade:
             - sell stop
         """
 
-        symbol_info = Mt5.symbol_info(self.symbol)
+        symbol_info = broker_cache.symbol_info(self.symbol)
         symbol_is_real = self.check_symbol(symbol_info, self.symbol)
         if not symbol_is_real:
             return False, None
@@ -109,35 +106,20 @@ class Trade:
             print("You need to give a price for a pending order")
             return None
         if self.action == Mt5.TRADE_ACTION_DEAL:
-            self.finding_actual_price()
             self.request_open["deviation"] = 20
 
-        if size is None:
-            self.request_open["volume"] = self.finding_size(
-                account_currency, risk, account_currency_conversion
-            )
-        else:
-            self.request_open["volume"] = size
-
-        self.result_open_request = Mt5.order_send(self.request_open)
-        iterator = 0
-        while (
-            self.result_open_request.comment == "Requote"
-            or (self.result_open_request.comment == "Invalid price")
-            or (self.result_open_request.comment == "No prices")
-            or (self.result_open_request.comment == "Invalid volume")
-        ) and iterator < 50:
+        # the price of a deal and the size are found again before each retry
+        def refresh_request(request_open: dict):
             self.finding_actual_price()
-
             if size is None:
-                self.request_open["volume"] = self.finding_size(
+                request_open["volume"] = self.finding_size(
                     account_currency, risk, account_currency_conversion
                 )
             else:
-                self.request_open["volume"] = size
+                request_open["volume"] = size
 
-            self.result_open_request = Mt5.order_send(self.request_open)
-            iterator += 1
+        refresh_request(self.request_open)
+        self.result_open_request = order_sender.send(self.request_open, refresh_request)
         if self.result_open_request.retcode != Mt5.TRADE_RETCODE_DONE:
             print(
                 f"Failed to send order :(, retcode: {self.result_open_request.retcode}"
@@ -146,20 +128,24 @@ class Trade:
             return False, self.result_open_request
         else:
             self.ticket_order = self.result_open_request.order
+            # volume closed by close_position
+            self.size = self.result_open_request.volume
             print(colored("Order successfully placed!", "green"))
-            for ticket_order_pending, trade_pending in my_account.trade_pending.items():
-
-                if trade_pending.symbol == self.symbol and close_previous_pending_order:
-                    print(
-                        f"close previous pending order on {self.symbol} with ticket order {ticket_order_pending}"
-                    )
-                    trade_pending.close_position(my_account)
-                    break
-
-            if self.request_open["action"] == Mt5.TRADE_ACTION_PENDING:
-                my_account.trade_pending[self.ticket_order] = self
-            if self.request_open["action"] == Mt5.TRADE_ACTION_DEAL:
-                my_account.trade_on_going[self.ticket_order] = self
+            with my_account.lock:
+                for ticket_order_pending, trade_pending in list(my_account.trade_pending.items()):
+
+                    if trade_pending.symbol == self.symbol and close_previous_pending_order:
+                        print(
+                            f"close previous pending order on {self.symbol} with ticket order {ticket_order_pending}"
+                        )
+                        trade_pending.close_position(my_account)
+                        break
+
+                my_account.add_trade(
+                    self.ticket_order,
+                    self,
+                    pending=self.request_open["action"] == Mt5.TRADE_ACTION_PENDING,
+                )
 
             return True, self.result_open_request
 
@@ -178,11 +164,12 @@ class Trade:
         self,
         account_currency: str,
         risk: float,
-        account_currency_conversion,
+        account_currency_conversion: Optional[Dict[str, float]] = None,
     ) -> float:
         """
         in case of the size not specified by the user, we need to find the lot size of the order
-        thanks to the stop loss and the risk which is the purpose of this function
+        thanks to the stop loss and the risk which is the purpose of this function.
+        Without account_currency_conversion, the prices of the shared quote cache are used
         """
 
         difference_sl_price = abs(self.sl - self.price)
@@ -206,7 +193,7 @@ class Trade:
 
         if not symbol_info.visible:
             print(symbol, "is not visible, trying to switch on")
-            if not Mt5.symbol_select(symbol, True):
+            if not broker_cache.symbol_select(symbol):
                 print("symbol_select({}}) failed, exit", symbol)
                 return False
         return True
@@ -217,32 +204,9 @@ class Trade:
         and specify it in the my_account object inside the attribute :
             - my_account.trade_on_going
             - my_account.trade_pending
-        -
+        the position book of the account is only synchronised once per cycle
         """
-        history_trade = get_order_history()
-        all_trade_on_going = positions_get()
-
-        if all_trade_on_going.empty:
-            all_ticket_on_going_trade = ["No trade"]
-        else:
-            all_ticket_on_going_trade = list(all_trade_on_going["ticket"].iloc[:])
-
-        if history_trade.empty:
-            all_ticket_history_trade = ["No trade"]
-        else:
-            all_ticket_history_trade = list(history_trade["order"].iloc[:])
-
-        if self.ticket_order in all_ticket_history_trade:
-
-            if self.ticket_order in my_account.trade_on_going:
-                del my_account.trade_on_going[self.ticket_order]
-            if self.ticket_order in my_account.trade_pending:
-                del my_account.trade_pending[self.ticket_order]
-
-        if self.ticket_order in all_ticket_on_going_trade:
-            if self.ticket_order in my_account.trade_pending:
-                del my_account.trade_pending[self.ticket_order]
-                my_account.trade_on_going[self.ticket_order] = self
+        my_account.sync_trades()
 
     def close_position(self, my_account: Account) -> bool:
         """
@@ -293,26 +257,8 @@ class Trade:
             )
             return False
 
-        result_close_request = Mt5.order_send(close_request)
-        while (
-            result_close_request.comment == "Requote"
-            and self.request_open["action"] == Mt5.TRADE_ACTION_DEAL
-        ):
-            if (
-                self.order_type == Mt5.ORDER_TYPE_BUY
-                or self.order_type == Mt5.ORDER_TYPE_BUY_STOP
-                or self.order_type == Mt5.ORDER_TYPE_BUY_LIMIT
-            ):
-                price_close = Mt5.symbol_info_tick(self.symbol).bid
-                close_request["price"] = price_close
-            elif (
-                self.order_type == Mt5.ORDER_TYPE_SELL
-                or self.order_type == Mt5.ORDER_TYPE_SELL_STOP
-                or self.order_type == Mt5.ORDER_TYPE_SELL_LIMIT
-            ):
-                price_close = Mt5.symbol_info_tick(self.symbol).ask
-                close_request["price"] = price_close
-            result_close_request = Mt5.order_send(close_request)
+        # a requoted deal is sent again with the new price of the market
+        result_close_request = order_sender.send(close_request, retry_comments=("Requote",))
 
         if result_close_request.retcode != Mt5.TRADE_RETCODE_DONE:
             print(result_close_request)
@@ -320,8 +266,5 @@ class Trade:
             return False
         else:
             print("Order successfully closed!")
-            if close_request["action"] == Mt5.TRADE_ACTION_REMOVE:
-                del my_account.trade_pending[self.ticket_order]
-            if close_request["action"] == Mt5.TRADE_ACTION_DEAL:
-                del my_account.trade_on_going[self.ticket_order]
+            my_account.remove_trade(self.ticket_order)
             return True
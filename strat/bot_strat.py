@@ -1,15 +1,18 @@
-from typing import List, Optional, Union, Dict
-import time
+from typing import List, Optional, Dict
 
+import numpy as np
 import pandas as pd
-import schedule
 
-from const import TIMEFRAME_M1, ORDER_TYPE_BUY, ORDER_TYPE_SELL
+from const import TIMEFRAME_M1, ORDER_TYPE_BUY, ORDER_TYPE_SELL, NO_TRADE
 from tools.market_data import return_datas
-from tools.tools_trade import (positions_get, recup_all_symbol_conversion)
+from tools.live_candle_cache import live_candle_cache
+from tools.tools_trade import positions_get
 from mt5_connector.account import Account
 from tools.candle import Candle
+from tools.candle_window import CandleArrays
 from mt5_connector.trade import Trade
+from mt5_connector.live_runner import LiveRunner
+from backtest.trade_backtest import TradeBacktest
 
 try:
     from strat.my_bot_strat import live_trading_smart_money as bot_strategy
@@ -34,7 +37,7 @@ def bot_strategy(
     backtest_data: Optional[dict[str, pd.DataFrame]] = None,
     ema_list: Optional[List[int]] = [25, 50],
     bollinger_band: bool = False,
-) -> Optional[dict[str, Union[bool, str, float, int]]]:
+) -> Optional[TradeBacktest]:
     """
     put your strat here
     """
@@ -44,12 +47,9 @@ def bot_strategy(
     data = return_datas(
         [symbol], tf_list, False, ema_list, backtest_data, bollinger_band
     )
+    # the lot size is converted with the prices of the quote cache shared by every symbol
     account_currency_conversion = None
     if backtest_data is None:
-        symbol_broker_yaml = recup_all_symbol_conversion()
-        account_currency_conversion = return_datas(
-            symbol_broker_yaml["calcul_for_lot"], [TIMEFRAME_M1], True
-        )
         data_tf_1 = data[tf_list[0]][symbol]
     else:
         data_tf_1 = data[tf_list[0]]
@@ -110,24 +110,62 @@ def bot_strategy(
         if price is None:
             price = float(last_candle_first_tf.close)
         RR = float(abs(price - tp) / abs(price - sl))
-        info_trade = {
-            "order_type": order_type,
-            "date_entry": str(last_candle_first_tf.date),
-            "price": price,
-            "RR": RR,
-            "be": None,
-            "tp": float(tp),
-            "sl": float(sl),
-            "pending": False,
-            "on_going": True,
-            "sl_to_be": False,
-            "win": "On_going",
-            "comment": comment,
-        }
+        info_trade = TradeBacktest(
+            order_type=order_type,
+            date_entry=str(last_candle_first_tf.date),
+            price=price,
+            rr=RR,
+            be=None,
+            tp=float(tp),
+            sl=float(sl),
+            pending=False,
+            on_going=True,
+            sl_to_be=False,
+            comment=comment,
+        )
         return info_trade
     return None
 
 
+def bot_strategy_vectorized(
+    backtest_data: dict[str, CandleArrays],
+    tf_list: list[int] = [TIMEFRAME_M1],
+    ema_list: Optional[List[int]] = [25, 50],
+    **kwargs,
+) -> dict[str, np.ndarray]:
+    """
+    put the vectorized version of your strat here (only used by the backtest)
+
+    It is called once with all the candles of each TF (indicators included) inside
+    backtest_data["TF {time_frame}"] and return an array for each info of the trade
+    to take on each candle of the first TF:
+        - order_type: order type of the trade, NO_TRADE if there is no trade to take
+        - price (optional): price of a pending trade, nan for the close of the candle
+        - sl, tp
+        - be (optional): nan if the trade has no BE
+    It only works for strat which don't need to know the trades already taken
+    """
+    candles_first_tf = backtest_data[f"TF {tf_list[0]}"].columns
+    pips = 0.0001
+    close = candles_first_tf["close"]
+    ema = candles_first_tf[f"EMA{ema_list[0]}"]
+
+    # same strat as bot_strategy: only trade between 9H and 17H
+    candles_hour = pd.DatetimeIndex(candles_first_tf["time"]).hour.to_numpy()
+    trading_hours = (candles_hour >= 9) & (candles_hour <= 17)
+    buy = trading_hours & (close > ema)
+    sell = trading_hours & (close < ema)
+
+    order_type = np.full(len(close), NO_TRADE)
+    order_type[buy] = ORDER_TYPE_BUY
+    order_type[sell] = ORDER_TYPE_SELL
+    return {
+        "order_type": order_type,
+        "sl": np.where(buy, close - 3 * pips, close + 3 * pips),
+        "tp": np.where(buy, close + 6 * pips, close - 6 * pips),
+    }
+
+
 def take_trade(
     my_account: Account,
     pair: str,
@@ -139,7 +177,7 @@ def take_trade(
     sl: Optional[float],
     size: Optional[float],
     comment: str,
-    lot_all_pair: Dict[str, pd.DataFrame],
+    lot_all_pair: Optional[Dict[str, float]] = None,
 ):
     """
     create a new trade and open it
@@ -188,10 +226,14 @@ def manage_bot(trade_info: Optional[Dict] = None):
         return False
 
 
-def live_trading(account_currency: str, risk: float, symbols: List[str]):
+def live_trading(
+    account_currency: str, risk: float, symbols: List[str], resample_from_m1: bool = False
+):
     """
-    launch the bot every minute
+    launch the bot on each new candle of every symbol.
+    With resample_from_m1, only the M1 candles are asked to mt5 and the other TF are built from them
     """
+    live_candle_cache.configure(resample_from_m1=resample_from_m1)
     if PERSONAL_BOT:
         bot_strategy(account_currency, risk, symbols)
     else:
@@ -200,18 +242,14 @@ def live_trading(account_currency: str, risk: float, symbols: List[str]):
             original_risk=risk,
         )
         my_account.connect(credential="demo_account_test.yaml")
-        for symbol in symbols:
-            (
-                schedule.every(1)
-                .minutes.at(":01")
-                .do(
-                    bot_strategy,
-                    my_account,
-                    symbol,
-                    account_currency,
-                    risk,
-                )
-            )
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+        # each symbol is evaluated as soon as its candle is closed
+        live_runner = LiveRunner(
+            bot_strategy,
+            symbols,
+            strategy_kwargs={
+                "my_account": my_account,
+                "account_currency": account_currency,
+                "risk": risk,
+            },
+        )
+        live_runner.run()
@@ -1,5 +1,6 @@
-from typing import List, Optional, Union, Dict
+from typing import Iterator, List, Optional, Union, Dict
 
+import numpy as np
 import pandas as pd
 
 __author__ = "Thibault Delrieu"
@@ -9,6 +10,8 @@ __maintainer__ = "Thibault Delrieu"
 __email__ = "thibault.delrieu.pro@gmail.com"
 __status__ = "Production"
 
+PIPS = 0.0001
+
 
 class Candle:
     """
@@ -168,18 +171,162 @@ class Candle:
         return message
 
 
+class CandleView:
+    """
+    candle read lazily from one row of column arrays ({"close": array, ...} like
+    CandleArrays.columns), with the same attributes as Candle. Nothing is read
+    before an attribute is asked, so creating one only costs a small slotted object.
+
+    It can also be read like the row of a dataframe (candle_view["close"]),
+    so it can be given to Candle. Without ema_list, EMAs contains every EMA column,
+    and without minimum_rejection or body_min the rejections and the doji come from
+    the columns of tools.candle_patterns when they exist ("Unknown" otherwise)
+    """
+
+    __slots__ = (
+        "columns",
+        "index",
+        "ID",
+        "minimum_rejection",
+        "body_min",
+        "ema_list",
+        "engulfing_value",
+    )
+
+    def __init__(
+            self,
+            columns: Dict[str, np.ndarray],
+            index: int,
+            minimum_rejection: Optional[float] = None,
+            ema_list: Optional[List[int]] = None,
+            body_min: Optional[float] = None,
+            id_candle: Optional[int] = None,
+    ):
+        self.columns = columns
+        self.index = index
+        self.ID = id_candle
+        self.minimum_rejection = minimum_rejection
+        self.body_min = body_min
+        self.ema_list = ema_list
+        self.engulfing_value = None
+
+    def __getitem__(self, column: str):
+        value = self.columns[column][self.index]
+        if column == "time":
+            return pd.Timestamp(value)
+        return value
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    def keys(self) -> Iterator[str]:
+        return iter(self.columns)
+
+    def column_or_unknown(self, column: str):
+        if column in self.columns:
+            return bool(self.columns[column][self.index])
+        return "Unknown"
+
+    @property
+    def open(self):
+        return self.columns["open"][self.index]
+
+    @property
+    def close(self):
+        return self.columns["close"][self.index]
+
+    @property
+    def high(self):
+        return self.columns["high"][self.index]
+
+    @property
+    def low(self):
+        return self.columns["low"][self.index]
+
+    @property
+    def date(self) -> pd.Timestamp:
+        return pd.Timestamp(self.columns["time"][self.index])
+
+    @property
+    def body(self):
+        return self.close - self.open
+
+    @property
+    def bullish(self) -> bool:
+        return self.check_bullish_or_bearish()
+
+    @property
+    def EMAs(self) -> Optional[dict[int, any]]:
+        if self.ema_list is not None:
+            return {ema: self.columns[f"EMA{ema}"][self.index] for ema in self.ema_list}
+        emas = {
+            int(column[len("EMA"):]): values[self.index]
+            for column, values in self.columns.items()
+            if column.startswith("EMA")
+        }
+        return emas or None
+
+    @property
+    def upper_bollinger(self):
+        return self.columns["upper_bollinger"][self.index]
+
+    @property
+    def middle_bollinger(self):
+        return self.columns["middle_bollinger"][self.index]
+
+    @property
+    def lower_bollinger(self):
+        return self.columns["lower_bollinger"][self.index]
+
+    @property
+    def RSI(self):
+        return self.columns["RSI"][self.index]
+
+    @property
+    def high_rejection(self):
+        if self.minimum_rejection is None:
+            return self.column_or_unknown("high_rejection")
+        return self.is_rejection_wicks(self.minimum_rejection * PIPS)[0]
+
+    @property
+    def low_rejection(self):
+        if self.minimum_rejection is None:
+            return self.column_or_unknown("low_rejection")
+        return self.is_rejection_wicks(self.minimum_rejection * PIPS)[1]
+
+    @property
+    def doji(self):
+        if self.body_min is None or self.minimum_rejection is None:
+            return self.column_or_unknown("doji")
+        return self.check_doji(self.body_min * PIPS)
+
+    @property
+    def engulfing(self):
+        if self.engulfing_value is None:
+            return self.column_or_unknown("engulfing")
+        return self.engulfing_value
+
+    @engulfing.setter
+    def engulfing(self, value: bool):
+        self.engulfing_value = value
+
+    check_bullish_or_bearish = Candle.check_bullish_or_bearish
+    check_engulfing = Candle.check_engulfing
+    check_doji = Candle.check_doji
+    is_rejection_wicks = Candle.is_rejection_wicks
+    print_details = Candle.print_details
+
+
 def rebuild_candle(candles_workers: pd.DataFrame):
-    built_candle_dict = {"close": candles_workers["close"].iloc[-1]}
-    for number_candle, candle in enumerate(candles_workers.iloc()):
-        if number_candle == 0:
-            built_candle_dict["high"] = candle["high"]
-            built_candle_dict["low"] = candle["low"]
-            built_candle_dict["open"] = candle["open"]
-            built_candle_dict["time"] = candle["time"]
-        else:
-            if candle["high"] > built_candle_dict["high"]:
-                built_candle_dict["high"] = candle["high"]
-            if candle["low"] < built_candle_dict["low"]:
-                built_candle_dict["low"] = candle["low"]
+    """
+    build one candle from several candles of a lower TF
+    """
+    built_candle_dict = {
+        "time": candles_workers["time"].iloc[0],
+        "open": candles_workers["open"].iloc[0],
+        "high": candles_workers["high"].to_numpy().max(),
+        "low": candles_workers["low"].to_numpy().min(),
+        "close": candles_workers["close"].iloc[-1],
+    }
     built_candle = Candle(built_candle_dict)
     return built_candle
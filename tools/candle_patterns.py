@@ -0,0 +1,120 @@
+from typing import Dict, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+PIPS = 0.0001
+
+
+def bullish(open_price: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """
+    True for the bullish candles, like Candle.check_bullish_or_bearish
+    """
+    return close - open_price >= 0
+
+
+def engulfing(
+    open_price: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray
+) -> np.ndarray:
+    """
+    True for the candles engulfing the previous one, like Candle.check_engulfing.
+    The first candle has no previous candle and is never engulfing
+    """
+    is_bullish = bullish(open_price, close)
+    result = np.zeros(len(close), dtype=bool)
+    previous_bullish = is_bullish[:-1]
+    current_bullish = is_bullish[1:]
+    result[1:] = (current_bullish & ~previous_bullish & (close[1:] > high[:-1])) | (
+        ~current_bullish & previous_bullish & (close[1:] < low[:-1])
+    )
+    return result
+
+
+def rejection_wicks(
+    open_price: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    minimum_rejection: float,
+) -> (np.ndarray, np.ndarray):
+    """
+    high and low rejection wicks, like Candle.is_rejection_wicks (minimum_rejection in pips).
+    A wick is a rejection if it is longer than the minimum and the other wick
+    is not exactly the minimum
+    """
+    minimum_rejection_pips = minimum_rejection * PIPS
+    high_wick = high - np.maximum(open_price, close)
+    low_wick = np.minimum(open_price, close) - low
+    high_rejection = (high_wick > minimum_rejection_pips) & (
+        low_wick != minimum_rejection_pips
+    )
+    low_rejection = (low_wick > minimum_rejection_pips) & (
+        high_wick != minimum_rejection_pips
+    )
+    return high_rejection, low_rejection
+
+
+def doji(
+    open_price: np.ndarray,
+    close: np.ndarray,
+    high_rejection: np.ndarray,
+    low_rejection: np.ndarray,
+    body_min: float,
+) -> np.ndarray:
+    """
+    True for the doji candles, like Candle.check_doji (body_min in pips)
+    """
+    return (high_rejection | low_rejection) & (np.abs(close - open_price) <= body_min * PIPS)
+
+
+def candle_patterns(
+    data_candles: Mapping[str, np.ndarray],
+    minimum_rejection: Optional[float] = None,
+    body_min: Optional[float] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    compute the patterns of every candle at once from their columns (a dataframe,
+    a CandleWindow...). The rejections are only computed with minimum_rejection
+    and the doji with minimum_rejection and body_min, like in Candle
+    """
+    open_price = np.asarray(data_candles["open"], dtype=float)
+    high = np.asarray(data_candles["high"], dtype=float)
+    low = np.asarray(data_candles["low"], dtype=float)
+    close = np.asarray(data_candles["close"], dtype=float)
+    patterns = {
+        "bullish": bullish(open_price, close),
+        "engulfing": engulfing(open_price, high, low, close),
+    }
+    if minimum_rejection is not None:
+        patterns["high_rejection"], patterns["low_rejection"] = rejection_wicks(
+            open_price, high, low, close, minimum_rejection
+        )
+        if body_min is not None:
+            patterns["doji"] = doji(
+                open_price,
+                close,
+                patterns["high_rejection"],
+                patterns["low_rejection"],
+                body_min,
+            )
+    return patterns
+
+
+def add_candle_patterns(
+    data_candles: pd.DataFrame,
+    minimum_rejection: Optional[float] = None,
+    body_min: Optional[float] = None,
+) -> pd.DataFrame:
+    """
+    add the patterns of every candle as boolean columns
+    """
+    for name, values in candle_patterns(data_candles, minimum_rejection, body_min).items():
+        data_candles[name] = values
+    return data_candles
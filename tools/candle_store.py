@@ -0,0 +1,282 @@
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from tools.candle_window import CandleArrays
+from tools.market_data import load_data
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+# names of the columns of a month, in the order of the dataframe
+COLUMNS_FILE = "columns.txt"
+# every month of a symbol and a TF in one file by column, for the ranges over several months
+SERIES_FOLDER = "series"
+MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+
+
+class CandleStore:
+    """
+    candles stored on disk column by column, one folder by symbol, TF and month:
+
+        root/EURUSD/1/2021-01/time.npy
+        root/EURUSD/1/2021-01/close.npy
+        ...
+
+    The columns are opened as numpy memory maps, so only the months asked are
+    read and several processes reading the same files share the page cache.
+    A range over several months is read from the series folder, where every month
+    is written once in one file by column, so it is also a view over a memory map
+    """
+
+    def __init__(self, root: Union[Path, str]):
+        self.root = Path(root)
+
+    def write(self, symbol: str, time_frame: int, data_candles: pd.DataFrame):
+        """
+        save the candles of a symbol and a TF, merged with the candles already stored
+        """
+        months = data_candles["time"].dt.strftime("%Y-%m")
+        for month, data_month in data_candles.groupby(months):
+            path_month = self.root / symbol / str(time_frame) / month
+            if path_month.exists():
+                data_month = pd.concat([self.read_month(path_month), data_month])
+                data_month = data_month.drop_duplicates("time", keep="last")
+            data_month = data_month.sort_values("time")
+            path_month.mkdir(parents=True, exist_ok=True)
+            for name in data_month.columns:
+                column = data_month[name].to_numpy()
+                # view without the dtype metadata mt5 puts on the volumes
+                np.save(path_month / f"{name}.npy", column.view(np.dtype(column.dtype.str)))
+            (path_month / COLUMNS_FILE).write_text("\n".join(data_month.columns))
+        # the series is written again with the new months the next time it is read
+        shutil.rmtree(self.root / symbol / str(time_frame) / SERIES_FOLDER, ignore_errors=True)
+
+    def months(self, symbol: str, time_frame: int) -> List[str]:
+        """
+        return every month stored for a symbol and a TF
+        """
+        path_time_frame = self.root / symbol / str(time_frame)
+        if not path_time_frame.exists():
+            return []
+        return sorted(
+            path.name
+            for path in path_time_frame.iterdir()
+            if path.is_dir() and MONTH_PATTERN.match(path.name)
+        )
+
+    @staticmethod
+    def open_month(path_month: Path) -> Dict[str, np.ndarray]:
+        """
+        open every column of a month as a read only memory map
+        """
+        names = (path_month / COLUMNS_FILE).read_text().split("\n")
+        return {name: np.load(path_month / f"{name}.npy", mmap_mode="r") for name in names}
+
+    def open_series(self, symbol: str, time_frame: int) -> Dict[str, np.ndarray]:
+        """
+        open every month of a symbol and a TF as one memory map by column,
+        the series is written the first time it is asked after a write
+        """
+        path_series = self.root / symbol / str(time_frame) / SERIES_FOLDER
+        if not (path_series / COLUMNS_FILE).exists():
+            self.write_series(symbol, time_frame, path_series)
+        return self.open_month(path_series)
+
+    def write_series(self, symbol: str, time_frame: int, path_series: Path):
+        """
+        write the months one after the other in a temporary folder renamed at the end,
+        so the processes reading the store at the same time never see a partial series
+        """
+        path_time_frame = self.root / symbol / str(time_frame)
+        months = [self.open_month(path_time_frame / month) for month in self.months(symbol, time_frame)]
+        path_temporary = path_time_frame / f"{SERIES_FOLDER}.{os.getpid()}.tmp"
+        shutil.rmtree(path_temporary, ignore_errors=True)
+        path_temporary.mkdir()
+        for name, first_column in months[0].items():
+            series = np.lib.format.open_memmap(
+                path_temporary / f"{name}.npy",
+                mode="w+",
+                dtype=first_column.dtype,
+                shape=(sum(len(columns[name]) for columns in months),),
+            )
+            row = 0
+            for columns in months:
+                series[row: row + len(columns[name])] = columns[name]
+                row += len(columns[name])
+            series.flush()
+            del series
+        (path_temporary / COLUMNS_FILE).write_text("\n".join(months[0]))
+        try:
+            os.rename(path_temporary, path_series)
+        except OSError:
+            # written by another process in the meantime
+            shutil.rmtree(path_temporary, ignore_errors=True)
+
+    @staticmethod
+    def end_bound(date_to: Union[datetime, date, str]) -> Tuple[np.datetime64, str]:
+        """
+        last date read and the side of the search: a date without time
+        (a date or "2021-01-31") includes every candle of the day
+        """
+        end = pd.Timestamp(date_to)
+        if (isinstance(date_to, date) and not isinstance(date_to, datetime)) or (
+            isinstance(date_to, str) and len(date_to.strip()) <= len("2021-01-31")
+        ):
+            return (end + pd.Timedelta(days=1)).to_datetime64(), "left"
+        return end.to_datetime64(), "right"
+
+    def read_month(self, path_month: Path) -> pd.DataFrame:
+        return pd.DataFrame(
+            {name: np.array(column) for name, column in self.open_month(path_month).items()}
+        )
+
+    def read_arrays(
+        self,
+        symbol: str,
+        time_frame: int,
+        date_from: Optional[Union[datetime, str]] = None,
+        date_to: Optional[Union[datetime, str]] = None,
+    ) -> CandleArrays:
+        """
+        read the candles between date_from and date_to (included, the whole day for
+        a date without time). The arrays are read only views over the memory maps
+        of the month, or of the series when the candles are in several months
+        """
+        begin = None if date_from is None else pd.Timestamp(date_from).to_datetime64()
+        month_from = None if date_from is None else pd.Timestamp(date_from).strftime("%Y-%m")
+        month_to = None if date_to is None else pd.Timestamp(date_to).strftime("%Y-%m")
+        months = [
+            month
+            for month in self.months(symbol, time_frame)
+            if (month_from is None or month >= month_from)
+            and (month_to is None or month <= month_to)
+        ]
+        if not months:
+            raise FileNotFoundError(
+                f"no candles stored for {symbol} TF {time_frame} in {self.root}"
+            )
+        if len(months) == 1:
+            columns = self.open_month(self.root / symbol / str(time_frame) / months[0])
+        else:
+            columns = self.open_series(symbol, time_frame)
+        time = columns["time"]
+        first_row = 0 if begin is None else np.searchsorted(time, begin, side="left")
+        if date_to is None:
+            last_row = len(time)
+        else:
+            end, side = self.end_bound(date_to)
+            last_row = np.searchsorted(time, end, side=side)
+        return CandleArrays({name: column[first_row:last_row] for name, column in columns.items()})
+
+    def read(
+        self,
+        symbol: str,
+        time_frame: int,
+        date_from: Optional[Union[datetime, str]] = None,
+        date_to: Optional[Union[datetime, str]] = None,
+    ) -> pd.DataFrame:
+        """
+        read the candles between date_from and date_to (like read_arrays) as a dataframe
+        """
+        return self.read_arrays(symbol, time_frame, date_from, date_to).to_dataframe()
+
+    def load_arrays(
+        self,
+        symbol: str,
+        time_frames: List[int],
+        date_from: Optional[Union[datetime, str]] = None,
+        date_to: Optional[Union[datetime, str]] = None,
+    ) -> Dict[int, Dict[str, CandleArrays]]:
+        """
+        read the candles of every TF as views over the memory maps ({TF: {symbol: candles}})
+        """
+        return {
+            time_frame: {symbol: self.read_arrays(symbol, time_frame, date_from, date_to)}
+            for time_frame in time_frames
+        }
+
+    def load_data(
+        self,
+        symbol: str,
+        time_frames: List[int],
+        date_from: Optional[Union[datetime, str]] = None,
+        date_to: Optional[Union[datetime, str]] = None,
+    ) -> Dict[int, Dict[str, pd.DataFrame]]:
+        """
+        read the candles of every TF with the format of the pickle files ({TF: {symbol: candles}})
+        """
+        return {
+            time_frame: {symbol: self.read(symbol, time_frame, date_from, date_to)}
+            for time_frame in time_frames
+        }
+
+
+def convert_pickle_to_store(path_pickle: Union[Path, str], root: Union[Path, str]):
+    """
+    copy the candles of a pickle file ({TF: {symbol: candles}}) inside a CandleStore
+    """
+    candle_store = CandleStore(root)
+    for time_frame, data_candles_pairs in load_data(path_pickle).items():
+        for symbol, data_candles in data_candles_pairs.items():
+            candle_store.write(symbol, time_frame, data_candles)
+
+
+def load_candles(
+    path_data: Union[Path, str],
+    symbol: str,
+    time_frames: List[int],
+    date_from: Optional[Union[datetime, str]] = None,
+    date_to: Optional[Union[datetime, str]] = None,
+    as_arrays: bool = False,
+) -> Dict[int, Dict[str, Union[pd.DataFrame, CandleArrays]]]:
+    """
+    load the candles of a backtest either from a CandleStore folder (only the
+    symbol, the TF and the dates asked are read) or from a pickle file (read
+    entirely, then cut to the dates asked).
+    With as_arrays, the candles of a CandleStore are CandleArrays viewing its
+    memory maps, so the processes backtesting the same data share their pages
+    """
+    if Path(path_data).is_dir():
+        candle_store = CandleStore(path_data)
+        if as_arrays:
+            return candle_store.load_arrays(symbol, time_frames, date_from, date_to)
+        return candle_store.load_data(symbol, time_frames, date_from, date_to)
+    data_candles_all_tf = load_data(path_data)
+    if date_from is None and date_to is None:
+        return data_candles_all_tf
+    return {
+        time_frame: {
+            pair: select_dates(data_candles, date_from, date_to)
+            for pair, data_candles in data_candles_pairs.items()
+        }
+        for time_frame, data_candles_pairs in data_candles_all_tf.items()
+    }
+
+
+def select_dates(
+    data_candles: pd.DataFrame,
+    date_from: Optional[Union[datetime, str]] = None,
+    date_to: Optional[Union[datetime, str]] = None,
+) -> pd.DataFrame:
+    """
+    candles between date_from and date_to, with the bounds of CandleStore.read_arrays
+    """
+    selected = np.ones(len(data_candles), dtype=bool)
+    time = data_candles["time"].to_numpy()
+    if date_from is not None:
+        selected &= time >= pd.Timestamp(date_from).to_datetime64()
+    if date_to is not None:
+        end, side = CandleStore.end_bound(date_to)
+        selected &= time < end if side == "left" else time <= end
+    return data_candles[selected].reset_index(drop=True)
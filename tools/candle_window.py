@@ -0,0 +1,142 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from tools.candle import CandleView
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+
+class CandleArrays:
+    """
+    candles of one symbol and one TF stored as contiguous numpy arrays,
+    one array per column (time, open, high, low, close, indicators...)
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+        self.length = len(columns["time"])
+
+    @classmethod
+    def from_dataframe(cls, data_candles: pd.DataFrame) -> "CandleArrays":
+        """
+        copy once the columns of a dataframe of candles into contiguous arrays
+        """
+        columns = dict()
+        for name in data_candles.columns:
+            columns[name] = np.ascontiguousarray(data_candles[name].to_numpy())
+        return cls(columns)
+
+    def to_dataframe(self, begin: int = 0, end: Optional[int] = None) -> pd.DataFrame:
+        """
+        rebuild a dataframe with the candles between begin and end
+        """
+        return pd.DataFrame(
+            {name: column[begin:end] for name, column in self.columns.items()}
+        )
+
+    def window(self, begin: int = 0, end: int = 0) -> "CandleWindow":
+        """
+        return a window over the candles between begin and end (excluded)
+        """
+        return CandleWindow(self, begin, end)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def __len__(self) -> int:
+        return self.length
+
+
+class WindowIndexer:
+    """
+    give to CandleWindow the iloc[position] access of a dataframe
+    """
+
+    __slots__ = ("window",)
+
+    def __init__(self, window: "CandleWindow"):
+        self.window = window
+
+    def __getitem__(self, position: int) -> CandleView:
+        return self.window.row(position)
+
+
+class CandleWindow:
+    """
+    rolling window over CandleArrays, used by the backtest as an alternative to
+    the dataframes given to the strategy. Moving the window only changes two
+    integers and every column read is a numpy view, so nothing is copied.
+
+    window["close"] --> numpy view of the closes inside the window
+    window.iloc[-1] --> last candle of the window (CandleView)
+
+    Keep in mind the backtest moves the same window at each step: keep the
+    values you need and not the window itself between two steps
+    """
+
+    __slots__ = ("candle_arrays", "begin", "end", "iloc")
+
+    def __init__(self, candle_arrays: CandleArrays, begin: int = 0, end: int = 0):
+        self.candle_arrays = candle_arrays
+        self.begin = begin
+        self.end = end
+        self.iloc = WindowIndexer(self)
+
+    def move(self, begin: int, end: int):
+        """
+        move the window on the candles between begin and end (excluded)
+        """
+        self.begin = begin
+        self.end = end
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.candle_arrays.columns[column][self.begin: self.end]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.candle_arrays.columns
+
+    def __len__(self) -> int:
+        return self.end - self.begin
+
+    @property
+    def columns(self):
+        return self.candle_arrays.columns.keys()
+
+    @property
+    def empty(self) -> bool:
+        return self.end <= self.begin
+
+    def last(self, column: str):
+        """
+        return the value of the column for the last candle of the window
+        """
+        return self.candle_arrays.columns[column][self.end - 1]
+
+    def row(self, position: int) -> CandleView:
+        """
+        return the candle at the given position inside the window
+        (negative positions start from the end like with iloc)
+        """
+        if position < 0:
+            index = self.end + position
+        else:
+            index = self.begin + position
+        if index < self.begin or index >= self.end:
+            raise IndexError("position out of the candle window")
+        return CandleView(self.candle_arrays.columns, index)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        copy the candles of the window into a dataframe
+        """
+        return self.candle_arrays.to_dataframe(self.begin, self.end)
@@ -0,0 +1,296 @@
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+BOLLINGER_PERIOD = 20
+BOLLINGER_DEVIATION = 2
+RSI_PERIOD = 14
+
+
+class EMA:
+    """
+    EMA updated candle by candle, same values as ta.EMA: nan for the
+    period - 1 first candles, then started from the SMA of the period
+    """
+
+    __slots__ = ("period", "multiplier", "number_candles", "total", "value")
+
+    def __init__(self, period: int):
+        self.period = period
+        self.multiplier = 2 / (period + 1)
+        self.number_candles = 0
+        self.total = 0.0
+        self.value = np.nan
+
+    def update(self, close: float) -> float:
+        self.number_candles += 1
+        if self.number_candles < self.period:
+            self.total += close
+        elif self.number_candles == self.period:
+            self.value = (self.total + close) / self.period
+        else:
+            self.value = (close - self.value) * self.multiplier + self.value
+        return self.value
+
+
+class BollingerBands:
+    """
+    bollinger bands (SMA and population standard deviation) updated candle by candle
+    with running sums over the period, same values as ta.BBANDS with matype=0.
+    The sums are made on the distance to the first close to keep the precision of the variance
+    """
+
+    __slots__ = ("period", "deviation", "closes", "anchor", "total", "total_square")
+
+    def __init__(self, period: int = BOLLINGER_PERIOD, deviation: float = BOLLINGER_DEVIATION):
+        self.period = period
+        self.deviation = deviation
+        self.closes = deque()
+        self.anchor = None
+        self.total = 0.0
+        self.total_square = 0.0
+
+    def update(self, close: float) -> Tuple[float, float, float]:
+        """
+        return upper, middle and lower band
+        """
+        if self.anchor is None:
+            self.anchor = close
+        distance = close - self.anchor
+        self.closes.append(distance)
+        self.total += distance
+        self.total_square += distance * distance
+        if len(self.closes) > self.period:
+            oldest_distance = self.closes.popleft()
+            self.total -= oldest_distance
+            self.total_square -= oldest_distance * oldest_distance
+        if len(self.closes) < self.period:
+            return np.nan, np.nan, np.nan
+        mean_distance = self.total / self.period
+        variance = self.total_square / self.period - mean_distance * mean_distance
+        standard_deviation = np.sqrt(variance) if variance > 0 else 0.0
+        middle = self.anchor + mean_distance
+        return (
+            middle + self.deviation * standard_deviation,
+            middle,
+            middle - self.deviation * standard_deviation,
+        )
+
+
+class RSI:
+    """
+    RSI with the wilder smoothing updated candle by candle, same values as ta.RSI:
+    nan for the period first candles, then started from the mean gain and loss of the period
+    """
+
+    __slots__ = ("period", "previous_close", "number_changes", "gain", "loss", "value")
+
+    def __init__(self, period: int = RSI_PERIOD):
+        self.period = period
+        self.previous_close = None
+        self.number_changes = 0
+        self.gain = 0.0
+        self.loss = 0.0
+        self.value = np.nan
+
+    def update(self, close: float) -> float:
+        if self.previous_close is None:
+            self.previous_close = close
+            return self.value
+        change = close - self.previous_close
+        self.previous_close = close
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        self.number_changes += 1
+        if self.number_changes < self.period:
+            self.gain += gain
+            self.loss += loss
+            return self.value
+        if self.number_changes == self.period:
+            self.gain = (self.gain + gain) / self.period
+            self.loss = (self.loss + loss) / self.period
+        else:
+            self.gain = (self.gain * (self.period - 1) + gain) / self.period
+            self.loss = (self.loss * (self.period - 1) + loss) / self.period
+        total = self.gain + self.loss
+        self.value = 100 * self.gain / total if total != 0 else 0.0
+        return self.value
+
+
+class IndicatorSet:
+    """
+    indicators of one symbol and one TF, kept between two candles and keyed by
+    (name, params), so each new candle only costs an update of each indicator.
+    The values are named like the columns added by tools.market_data (EMA{n}, *_bollinger, RSI)
+    """
+
+    def __init__(
+        self,
+        ema_list: Optional[List[int]] = None,
+        bollinger_band: bool = False,
+        rsi: bool = False,
+    ):
+        self.indicators: Dict[tuple, object] = {}
+        for key in indicator_keys(ema_list, bollinger_band, rsi):
+            self.add(*key)
+
+    def add(self, name: str, *params):
+        """
+        return the indicator, created the first time it is asked
+        """
+        key = (name, *params)
+        if key not in self.indicators:
+            self.indicators[key] = INDICATORS[name](*params)
+        return self.indicators[key]
+
+    def columns(self, keys: Optional[List[tuple]] = None) -> List[str]:
+        return [
+            column
+            for key in (self.indicators if keys is None else keys)
+            for column in indicator_columns(*key)
+        ]
+
+    def update(self, close: float, keys: Optional[List[tuple]] = None) -> Dict[str, float]:
+        """
+        give a new closed candle to every indicator (or only to the keys given)
+        and return their new values
+        """
+        values = {}
+        for key in self.indicators if keys is None else keys:
+            indicator_values = self.indicators[key].update(close)
+            columns = indicator_columns(*key)
+            if len(columns) == 1:
+                values[columns[0]] = indicator_values
+            else:
+                values.update(zip(columns, indicator_values))
+        return values
+
+    def update_many(
+        self, closes: np.ndarray, keys: Optional[List[tuple]] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        give several closed candles in a row and return the values of each indicator on them
+        """
+        columns = {name: np.empty(len(closes)) for name in self.columns(keys)}
+        for row, close in enumerate(np.asarray(closes, dtype=float).tolist()):
+            for name, value in self.update(close, keys).items():
+                columns[name][row] = value
+        return columns
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self.indicators
+
+
+INDICATORS = {"EMA": EMA, "bollinger": BollingerBands, "RSI": RSI}
+
+
+def indicator_keys(
+    ema_list: Optional[List[int]] = None,
+    bollinger_band: bool = False,
+    rsi: bool = False,
+) -> List[tuple]:
+    """
+    (name, params) of the indicators asked with the arguments of get_data
+    """
+    keys = [("EMA", ema) for ema in (ema_list or [])]
+    if bollinger_band:
+        keys.append(("bollinger", BOLLINGER_PERIOD, BOLLINGER_DEVIATION))
+    if rsi:
+        keys.append(("RSI", RSI_PERIOD))
+    return keys
+
+
+def indicator_columns(name: str, *params) -> List[str]:
+    """
+    columns of the candles where the values of the indicator are stored
+    """
+    if name == "EMA":
+        return [f"EMA{params[0]}"]
+    if name == "bollinger":
+        return ["upper_bollinger", "middle_bollinger", "lower_bollinger"]
+    return [name]
+
+
+def seeded_ewm(values: np.ndarray, period: int, alpha: float) -> np.ndarray:
+    """
+    exponential smoothing of values[period - 1:] started from the mean of the
+    period first values, like EMA and the wilder smoothing of RSI
+    """
+    seeded = np.array(values[period - 1:], dtype=float)
+    seeded[0] = np.mean(values[:period])
+    return pd.Series(seeded).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+def ema_values(closes: np.ndarray, period: int) -> np.ndarray:
+    """
+    EMA on a whole series, same values as EMA updated candle by candle
+    """
+    values = np.full(len(closes), np.nan)
+    if len(closes) >= period:
+        values[period - 1:] = seeded_ewm(closes, period, 2 / (period + 1))
+    return values
+
+
+def bollinger_values(
+    closes: np.ndarray, period: int = BOLLINGER_PERIOD, deviation: float = BOLLINGER_DEVIATION
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    upper, middle and lower band on a whole series, same values as BollingerBands
+    """
+    rolling = pd.Series(closes, dtype=float).rolling(period)
+    middle = rolling.mean().to_numpy()
+    standard_deviation = rolling.std(ddof=0).to_numpy()
+    return (
+        middle + deviation * standard_deviation,
+        middle,
+        middle - deviation * standard_deviation,
+    )
+
+
+def rsi_values(closes: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """
+    RSI on a whole series, same values as RSI updated candle by candle
+    """
+    values = np.full(len(closes), np.nan)
+    if len(closes) <= period:
+        return values
+    changes = np.diff(np.asarray(closes, dtype=float))
+    gain = seeded_ewm(np.maximum(changes, 0), period, 1 / period)
+    loss = seeded_ewm(np.maximum(-changes, 0), period, 1 / period)
+    total = gain + loss
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values[period:] = np.where(total != 0, 100 * gain / total, 0.0)
+    return values
+
+
+VECTORIZED_INDICATORS = {"EMA": ema_values, "bollinger": bollinger_values, "RSI": rsi_values}
+
+
+def compute_indicators(
+    closes: np.ndarray,
+    ema_list: Optional[List[int]] = None,
+    bollinger_band: bool = False,
+    rsi: bool = False,
+) -> Dict[str, np.ndarray]:
+    """
+    compute the indicators on a whole series at once (used by the backtest),
+    with the same values as the indicators updated candle by candle by the live
+    """
+    closes = np.asarray(closes, dtype=float)
+    columns = {}
+    for name, *params in indicator_keys(ema_list, bollinger_band, rsi):
+        values = VECTORIZED_INDICATORS[name](closes, *params)
+        if isinstance(values, tuple):
+            columns.update(zip(indicator_columns(name, *params), values))
+        else:
+            columns[indicator_columns(name, *params)[0]] = values
+    return columns
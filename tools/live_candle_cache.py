@@ -0,0 +1,202 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import MetaTrader5 as Mt5
+except:
+    Mt5 = None
+import pandas as pd
+import pytz
+
+from const import TIMEFRAME_M1
+from tools.indicators import IndicatorSet, indicator_keys
+from tools.resample import COLUMN_AGGREGATIONS, CandleBuilder
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+
+class LiveCandleCache:
+    """
+    rolling buffer of the last closed candles of each (symbol, TF) for live trading.
+    The first call asks mt5 for the whole history from date_from, the next ones
+    only for the candles newer than the last candle cached.
+    The indicators of each (symbol, TF) keep their state between two calls and
+    are only updated with the new candles.
+
+    With resample_from_m1, only the M1 candles are asked to mt5 and the candles
+    of the other TF are built from them while they arrive.
+
+    mt5_module can be any object with the copy_rates_range function of MetaTrader5
+    (a fake broker for tests for instance)
+    """
+
+    def __init__(
+        self,
+        max_candles: int = 5_000,
+        resample_from_m1: bool = False,
+        mt5_module=None,
+    ):
+        self.max_candles = max_candles
+        self.mt5_module = mt5_module
+        self.buffers: Dict[Tuple[str, int], pd.DataFrame] = {}
+        self.indicators: Dict[Tuple[str, int], IndicatorSet] = {}
+        self.resample_from_m1 = resample_from_m1
+        self.candle_builders: Dict[Tuple[str, int], CandleBuilder] = {}
+        self.last_m1_time: Dict[Tuple[str, int], pd.Timestamp] = {}
+
+    def configure(self, max_candles: int = 5_000, resample_from_m1: bool = False):
+        """
+        change the options of the cache, the candles and indicators already cached are dropped
+        """
+        self.max_candles = max_candles
+        self.resample_from_m1 = resample_from_m1
+        self.buffers.clear()
+        self.indicators.clear()
+        self.candle_builders.clear()
+        self.last_m1_time.clear()
+
+    @property
+    def mt5(self):
+        # read at each call so that a broker installed after the import is used
+        return self.mt5_module if self.mt5_module is not None else Mt5
+
+    def get(
+        self,
+        symbol: str,
+        time_frame: int,
+        date_from: datetime,
+        date_to: datetime,
+        ema_list: Optional[List[int]] = None,
+        bollinger_band: bool = False,
+        rsi: bool = False,
+    ) -> pd.DataFrame:
+        """
+        return the closed candles of the symbol until date_to with the indicators asked,
+        date_from is only used the first time the (symbol, TF) is asked.
+        The dataframe returned is the buffer of the cache, don't modify it
+        """
+        key = (symbol, time_frame)
+        if self.resample_from_m1 and time_frame != TIMEFRAME_M1:
+            buffer = self.build_from_m1(key, date_from, date_to)
+        else:
+            buffer = self.update_buffer(key, date_from, date_to)
+        buffer = self.add_missing_indicators(key, buffer, ema_list, bollinger_band, rsi)
+        self.buffers[key] = buffer
+        return buffer
+
+    def update_buffer(
+        self, key: Tuple[str, int], date_from: datetime, date_to: datetime
+    ) -> pd.DataFrame:
+        """
+        return the buffer with the candles closed since the last call
+        """
+        symbol, time_frame = key
+        buffer = self.buffers.get(key)
+        if buffer is None or buffer.empty:
+            buffer = self.fetch(symbol, time_frame, date_from, date_to)
+            if len(buffer.index) > self.max_candles:
+                buffer = buffer.iloc[-self.max_candles:].reset_index(drop=True)
+        else:
+            last_time = buffer["time"].iloc[-1]
+            date_from = datetime.fromtimestamp(
+                last_time.value // 1_000_000_000 + 1, tz=pytz.utc
+            )
+            new_candles = self.fetch(symbol, time_frame, date_from, date_to)
+            new_candles = new_candles[new_candles["time"] > last_time]
+            if not new_candles.empty:
+                buffer = self.append(key, buffer, new_candles)
+        return buffer
+
+    def build_from_m1(
+        self, key: Tuple[str, int], date_from: datetime, date_to: datetime
+    ) -> pd.DataFrame:
+        """
+        return the buffer of a higher TF with the candles closed by the M1 candles
+        arrived since the last call
+        """
+        symbol, time_frame = key
+        key_m1 = (symbol, TIMEFRAME_M1)
+        buffer_m1 = self.update_buffer(key_m1, date_from, date_to)
+        self.buffers[key_m1] = buffer_m1
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            self.candle_builders[key] = CandleBuilder(time_frame)
+            buffer = pd.DataFrame()
+        if key in self.last_m1_time:
+            buffer_m1 = buffer_m1[buffer_m1["time"] > self.last_m1_time[key]]
+        if buffer_m1.empty:
+            return buffer
+        self.last_m1_time[key] = buffer_m1["time"].iloc[-1]
+        # the indicators of the M1 candles are not merged
+        columns = ["time", *[name for name in COLUMN_AGGREGATIONS if name in buffer_m1]]
+        new_candles = self.candle_builders[key].update_many(buffer_m1[columns])
+        if buffer.empty:
+            return new_candles
+        if new_candles.empty:
+            return buffer
+        return self.append(key, buffer, new_candles)
+
+    def fetch(
+        self, symbol: str, time_frame: int, date_from: datetime, date_to: datetime
+    ) -> pd.DataFrame:
+        """
+        ask mt5 for the candles between the dates, without the candle not closed yet
+        """
+        rates = self.mt5.copy_rates_range(symbol, time_frame, date_from, date_to)
+        if rates is None or len(rates) == 0:
+            return pd.DataFrame()
+        rates_frame = pd.DataFrame(rates)
+        rates_frame["time"] = pd.to_datetime(rates_frame["time"], unit="s")
+        rates_frame.drop(rates_frame.tail(1).index, inplace=True)
+        return rates_frame
+
+    def append(
+        self, key: Tuple[str, int], buffer: pd.DataFrame, new_candles: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        add the new candles at the end of the buffer, the indicators of the (symbol, TF)
+        are only updated with the closes of the new candles
+        """
+        indicator_set = self.indicators.get(key)
+        if indicator_set is not None:
+            new_values = indicator_set.update_many(new_candles["close"].to_numpy())
+            new_candles = new_candles.assign(**new_values)
+        buffer = pd.concat([buffer, new_candles], ignore_index=True)
+        if len(buffer.index) > self.max_candles:
+            buffer = buffer.iloc[-self.max_candles:].reset_index(drop=True)
+        return buffer
+
+    def add_missing_indicators(
+        self,
+        key: Tuple[str, int],
+        buffer: pd.DataFrame,
+        ema_list: Optional[List[int]],
+        bollinger_band: bool,
+        rsi: bool,
+    ) -> pd.DataFrame:
+        """
+        create the indicators asked for the first time and give them every candle of the buffer
+        """
+        if buffer.empty:
+            return buffer
+        indicator_set = self.indicators.setdefault(key, IndicatorSet())
+        new_keys = [
+            indicator_key
+            for indicator_key in indicator_keys(ema_list, bollinger_band, rsi)
+            if indicator_key not in indicator_set
+        ]
+        if not new_keys:
+            return buffer
+        for indicator_key in new_keys:
+            indicator_set.add(*indicator_key)
+        new_values = indicator_set.update_many(buffer["close"].to_numpy(), new_keys)
+        return buffer.assign(**new_values)
+
+
+# cache shared by every live call of get_data, its options are set by configure
+live_candle_cache = LiveCandleCache()
@@ -1,9 +1,6 @@
 from typing import List, Dict, Optional, Union
 from datetime import datetime, timedelta
-try:
-    import MetaTrader5 as Mt5
-except:
-    pass
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import pickle as pck
@@ -18,6 +15,11 @@ __email__ = "thibault.delrieu.pro@gmail.com"
 __status__ = "Production"
 
 from const import TIMEFRAME_M1
+from tools.candle_patterns import add_candle_patterns, candle_patterns
+from tools.candle_window import CandleArrays
+from tools.indicators import compute_indicators
+from tools.live_candle_cache import live_candle_cache
+from tools.profiler import profile_phase
 
 
 def get_data(
@@ -48,21 +50,31 @@ def get_data(
                 hour=date_to.hour,
                 minute=date_to.minute,
             )
-            rates = Mt5.copy_rates_range(pair, time_frame, utc_from, date_to)
-            rates_frame = pd.DataFrame(rates)
-            rates_frame["time"] = pd.to_datetime(rates_frame["time"], unit="s")
-            rates_frame.drop(rates_frame.tail(1).index, inplace=True)
-            pair_data[pair] = rates_frame
+            # only the candles newer than the last call are asked to mt5,
+            # the indicators are updated on them by the cache
+            pair_data[pair] = live_candle_cache.get(
+                pair,
+                time_frame,
+                utc_from,
+                date_to,
+                ema_list,
+                bollinger_band,
+                rsi,
+            )
+        return pair_data
     else:
         pair_data = backtest_data[f"TF {time_frame}"]
 
     if ema_list is not None:
         for ema in ema_list:
+            if backtest and f"EMA{ema}" in pair_data:
+                # already computed once on the whole series by the backtest
+                continue
             pair_data = add_ema_to_data(pair_data, backtest=backtest, ema=ema)
-    if bollinger_band:
+    if bollinger_band and not (backtest and "middle_bollinger" in pair_data):
         pair_data = add_bollinger_to_data(pair_data, backtest=backtest)
 
-    if rsi:
+    if rsi and not (backtest and "RSI" in pair_data):
         pair_data = add_rsi_to_data(pair_data, backtest=backtest)
     return pair_data
 
@@ -97,20 +109,21 @@ def return_datas(
         backtest = False
     data_candles_all_tf = dict()
     date_to = datetime.now().astimezone(pytz.timezone("Etc/GMT-5"))
-    for TF in tf_list:
-        tf_from_date = get_time_frame_needed(TF)
-        for time_frame, from_date in tf_from_date.items():
-            data_candles_all_tf[time_frame] = get_data(
-                symbols,
-                time_frame,
-                from_date,
-                date_to,
-                ema_list,
-                backtest,
-                backtest_data,
-                bollinger_band,
-                rsi,
-            )
+    with profile_phase("return_datas"):
+        for TF in tf_list:
+            tf_from_date = get_time_frame_needed(TF)
+            for time_frame, from_date in tf_from_date.items():
+                data_candles_all_tf[time_frame] = get_data(
+                    symbols,
+                    time_frame,
+                    from_date,
+                    date_to,
+                    ema_list,
+                    backtest,
+                    backtest_data,
+                    bollinger_band,
+                    rsi,
+                )
     if datas_for_lot:
         last_row_lot_all_pair = dict()
         for tf, data_candles in data_candles_all_tf.items():
@@ -193,10 +206,73 @@ def add_rsi_to_data(
     return data_candles_all_tf
 
 
-def save_data(data: Dict[str, pd.DataFrame], path_output: Path):
+def add_indicators_to_data(
+    data_candles: pd.DataFrame,
+    ema_list: Optional[List[int]] = None,
+    bollinger_band: bool = False,
+    rsi: bool = False,
+    patterns: bool = False,
+    minimum_rejection: Optional[float] = None,
+    body_min: Optional[float] = None,
+) -> pd.DataFrame:
     """
-    Export pandas data to a file with pickle.
+    add every requested indicator to the candles of one symbol and one TF,
+    with the candle patterns of tools.candle_patterns if asked.
+    Used by the backtest to compute the indicators once on the whole series
+    instead of recomputing them on each window given to the strategy, with
+    vectorized kernels giving the same values as the indicators of the live
     """
+    indicator_values = compute_indicators(
+        data_candles["close"].to_numpy(), ema_list, bollinger_band, rsi
+    )
+    for column, values in indicator_values.items():
+        data_candles[column] = values
+    if patterns:
+        data_candles = add_candle_patterns(data_candles, minimum_rejection, body_min)
+    return data_candles
+
+
+def add_indicators_to_arrays(
+    candle_arrays: CandleArrays,
+    ema_list: Optional[List[int]] = None,
+    bollinger_band: bool = False,
+    rsi: bool = False,
+    patterns: bool = False,
+    minimum_rejection: Optional[float] = None,
+    body_min: Optional[float] = None,
+) -> CandleArrays:
+    """
+    same as add_indicators_to_data on CandleArrays: the columns of the candles
+    are shared with the new CandleArrays (views over the memory maps of a
+    CandleStore stay views), only the indicators are new arrays
+    """
+    columns = dict(candle_arrays.columns)
+    columns.update(
+        compute_indicators(
+            np.asarray(candle_arrays["close"], dtype=float), ema_list, bollinger_band, rsi
+        )
+    )
+    if patterns:
+        columns.update(candle_patterns(candle_arrays, minimum_rejection, body_min))
+    return CandleArrays(columns)
+
+
+def save_data(
+    data: Dict[int, Dict[str, pd.DataFrame]], path_output: Path, store: bool = False
+):
+    """
+    Export pandas data ({TF: {symbol: candles}}) to a file with pickle, or with store
+    to a CandleStore whose root folder is path_output (merged with the candles already in it).
+    """
+    if store:
+        # candle_store reads the pickle files with load_data
+        from tools.candle_store import CandleStore
+
+        candle_store = CandleStore(path_output)
+        for time_frame, data_candles_pairs in data.items():
+            for symbol, data_candles in data_candles_pairs.items():
+                candle_store.write(symbol, time_frame, data_candles)
+        return None
     with open(path_output, "wb") as file:
         pck.dump(data, file)
 
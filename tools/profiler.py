@@ -0,0 +1,229 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import cProfile
+import time
+import tracemalloc
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+
+# profiling of the backtests created without the profile argument, set by enable_profiling
+PROFILING = {"enabled": False, "cprofile_path": None, "memory": False}
+BYTES_PER_KIB = 1024
+
+
+def enable_profiling(cprofile_path: Optional[Union[Path, str]] = None, memory: bool = False):
+    """
+    profile every backtest created afterwards without the profile argument
+    (main.py --profile, and --profile_memory for memory), whatever the function creating it
+    """
+    PROFILING["enabled"] = True
+    PROFILING["cprofile_path"] = cprofile_path
+    PROFILING["memory"] = memory
+
+
+class Phase:
+    """
+    timings of one phase of the backtest, used as a context manager around the phase.
+    With memory_peaks (the memory mode of the profiler, tracemalloc tracing), the
+    memory allocated by the phase is also measured:
+        - net_memory: bytes allocated and not freed by the calls of the phase
+        - peak_memory: the most bytes held by one call above the memory at its start
+    memory_peaks is the stack of the peaks of the phases in progress, tracemalloc
+    has only one peak which is reset at the start of each phase
+    """
+
+    __slots__ = (
+        "name",
+        "calls",
+        "total",
+        "max",
+        "begin",
+        "memory_peaks",
+        "net_memory",
+        "peak_memory",
+        "begin_memory",
+    )
+
+    def __init__(self, name: str, memory_peaks: Optional[List[int]] = None):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.begin = 0.0
+        self.memory_peaks = memory_peaks
+        self.net_memory = 0
+        self.peak_memory = 0
+        self.begin_memory = 0
+
+    def __enter__(self):
+        if self.memory_peaks is not None:
+            self.begin_memory, peak = tracemalloc.get_traced_memory()
+            if self.memory_peaks:
+                self.memory_peaks[-1] = max(self.memory_peaks[-1], peak)
+            self.memory_peaks.append(0)
+            tracemalloc.reset_peak()
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.begin
+        if self.memory_peaks is not None:
+            memory, peak = tracemalloc.get_traced_memory()
+            peak = max(self.memory_peaks.pop(), peak)
+            if self.memory_peaks:
+                self.memory_peaks[-1] = max(self.memory_peaks[-1], peak)
+            self.net_memory += memory - self.begin_memory
+            self.peak_memory = max(self.peak_memory, peak - self.begin_memory)
+        self.calls += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        return False
+
+
+class NullPhase:
+    """
+    phase of a disabled profiler, does nothing
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class BacktestProfiler:
+    """
+    cumulative and per step timings of the phases of a backtest (windows, strategy,
+    management of the trades...), opened with:
+
+        with profiler.phase("strategy"):
+            ...
+
+    The phases can be nested, the time of a phase then includes the time of the
+    phases inside it. With cprofile_path, the whole run is also profiled by cProfile
+    and its stats are dumped in this file (read them with pstats or snakeviz).
+    With memory, the memory allocated by each phase is measured with tracemalloc,
+    which slows down the run (the timings are then only comparable between them).
+    Without enabled, the profiling set by enable_profiling is used
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = True,
+        cprofile_path: Optional[Union[Path, str]] = None,
+        memory: bool = False,
+    ):
+        if enabled is None:
+            enabled = PROFILING["enabled"]
+            cprofile_path = cprofile_path or PROFILING["cprofile_path"]
+            memory = memory or PROFILING["memory"]
+        self.enabled = enabled
+        self.cprofile_path = cprofile_path
+        self.memory = memory
+        self.phases: Dict[str, Phase] = {}
+        self.profile: Optional[cProfile.Profile] = None
+        # peaks of the phases in progress, in memory mode
+        self.memory_peaks: Optional[List[int]] = [] if memory else None
+        self.tracing_started = False
+        self.begin = 0.0
+        self.duration = 0.0
+
+    def phase(self, name: str) -> Union[Phase, NullPhase]:
+        if not self.enabled:
+            return NULL_PHASE
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase(name, self.memory_peaks)
+        return phase
+
+    def start(self):
+        """
+        start the timer of the run (and cProfile)
+        """
+        global current_profiler
+        current_profiler = self
+        if not self.enabled:
+            return
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing_started = True
+        if self.cprofile_path is not None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.begin = time.perf_counter()
+
+    def stop(self):
+        """
+        stop the timer of the run, dump the stats of cProfile if asked
+        """
+        global current_profiler
+        current_profiler = NULL_PROFILER
+        if not self.enabled:
+            return
+        self.duration += time.perf_counter() - self.begin
+        if self.profile is not None:
+            self.profile.disable()
+            Path(self.cprofile_path).parent.mkdir(parents=True, exist_ok=True)
+            self.profile.dump_stats(str(self.cprofile_path))
+            self.profile = None
+        if self.tracing_started:
+            tracemalloc.stop()
+            self.tracing_started = False
+
+    def create_message(self) -> str:
+        """
+        create a string message with the breakdown of the time of the run by phase
+        """
+        if not self.enabled:
+            return ""
+        one_hundred = 100
+        header = f"{'phase':<16}{'calls':>10}{'total s':>10}{'%':>7}{'mean us':>11}{'max us':>11}"
+        if self.memory:
+            header += f"{'net KiB':>11}{'peak KiB':>11}"
+        lines = [f"Profile of the run: {self.duration:.3f} s", header]
+        for phase in sorted(self.phases.values(), key=lambda phase: phase.total, reverse=True):
+            mean = phase.total / phase.calls if phase.calls else 0.0
+            percentage = phase.total / self.duration * one_hundred if self.duration else 0.0
+            line = (
+                f"{phase.name:<16}{phase.calls:>10}{phase.total:>10.3f}{percentage:>7.1f}"
+                f"{mean * 1e6:>11.1f}{phase.max * 1e6:>11.1f}"
+            )
+            if self.memory:
+                line += (
+                    f"{phase.net_memory / BYTES_PER_KIB:>11.1f}"
+                    f"{phase.peak_memory / BYTES_PER_KIB:>11.1f}"
+                )
+            lines.append(line)
+        if self.memory:
+            lines.append(
+                "net KiB: memory allocated and not freed by the phase, peak KiB: most memory "
+                "held by one call of the phase (tracemalloc, the timings include its overhead)"
+            )
+        if self.cprofile_path is not None:
+            lines.append(f"cProfile stats dumped in {self.cprofile_path}")
+        return "\n".join(lines) + f"\n\n{'-'*one_hundred}\n\n"
+
+
+NULL_PROFILER = BacktestProfiler(enabled=False)
+# profiler of the run in progress, used by the tools called by the strategy (return_datas)
+current_profiler = NULL_PROFILER
+
+
+def profile_phase(name: str) -> Union[Phase, NullPhase]:
+    """
+    phase of the profiler of the run in progress
+    """
+    return current_profiler.phase(name)
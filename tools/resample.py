@@ -0,0 +1,163 @@
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from const import TIMEFRAME_M1
+from tools.candle_window import CandleArrays
+
+__author__ = "Thibault Delrieu"
+__copyright__ = "Copyright 2021, Thibault Delrieu"
+__license__ = "MIT"
+__maintainer__ = "Thibault Delrieu"
+__email__ = "thibault.delrieu.pro@gmail.com"
+__status__ = "Production"
+
+# the TF of mt5 in hours are 0x4000 + number of hours (TIMEFRAME_H1 = 16385)
+HOURS_TIME_FRAME_FLAG = 0x4000
+MINUTES_PER_HOUR = 60
+NANOSECONDS_PER_MINUTE = 60_000_000_000
+
+# how each column of the candles of mt5 is merged inside a candle of a higher TF
+COLUMN_AGGREGATIONS = {
+    "open": "first",
+    "high": "max",
+    "low": "min",
+    "close": "last",
+    "tick_volume": "sum",
+    "spread": "min",
+    "real_volume": "sum",
+}
+
+
+def time_frame_minutes(time_frame: int) -> int:
+    """
+    number of minutes of a TF of mt5 (TIMEFRAME_M15 --> 15, TIMEFRAME_H4 --> 240)
+    """
+    if time_frame & HOURS_TIME_FRAME_FLAG:
+        return (time_frame - HOURS_TIME_FRAME_FLAG) * MINUTES_PER_HOUR
+    return time_frame
+
+
+def resample_arrays(columns: Dict[str, np.ndarray], minutes: int) -> Dict[str, np.ndarray]:
+    """
+    build in one pass the candles of minutes from sorted candles of a lower TF (M1 usually).
+    The candles are aligned on the days like mt5 (M5 at 10:00, 10:05..., H4 at 0H, 4H...)
+    and a candle is dated at the beginning of its period, even if the first minutes are missing
+    """
+    time = np.asarray(columns["time"], dtype="datetime64[ns]")
+    if len(time) == 0:
+        return {name: np.asarray(column)[:0] for name, column in columns.items()}
+    period = time.view(np.int64) // (minutes * NANOSECONDS_PER_MINUTE)
+    starts = np.flatnonzero(np.diff(period, prepend=period[0] - 1))
+    ends = np.append(starts[1:], len(time))
+    resampled = {
+        "time": (period[starts] * minutes * NANOSECONDS_PER_MINUTE).astype("datetime64[ns]")
+    }
+    for name, column in columns.items():
+        if name == "time":
+            continue
+        column = np.asarray(column)
+        aggregation = COLUMN_AGGREGATIONS.get(name, "last")
+        if aggregation == "first":
+            resampled[name] = column[starts]
+        elif aggregation == "last":
+            resampled[name] = column[ends - 1]
+        elif aggregation == "max":
+            resampled[name] = np.maximum.reduceat(column, starts)
+        elif aggregation == "min":
+            resampled[name] = np.minimum.reduceat(column, starts)
+        else:
+            resampled[name] = np.add.reduceat(column, starts)
+    return resampled
+
+
+def resample_candles(
+    data_candles: Union[pd.DataFrame, CandleArrays], time_frame: int
+) -> Union[pd.DataFrame, CandleArrays]:
+    """
+    build the candles of a TF of mt5 from the candles of a lower TF, as a dataframe
+    or as CandleArrays like the candles given.
+    Only the columns of mt5 are kept, the indicators need to be computed on the new candles
+    """
+    columns = {
+        name: np.asarray(data_candles[name])
+        for name in ["time", *COLUMN_AGGREGATIONS]
+        if name in data_candles
+    }
+    resampled = resample_arrays(columns, time_frame_minutes(time_frame))
+    if isinstance(data_candles, CandleArrays):
+        return CandleArrays(resampled)
+    return pd.DataFrame(resampled)
+
+
+def resample_all_time_frames(
+    data_candles_m1: Union[pd.DataFrame, CandleArrays], time_frames: List[int]
+) -> Dict[int, Union[pd.DataFrame, CandleArrays]]:
+    """
+    candles of every TF asked built from the M1 candles
+    """
+    return {
+        time_frame: data_candles_m1
+        if time_frame == TIMEFRAME_M1
+        else resample_candles(data_candles_m1, time_frame)
+        for time_frame in time_frames
+    }
+
+
+class CandleBuilder:
+    """
+    build the candles of a higher TF while the M1 candles arrive.
+    A candle is closed when the last minute of its period is received,
+    or when the first M1 candle of the next period arrives if minutes are missing
+    """
+
+    def __init__(self, time_frame: int):
+        self.time_frame = time_frame
+        self.period = pd.Timedelta(minutes=time_frame_minutes(time_frame))
+        self.current: Optional[dict] = None
+        self.period_end: Optional[pd.Timestamp] = None
+
+    def update(self, candle: dict) -> List[dict]:
+        """
+        add a closed M1 candle ({"time": ..., "open": ...}) to the candle in
+        progress and return the candles of the higher TF closed by it
+        """
+        closed_candles = []
+        time = pd.Timestamp(candle["time"])
+        if self.current is not None and time >= self.period_end:
+            closed_candles.append(self.current)
+            self.current = None
+        if self.current is None:
+            period_start = time.floor(self.period)
+            self.period_end = period_start + self.period
+            self.current = {name: value for name, value in candle.items()}
+            self.current["time"] = period_start
+        else:
+            for name, value in candle.items():
+                aggregation = COLUMN_AGGREGATIONS.get(name, "last")
+                if name == "time" or aggregation == "first":
+                    continue
+                if aggregation == "max":
+                    self.current[name] = max(self.current[name], value)
+                elif aggregation == "min":
+                    self.current[name] = min(self.current[name], value)
+                elif aggregation == "sum":
+                    self.current[name] += value
+                else:
+                    self.current[name] = value
+        if time + pd.Timedelta(minutes=1) >= self.period_end:
+            closed_candles.append(self.current)
+            self.current = None
+        return closed_candles
+
+    def update_many(self, data_candles: pd.DataFrame) -> pd.DataFrame:
+        """
+        add several M1 candles and return the candles of the higher TF closed by them
+        """
+        closed_candles = []
+        for candle in data_candles.to_dict("records"):
+            closed_candles.extend(self.update(candle))
+        return pd.DataFrame(closed_candles, columns=data_candles.columns).astype(
+            data_candles.dtypes.to_dict()
+        )
@@ -1,18 +1,21 @@
-from typing import Dict, List, Optional
-from copy import deepcopy
+from typing import Dict, List, Optional, Set
+from functools import lru_cache
+from threading import Lock
 
 import pytz
 from datetime import datetime, timedelta
 try:
     import MetaTrader5 as Mt5
 except:
-    pass
+    Mt5 = None
 import pandas as pd
 import yaml
 from pathlib import Path
 from termcolor import colored
 
 from mt5_connector.account import Account
+from mt5_connector.broker_cache import broker_cache
+from mt5_connector.order_sender import order_sender
 __author__ = "Thibault Delrieu"
 __copyright__ = "Copyright 2021, Thibault Delrieu"
 __license__ = "MIT"
@@ -46,28 +49,30 @@ def calc_lot_forex(
 
 
 def calc_account_currency_conversion(
-    account_currency: str, symbol: str, current_price_symbols: Dict
+    account_currency: str,
+    symbol: str,
+    current_price_symbols: Optional[Dict[str, float]] = None,
 ):
     """
-    calculate the price conversion between the traded symbol and your account currency
+    calculate the price conversion between the traded symbol and your account currency.
+    current_price_symbols is the last price of the conversion symbols,
+    the prices of quote_cache are used by default
     """
+    if current_price_symbols is None:
+        current_price_symbols = quote_cache.get_quotes()
     currency_2 = symbol[3:6]
     other_character = symbol[6:]
     if account_currency == currency_2:
         account_currency_conversion = 1
     else:
         symbol_to_convert = account_currency + currency_2 + other_character
-        symbol_is_real = check_symbol(symbol_to_convert)
-        if symbol_is_real:
-            account_currency_conversion = float(
-                current_price_symbols[symbol_to_convert]["close"]
-            )
+        if symbol_to_convert in current_price_symbols:
+            account_currency_conversion = float(current_price_symbols[symbol_to_convert])
         else:
             symbol_to_convert = currency_2 + account_currency + other_character
-            symbol_is_real = check_symbol(symbol_to_convert)
-            if symbol_is_real:
+            if symbol_to_convert in current_price_symbols:
                 account_currency_conversion = 1 / float(
-                    current_price_symbols[symbol_to_convert]["close"]
+                    current_price_symbols[symbol_to_convert]
                 )
             else:
                 print(
@@ -82,12 +87,13 @@ def calc_position_size_forex(
     account_currency: str,
     risk: float,
     sl: float,
-    current_price_symbols: dict,
+    current_price_symbols: Optional[Dict[str, float]] = None,
 ) -> Optional[float]:
     """
     return lot size for forex
     """
-    account = Mt5.account_info()
+    # the balance is cached until the next fill
+    account = broker_cache.account_info()
     balance = account.balance
     account_currency_conversion = calc_account_currency_conversion(
         account_currency, symbol, current_price_symbols
@@ -178,8 +184,9 @@ def closing_all_pending_order(my_account: Account):
     """
     close all pending order
     """
-    pending_trade_dict = deepcopy(my_account.trade_pending)
-    for ticket_order, trade_pending in pending_trade_dict.items():
+    # one synchronisation for every trade, the trades are removed from the dict while closed
+    my_account.sync_trades()
+    for trade_pending in list(my_account.trade_pending.values()):
         trade_pending.close_position(my_account)
 
 
@@ -187,8 +194,9 @@ def closing_all_on_going_order(my_account: Account):
     """
     close all on going order
     """
-    on_going_trade_dict = deepcopy(my_account.trade_on_going)
-    for ticket_order, trade_on_going in on_going_trade_dict.items():
+    # one synchronisation for every trade, the trades are removed from the dict while closed
+    my_account.sync_trades()
+    for trade_on_going in list(my_account.trade_on_going.values()):
         trade_on_going.close_position(my_account)
 
 
@@ -196,19 +204,23 @@ def check_symbol(pair: str):
     """
     check if the symbol given by the user exist in the broker trading list
     """
-    symbol_info = Mt5.symbol_info(pair)
+    symbol_info = broker_cache.symbol_info(pair)
     if symbol_info is None:
         return False
 
     if not symbol_info.visible:
-        if not Mt5.symbol_select(pair, True):
+        if not broker_cache.symbol_select(pair):
             return False
     return True
 
 
+@lru_cache(maxsize=None)
 def recup_all_symbol_conversion(
     path_symbol_broker: str = "symbol_broker.yaml",
 ) -> Dict[str, List[str]]:
+    """
+    read the symbols of the broker yaml file, only once for the whole process
+    """
     absolute_path_launch = Path.cwd()
     symbol_broker_path = absolute_path_launch / path_symbol_broker
     with open(symbol_broker_path) as symbol_broker_file:
@@ -216,6 +228,83 @@ def recup_all_symbol_conversion(
     return symbol_broker_yaml
 
 
+class QuoteCache:
+    """
+    last price of the symbols used to convert the lot size in the account currency
+    (calcul_for_lot in symbol_broker.yaml), shared by every symbol traded by the bot.
+
+    The prices are asked to mt5 at most once per candle (the first time they are
+    needed during a new minute) or given directly from the ticks with update.
+    mt5_module can be any object with the symbol_info_tick function of MetaTrader5
+    """
+
+    def __init__(
+        self,
+        symbols: Optional[List[str]] = None,
+        name_symbols: str = "calcul_for_lot",
+        mt5_module=None,
+    ):
+        self.symbols = symbols
+        self.name_symbols = name_symbols
+        self.mt5_module = mt5_module
+        self.quotes: Dict[str, float] = {}
+        # symbols already shown in the market watch, mt5 gives no tick for the others
+        self.selected: Set[str] = set()
+        self.unavailable: Set[str] = set()
+        self.last_refresh: Optional[datetime] = None
+        self.lock = Lock()
+
+    @property
+    def mt5(self):
+        # read at each call so that a broker installed after the import is used
+        return self.mt5_module if self.mt5_module is not None else Mt5
+
+    def get_quotes(self, now: Optional[datetime] = None) -> Dict[str, float]:
+        """
+        return the last price of every symbol, refreshed if the candle changed since the last call
+        """
+        if now is None:
+            now = datetime.now()
+        candle_date = now.replace(second=0, microsecond=0)
+        with self.lock:
+            if self.last_refresh is None or candle_date > self.last_refresh:
+                self.refresh()
+                self.last_refresh = candle_date
+            return self.quotes
+
+    def refresh(self):
+        """
+        ask mt5 for the last price of every symbol, the symbols are added to the market
+        watch the first time (check_symbol), the ones unknown by the broker are skipped
+        """
+        if self.symbols is None:
+            self.symbols = recup_all_symbol_conversion()[self.name_symbols]
+        for symbol in self.symbols:
+            if symbol not in self.selected:
+                if not check_symbol(symbol):
+                    if symbol not in self.unavailable:
+                        print(colored(f"{symbol} is not available, no conversion with it", "red"))
+                        self.unavailable.add(symbol)
+                    continue
+                self.selected.add(symbol)
+            tick = self.mt5.symbol_info_tick(symbol)
+            if tick is None:
+                continue
+            # the candles of mt5 are made with the bid price
+            self.quotes[symbol] = float(tick.bid)
+
+    def update(self, symbol: str, price: float):
+        """
+        update the price of a symbol from a tick received elsewhere
+        """
+        with self.lock:
+            self.quotes[symbol] = float(price)
+
+
+# last prices shared by every symbol traded in live
+quote_cache = QuoteCache()
+
+
 def close_one_trade_on_going(trade: pd.Series):
     order_type_close = None
     price_close = None
@@ -247,15 +336,8 @@ def close_one_trade_on_going(trade: pd.Series):
         "type_time": Mt5.ORDER_TIME_GTC,
         "type_filling": Mt5.ORDER_FILLING_IOC,
     }
-    result_close_request = Mt5.order_send(close_request)
-    while result_close_request.comment == "Requote":
-        if order_type_close == Mt5.ORDER_TYPE_BUY:
-            price_close = Mt5.symbol_info_tick(trade["symbol"]).ask
-            close_request["price"] = price_close
-        elif order_type_close == Mt5.ORDER_TYPE_SELL:
-            price_close = Mt5.symbol_info_tick(trade["symbol"]).bid
-            close_request["price"] = price_close
-        result_close_request = Mt5.order_send(close_request)
+    # a requoted deal is sent again with the new price of the market
+    result_close_request = order_sender.send(close_request, retry_comments=("Requote",))
 
     if result_close_request.retcode != Mt5.TRADE_RETCODE_DONE:
         print(result_close_request)